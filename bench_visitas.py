@@ -0,0 +1,196 @@
+# bench_visitas.py
+# Benchmark do registro de visita: caminho ORM (o de antes) x caminho rápido
+# (src/utils/visita_rapida.py: um statement com CTEs no Postgres, sequência de
+# UPSERTs com RETURNING no SQLite). Cada registro inclui o commit, como na rota.
+#
+# Uso:
+#   python3 bench_visitas.py                          # SQLite temporário
+#   python3 bench_visitas.py postgresql://u:s@localhost/fidelidade_teste
+#   python3 bench_visitas.py --n 5000 --clientes 500
+#   python3 bench_visitas.py --conferir               # só confere os agregados dos dois caminhos
+#
+# --conferir registra a mesma sequência de visitas pelos dois caminhos, cada um
+# num grupo de clientes novo, e compara cliente a cliente o que ficou em
+# clientes, pontos, pontos_movimentos e clientes_lojas, e o que cada caminho
+# somou em visitas_diarias. Sai com código 1 se divergirem. O SQL do caminho
+# rápido é escrito à mão e repete as regras de src/utils/agregados.py; rode
+# depois de mexer em qualquer um dos dois.
+#
+# Roda numa app mínima (só as tabelas envolvidas); use um banco de teste.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.models.user import (  # noqa: E402
+    db, Campanha, Cliente, ClienteLoja, LojaEnum, MovimentoPonto, Ponto, Visita, VisitaDiaria,
+)
+from src.routes.visita import _registrar_visita_orm  # noqa: E402
+from src.utils import visita_rapida  # noqa: E402
+
+TABELAS = [Cliente, Visita, VisitaDiaria, ClienteLoja, Ponto, MovimentoPonto, Campanha]
+
+
+def criar_app(url):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def preparar(n_clientes):
+    db.metadata.create_all(db.engine, tables=[m.__table__ for m in TABELAS])
+    base = time.time_ns() % 10**6
+    clientes = [
+        Cliente(cpf=f"8{base:06d}{i:04d}", nome=f"Bench {i}", telefone="11900000000")
+        for i in range(n_clientes)
+    ]
+    db.session.add_all(clientes)
+    db.session.commit()
+    return [c.id for c in clientes]
+
+
+def orm(cliente_id, valor, loja):
+    # o que POST /api/visitas fazia: get do cliente, ORM + flush, UPSERTs, commit
+    if Cliente.query.get(cliente_id) is None:
+        raise RuntimeError("cliente sumiu")
+    _registrar_visita_orm(cliente_id, valor, loja)
+    db.session.commit()
+
+
+def rapido(cliente_id, valor, loja):
+    if visita_rapida.registrar(cliente_id, None, valor, loja) is None:
+        raise RuntimeError("cliente sumiu")
+    db.session.commit()
+
+
+def medir(nome, fn, ids, n, rnd):
+    lojas = list(LojaEnum) + [None]
+    tempos = []
+    for _ in range(n):
+        args = (rnd.choice(ids), round(rnd.uniform(5, 500), 2), rnd.choice(lojas))
+        t0 = time.perf_counter()
+        fn(*args)
+        tempos.append(time.perf_counter() - t0)
+    tempos.sort()
+
+    def pct(p):
+        return tempos[min(len(tempos) - 1, int(p / 100 * len(tempos)))] * 1000
+
+    print(f"{nome:>7}: n={n}  p50={pct(50):.2f}ms  p90={pct(90):.2f}ms  p99={pct(99):.2f}ms  "
+          f"total={sum(tempos):.2f}s")
+    return pct(50), pct(99)
+
+
+def estado(ids):
+    """Agregados e extrato de cada cliente, na ordem de `ids` (sem os ids, para comparar grupos)."""
+    out = []
+    for cid in ids:
+        c = db.session.get(Cliente, cid)
+        visitas = Visita.query.filter_by(cliente_id=cid).all()
+        out.append({
+            "clientes": (c.total_visitas, round(c.valor_total_compras, 2), c.pontos_totais,
+                         c.ultima_visita == max((v.data_visita for v in visitas), default=None)),
+            "pontos": [(p.pontos_acumulados, p.nivel_atual) for p in Ponto.query.filter_by(cliente_id=cid)],
+            "pontos_movimentos": [
+                (m.pontos, m.motivo, m.fator)
+                for m in MovimentoPonto.query.filter_by(cliente_id=cid).order_by(MovimentoPonto.id)
+            ],
+            "clientes_lojas": sorted(
+                (cl.loja, cl.total_visitas, round(cl.valor_total, 2))
+                for cl in ClienteLoja.query.filter_by(cliente_id=cid)
+            ),
+        })
+    return out
+
+
+def diario():
+    return {(d.dia, d.loja): (d.total_visitas, d.valor_total) for d in VisitaDiaria.query.all()}
+
+
+def somado(antes, depois):
+    """O que foi somado em visitas_diarias entre dois retratos, por loja."""
+    out = {}
+    for chave, (n, valor) in depois.items():
+        n0, valor0 = antes.get(chave, (0, 0.0))
+        if n != n0:
+            total = out.setdefault(chave[1], [0, 0.0])
+            total[0] += n - n0
+            total[1] += valor - valor0
+    return {loja: (n, round(valor, 2)) for loja, (n, valor) in out.items()}
+
+
+def conferir(n_clientes, n, rnd):
+    lojas = list(LojaEnum) + [None]
+    sequencia = [(rnd.randrange(n_clientes), round(rnd.uniform(5, 500), 2), rnd.choice(lojas))
+                 for _ in range(n)]
+    grupos, diarios = [], []
+    for fn in (orm, rapido):
+        ids = preparar(n_clientes)
+        cpfs = {c.id: c.cpf for c in Cliente.query.filter(Cliente.id.in_(ids))}
+        db.session.expire_all()
+        antes = diario()
+        for i, (pos, valor, loja) in enumerate(sequencia):
+            if fn is rapido and i % 2:
+                # metade das visitas pelo CPF (o outro statement do caminho rápido)
+                if visita_rapida.registrar(None, cpfs[ids[pos]], valor, loja) is None:
+                    raise RuntimeError("cliente sumiu")
+                db.session.commit()
+            else:
+                fn(ids[pos], valor, loja)
+        db.session.expire_all()
+        grupos.append(estado(ids))
+        diarios.append(somado(antes, diario()))
+
+    erros = []
+    for pos, (a, b) in enumerate(zip(*grupos)):
+        for tabela in a:
+            if a[tabela] != b[tabela]:
+                erros.append(f"cliente #{pos} {tabela}: orm={a[tabela]} rapido={b[tabela]}")
+    if diarios[0] != diarios[1]:
+        erros.append(f"visitas_diarias: orm={diarios[0]} rapido={diarios[1]}")
+    for e in erros[:20]:
+        print("❌", e)
+    if erros:
+        print(f"❌ {len(erros)} divergência(s) entre os caminhos")
+        return 1
+    print(f"✅ {n} visitas em {n_clientes} clientes: agregados iguais nos dois caminhos")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do registro de visita")
+    ap.add_argument("url", nargs="?", help="URL do banco (padrão: SQLite temporário)")
+    ap.add_argument("--n", type=int, default=2000, help="registros por caminho")
+    ap.add_argument("--clientes", type=int, default=200)
+    ap.add_argument("--aquecimento", type=int, default=100)
+    ap.add_argument("--conferir", action="store_true",
+                    help="em vez de medir, confere que os dois caminhos deixam os mesmos agregados")
+    args = ap.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_visitas.db")
+    app = criar_app(url)
+    rnd = random.Random(42)
+    with app.app_context():
+        if args.conferir:
+            db.metadata.create_all(db.engine, tables=[m.__table__ for m in TABELAS])
+            print(f"{url.split('://')[0]} ({db.engine.dialect.name}), conferindo")
+            return conferir(args.clientes, args.n, rnd)
+        ids = preparar(args.clientes)
+        print(f"{url.split('://')[0]} ({db.engine.dialect.name}), {len(ids)} clientes")
+        for fn in (orm, rapido):
+            medir("warmup", fn, ids, args.aquecimento, rnd)
+        antes = medir("orm", orm, ids, args.n, rnd)
+        depois = medir("rapido", rapido, ids, args.n, rnd)
+        print(f"p50 {antes[0] / depois[0]:.2f}x  p99 {antes[1] / depois[1]:.2f}x mais rápido")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
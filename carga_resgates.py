@@ -0,0 +1,176 @@
+# carga_resgates.py
+# Teste de carga da reserva de estoque de brindes (src/utils/estoque.py):
+# várias threads disputam um brinde com estoque limitado via POST /api/resgates
+# (a rota de verdade) e, no fim, confere que
+#   - nenhum resgate passou do estoque (sem venda a mais) e o estoque não ficou negativo;
+#   - estoque restante + resgates pendentes == estoque inicial;
+#   - cancelamentos concorrentes (cada resgate cancelado duas vezes ao mesmo tempo)
+#     devolvem exatamente uma unidade por resgate.
+#
+# Uso:
+#   python3 carga_resgates.py                         # SQLite temporário
+#   python3 carga_resgates.py postgresql://u:s@localhost/fidelidade_teste
+#   python3 carga_resgates.py --threads 32 --tentativas 50 --estoque 200 --slots 8
+#
+# Roda numa app mínima (só o blueprint de resgates e as tabelas envolvidas);
+# use um banco de teste. NÃO use o banco de produção.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func, select
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.models.user import (  # noqa: E402
+    db, Brinde, Campanha, Cliente, EstoqueSlot, NivelEnum, Ponto, Produto, Resgate, StatusResgateEnum,
+)
+from src.routes.resgate import resgate_bp  # noqa: E402
+from src.utils import estoque  # noqa: E402
+
+TABELAS = [Cliente, Ponto, Produto, Campanha, Brinde, EstoqueSlot, Resgate]
+
+
+def criar_app(url):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SECRET_KEY"] = "carga-resgates"  # assinatura dos vouchers
+    if url.startswith("sqlite"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+    db.init_app(app)
+    app.register_blueprint(resgate_bp, url_prefix="/api")
+    return app
+
+
+def preparar(app, n_clientes, qtd, n_slots):
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[m.__table__ for m in TABELAS])
+        base = time.time_ns() % 10**6
+        agora = datetime.utcnow()
+        produto = Produto(sku=f"CARGA-{base}", nome="Brinde de carga")
+        campanha = Campanha(nome="Carga", data_inicio=agora - timedelta(days=1),
+                            data_fim=agora + timedelta(days=1), threshold_visitas=0)
+        db.session.add_all([produto, campanha])
+        db.session.flush()
+        brinde = Brinde(produto_id=produto.id, campanha_id=campanha.id, nivel=NivelEnum.BRONZE,
+                        quantidade_disponivel=qtd)
+        db.session.add(brinde)
+        db.session.flush()
+        if n_slots > 1:
+            estoque.definir(brinde, slots=n_slots)
+        clientes = [
+            Cliente(cpf=f"7{base:06d}{i:04d}", nome=f"Carga {i}", telefone="11900000000")
+            for i in range(n_clientes)
+        ]
+        db.session.add_all(clientes)
+        db.session.flush()
+        db.session.add_all([Ponto(cliente_id=c.id, pontos_acumulados=0, nivel_atual=NivelEnum.BRONZE)
+                            for c in clientes])
+        db.session.commit()
+        return brinde.id, [c.id for c in clientes]
+
+
+def _requisitar(fn, tentativas=20):
+    """Refaz 500 (SQLite: "database is locked" com muitos escritores)."""
+    for tentativa in range(tentativas):
+        r = fn()
+        if r.status_code != 500:
+            return r
+        time.sleep(0.01 * (tentativa + 1))
+    return r
+
+
+def resgatar(app, brinde_id, clientes, contagem, lock):
+    client = app.test_client()
+    for cid in clientes:
+        r = _requisitar(lambda: client.post("/api/resgates", json={"cliente_id": cid, "brinde_id": brinde_id}))
+        chave = "ok" if r.status_code == 201 else ("sem_estoque" if r.status_code == 400 else "erro")
+        with lock:
+            contagem[chave] = contagem.get(chave, 0) + 1
+
+
+def cancelar(app, resgates, contagem, lock):
+    client = app.test_client()
+    for rid in resgates:
+        r = _requisitar(lambda: client.put(f"/api/resgates/{rid}/cancelar"))
+        with lock:
+            contagem[r.status_code] = contagem.get(r.status_code, 0) + 1
+
+
+def rodar(threads):
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - inicio
+
+
+def situacao(app, brinde_id):
+    with app.app_context():
+        total = db.session.get(Brinde, brinde_id).estoque_total
+        minimo = db.session.execute(select(func.min(EstoqueSlot.quantidade))
+                                    .where(EstoqueSlot.brinde_id == brinde_id)).scalar()
+        pendentes = db.session.execute(
+            select(Resgate.id).where(Resgate.brinde_id == brinde_id,
+                                     Resgate.status == StatusResgateEnum.PENDENTE)
+        ).scalars().all()
+        db.session.remove()
+    return total, minimo, pendentes
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga na reserva de estoque de brindes")
+    ap.add_argument("url", nargs="?", help="URL do banco (padrão: SQLite temporário)")
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--tentativas", type=int, default=25, help="resgates por thread (um cliente cada)")
+    ap.add_argument("--estoque", type=int, default=100)
+    ap.add_argument("--slots", type=int, default=1, help="contadores do estoque (1 = linha única)")
+    args = ap.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "carga_resgates.db")
+    app = criar_app(url)
+    n = args.threads * args.tentativas
+    brinde_id, clientes = preparar(app, n, args.estoque, args.slots)
+
+    contagem, lock = {}, threading.Lock()
+    dur = rodar([
+        threading.Thread(target=resgatar, args=(app, brinde_id, clientes[i::args.threads], contagem, lock))
+        for i in range(args.threads)
+    ])
+    total, minimo, pendentes = situacao(app, brinde_id)
+    print(f"{url.split('://')[0]} slots={args.slots}: {n} tentativas em {dur:.2f}s ({n / dur:.0f}/s) -> "
+          f"{contagem.get('ok', 0)} resgates, {contagem.get('sem_estoque', 0)} sem estoque, "
+          f"{contagem.get('erro', 0)} erros")
+    ok = (
+        contagem.get("ok", 0) == len(pendentes) == min(n, args.estoque) - contagem.get("erro", 0)
+        and total == args.estoque - len(pendentes)
+        and total >= 0 and (minimo is None or minimo >= 0)
+    )
+    print(f"  estoque restante={total} pendentes={len(pendentes)} menor slot={minimo} "
+          f"{'OK' if ok else 'DIVERGENTE'}")
+
+    # cada resgate cancelado por duas threads ao mesmo tempo: só uma devolve o estoque
+    metade = pendentes[: len(pendentes) // 2]
+    respostas = {}
+    dur = rodar([
+        threading.Thread(target=cancelar, args=(app, metade[i::args.threads // 2 or 1], respostas, lock))
+        for _ in range(2) for i in range(args.threads // 2 or 1)
+    ])
+    total_depois, minimo, restantes = situacao(app, brinde_id)
+    certo = total_depois == total + len(metade) and len(restantes) == len(pendentes) - len(metade)
+    ok &= certo
+    print(f"  {2 * len(metade)} cancelamentos em {dur:.2f}s {respostas}: estoque {total} -> {total_depois} "
+          f"(esperado {total + len(metade)}) {'OK' if certo else 'DIVERGENTE'}")
+    print("✅ sem venda a mais" if ok else "❌ estoque divergente")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# deduplicar_pontos.py
+# Junta linhas duplicadas de `pontos` do mesmo cliente (somando os saldos) e cria
+# o índice único em pontos(cliente_id) usado pelo UPSERT do saldo (CONCURRENTLY no
+# Postgres). A migração 0001 faz o mesmo; o script serve para rodar antes do
+# deploy ou conferir.
+from src.main import app, db
+from src.migrations import criar_indice
+from src.utils.pontos import conferir_unicidade, deduplicar_saldos
+
+if __name__ == "__main__":
+    with app.app_context():
+        removidas = deduplicar_saldos()
+        existia = conferir_unicidade(db.engine)
+        if not existia:
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                criar_indice(conn, "uq_pontos_cliente_id", "pontos", "cliente_id", unico=True)
+        print(f"✅ pontos: {removidas} linhas duplicadas removidas"
+              + ("; índice único já existia." if existia else "; índice único criado."))
@@ -0,0 +1,34 @@
+# migrate.py
+# Migrações de schema (src/migrations/). Aplique após cada deploy:
+#   python3 migrate.py status            # lista as migrações e quais já rodaram
+#   python3 migrate.py upgrade           # aplica as pendentes
+#   python3 migrate.py upgrade --ate 0001
+import argparse
+import sys
+
+from src.main import app, db
+from src import migrations
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migrações de schema")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    sub.add_parser("status", help="lista as migrações e o estado de cada uma")
+    up = sub.add_parser("upgrade", help="aplica as migrações pendentes")
+    up.add_argument("--ate", help="versão final (ex.: 0001)")
+    args = ap.parse_args()
+
+    with app.app_context():
+        if args.comando == "status":
+            for m in migrations.status(db.engine):
+                estado = m["aplicada_em"] or "pendente"
+                print(f"{m['versao']}  {estado!s:<28} {m['descricao']}")
+            return 0
+
+        novas = migrations.upgrade(db.engine, ate=args.ate)
+        print(f"✅ {len(novas)} migração(ões) aplicada(s)." if novas else "✅ Nada pendente.")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
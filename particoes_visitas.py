@@ -0,0 +1,60 @@
+# particoes_visitas.py
+# Particionamento mensal de visitas por data_visita (somente Postgres).
+#   python3 particoes_visitas.py converter          # tabela comum -> particionada (janela de manutenção)
+#   python3 particoes_visitas.py criar [--meses 3]  # cria o mês corrente + os próximos (rode mensalmente)
+#   python3 particoes_visitas.py listar
+#   python3 particoes_visitas.py arquivar --antes 2024-01 --dir arquivo/visitas
+import argparse
+import sys
+from datetime import date
+
+from src.main import app
+from src.models.user import db
+from src.utils import particoes
+
+
+def _mes(valor: str) -> date:
+    ano, mes = valor.split("-")
+    return date(int(ano), int(mes), 1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Partições mensais de visitas")
+    sub = ap.add_subparsers(dest="comando", required=True)
+    conv = sub.add_parser("converter", help="converte visitas em tabela particionada por mês")
+    conv.add_argument("--meses", type=int, default=particoes.MESES_FUTUROS, help="meses futuros a criar")
+    criar = sub.add_parser("criar", help="cria as partições do mês corrente e dos próximos")
+    criar.add_argument("--meses", type=int, default=particoes.MESES_FUTUROS, help="meses futuros a criar")
+    sub.add_parser("listar", help="lista as partições anexadas")
+    arq = sub.add_parser("arquivar", help="exporta para CSV gzip e remove os meses anteriores a --antes")
+    arq.add_argument("--antes", type=_mes, required=True, help="primeiro mês mantido (AAAA-MM)")
+    arq.add_argument("--dir", required=True, help="diretório dos arquivos .csv.gz")
+    args = ap.parse_args()
+
+    with app.app_context():
+        engine = db.engine
+        try:
+            if args.comando == "converter":
+                r = particoes.converter(engine, meses_futuros=args.meses)
+                print(f"✅ visitas particionada: {r['particoes']} partições, {r['visitas']} visitas.")
+            elif args.comando == "criar":
+                criadas = particoes.garantir_particoes(engine, meses_futuros=args.meses)
+                print(f"✅ Criadas: {', '.join(criadas)}" if criadas else "✅ Nada a criar.")
+            elif args.comando == "listar":
+                with engine.connect() as conn:
+                    if not particoes.particionada(conn):
+                        print("visitas não é particionada.")
+                        return 1
+                    for mes in particoes.particoes(conn):
+                        print(particoes.nome_particao(mes))
+            else:
+                feitos = particoes.arquivar(engine, args.antes, args.dir)
+                print(f"✅ {len(feitos)} partição(ões) arquivada(s)." if feitos else "✅ Nada a arquivar.")
+        except particoes.ParticionamentoIndisponivel as e:
+            print(f"❌ {e}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
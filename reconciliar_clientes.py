@@ -0,0 +1,14 @@
+# reconciliar_clientes.py
+# Recalcula os agregados desnormalizados de `clientes` (total de visitas,
+# valor total, última visita e saldo de pontos) e de `clientes_lojas`
+# (visitas e valor por loja) a partir de visitas/pontos.
+# Use após o deploy da feature (backfill) ou para corrigir divergências.
+from src.main import app
+from src.utils.agregados import reconciliar_clientes, reconstruir_clientes_lojas
+
+if __name__ == "__main__":
+    with app.app_context():
+        total = reconciliar_clientes()
+        print(f"✅ Agregados recalculados para {total} clientes.")
+        linhas = reconstruir_clientes_lojas()
+        print(f"✅ clientes_lojas reconstruída: {linhas} linhas (cliente x loja).")
@@ -0,0 +1,10 @@
+# reconstruir_visitas_diarias.py
+# Recalcula o rollup `visitas_diarias` (visitas e valor por dia/loja) a partir
+# de `visitas`. Rode após o deploy da feature ou se o rollup divergir.
+from src.main import app
+from src.utils.agregados import reconstruir_visitas_diarias
+
+if __name__ == "__main__":
+    with app.app_context():
+        linhas = reconstruir_visitas_diarias()
+        print(f"✅ visitas_diarias reconstruída: {linhas} linhas (dia x loja).")
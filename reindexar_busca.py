@@ -0,0 +1,19 @@
+# reindexar_busca.py
+# Preenche clientes.busca (texto normalizado) e, no Postgres, instala pg_trgm
+# e cria os índices de busca com CREATE INDEX CONCURRENTLY.
+# Uso: python3 reindexar_busca.py [--todos]
+import sys
+
+from src.main import app
+from src.models.user import db
+from src.utils.busca import criar_indices_postgres, preencher_coluna_busca, preparar_busca
+
+if __name__ == "__main__":
+    todos = "--todos" in sys.argv
+    with app.app_context():
+        total = preencher_coluna_busca(todos=todos)
+        print(f"✅ Coluna busca preenchida para {total} clientes.")
+        if db.engine.dialect.name == "postgresql":
+            criar_indices_postgres(db.engine)
+            print("✅ pg_trgm e índices de busca criados.")
+        print("Estratégia de busca:", preparar_busca(db.engine))
@@ -0,0 +1,150 @@
+# src/migrations/__init__.py
+"""
+Migrações versionadas do schema.
+
+`db.create_all()` cria tabelas novas mas não altera as existentes (o banco do
+RDS já existe); as mudanças de schema de tabelas existentes entram aqui, em
+módulos `vNNNN_descricao.py` aplicados em ordem e registrados na tabela
+`schema_migrations`. Cada módulo define:
+
+    DESCRICAO = "..."
+    TRANSACAO = True          # False: roda em AUTOCOMMIT (CREATE INDEX CONCURRENTLY)
+    def upgrade(conn): ...    # conn: Connection do SQLAlchemy
+
+As migrações devem ser idempotentes (IF NOT EXISTS etc.): as que rodam fora de
+transação podem ser interrompidas no meio e são repetidas por inteiro.
+
+Uso: `python3 migrate.py status` / `python3 migrate.py upgrade`.
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+TABELA = "schema_migrations"
+
+# pg_advisory_lock: dois `migrate.py upgrade` simultâneos não se atropelam
+_LOCK_ID = 7_340_218
+
+_NOME_MODULO = re.compile(r"^v(\d{4})_\w+$")
+
+
+class Migracao:
+    __slots__ = ("versao", "nome", "descricao", "transacao", "upgrade")
+
+    def __init__(self, modulo, versao: str, nome: str):
+        self.versao = versao
+        self.nome = nome
+        self.descricao = getattr(modulo, "DESCRICAO", nome)
+        self.transacao = getattr(modulo, "TRANSACAO", True)
+        self.upgrade = modulo.upgrade
+
+
+def disponiveis() -> list[Migracao]:
+    out = []
+    for info in pkgutil.iter_modules(__path__):
+        m = _NOME_MODULO.match(info.name)
+        if not m:
+            continue
+        modulo = importlib.import_module(f"{__name__}.{info.name}")
+        out.append(Migracao(modulo, m.group(1), info.name))
+    out.sort(key=lambda m: m.versao)
+    versoes = [m.versao for m in out]
+    if len(set(versoes)) != len(versoes):
+        raise RuntimeError(f"Versões de migração repetidas: {versoes}")
+    return out
+
+
+def _garantir_tabela(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {TABELA} ("
+            "versao VARCHAR(4) PRIMARY KEY, "
+            "nome VARCHAR(120) NOT NULL, "
+            "aplicada_em TIMESTAMP NOT NULL)"
+        ))
+
+
+def aplicadas(engine) -> dict:
+    """{versao: aplicada_em} das migrações já registradas."""
+    _garantir_tabela(engine)
+    with engine.connect() as conn:
+        return dict(conn.execute(text(f"SELECT versao, aplicada_em FROM {TABELA}")).all())
+
+
+def status(engine) -> list[dict]:
+    feitas = aplicadas(engine)
+    return [
+        {"versao": m.versao, "nome": m.nome, "descricao": m.descricao,
+         "aplicada_em": feitas.get(m.versao)}
+        for m in disponiveis()
+    ]
+
+
+def _registrar(conn, m: Migracao) -> None:
+    conn.execute(
+        text(f"INSERT INTO {TABELA} (versao, nome, aplicada_em) VALUES (:v, :n, :t)"),
+        {"v": m.versao, "n": m.nome, "t": datetime.utcnow()},
+    )
+
+
+def _aplicar(engine, m: Migracao) -> None:
+    if m.transacao:
+        # DDL + registro na mesma transação (Postgres e SQLite têm DDL transacional)
+        with engine.begin() as conn:
+            m.upgrade(conn)
+            _registrar(conn, m)
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        m.upgrade(conn)
+    with engine.begin() as conn:
+        _registrar(conn, m)
+
+
+def upgrade(engine, ate: str | None = None, saida=print) -> list[str]:
+    """Aplica as migrações pendentes (até a versão `ate`, inclusive). Devolve as aplicadas."""
+    _garantir_tabela(engine)
+    pg = engine.dialect.name == "postgresql"
+    # em AUTOCOMMIT: uma transação aberta aqui faria o CREATE INDEX CONCURRENTLY esperar por ela
+    trava = engine.connect().execution_options(isolation_level="AUTOCOMMIT") if pg else None
+    try:
+        if trava is not None:
+            trava.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _LOCK_ID})
+        feitas = aplicadas(engine)
+        novas = []
+        for m in disponiveis():
+            if ate is not None and m.versao > ate:
+                break
+            if m.versao in feitas:
+                continue
+            saida(f"-> {m.versao} {m.descricao}")
+            _aplicar(engine, m)
+            novas.append(m.versao)
+        return novas
+    finally:
+        if trava is not None:
+            trava.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+            trava.close()
+
+
+# ------------------------- helpers p/ as migrações -------------------------
+
+def criar_indice(conn, nome: str, tabela: str, colunas: str, unico: bool = False) -> None:
+    """
+    CREATE INDEX IF NOT EXISTS; no Postgres, CONCURRENTLY (não trava escritas;
+    exige TRANSACAO = False na migração). Um índice INVALID deixado por uma
+    tentativa interrompida é removido e recriado.
+    """
+    tipo = "UNIQUE INDEX" if unico else "INDEX"
+    if conn.dialect.name == "postgresql":
+        invalido = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :nome AND NOT i.indisvalid"
+        ), {"nome": nome}).first()
+        if invalido:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
+        conn.execute(text(f"CREATE {tipo} CONCURRENTLY IF NOT EXISTS {nome} ON {tabela} ({colunas})"))
+    else:
+        conn.execute(text(f"CREATE {tipo} IF NOT EXISTS {nome} ON {tabela} ({colunas})"))
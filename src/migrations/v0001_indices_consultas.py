@@ -0,0 +1,44 @@
+# src/migrations/v0001_indices_consultas.py
+"""
+Índices das consultas quentes. Até aqui o banco só tinha as PKs/uniques do
+create_all: listar visitas de um cliente, relatórios por período, o dashboard
+e o login faziam seq scan.
+"""
+from src.migrations import criar_indice
+from src.utils.pontos import deduplicar_saldos
+
+DESCRICAO = "Índices de visitas, resgates, brindes, clientes e login"
+TRANSACAO = False  # CREATE INDEX CONCURRENTLY
+
+# (nome, tabela, colunas) — mesmos nomes declarados nos modelos
+INDICES = [
+    # /visitas/cliente/<id>: WHERE cliente_id ORDER BY data_visita DESC, id DESC;
+    # max(data_visita) do cliente ao excluir visita
+    ("ix_visitas_cliente_data", "visitas", "cliente_id, data_visita, id"),
+    # /relatorio/visitas, /dashboard/resumo, analytics: faixa de data_visita (+ id no cursor)
+    ("ix_visitas_data", "visitas", "data_visita, id"),
+    # mesmos relatórios filtrados por loja (usuários restritos a lojas)
+    ("ix_visitas_loja_data", "visitas", "loja, data_visita, id"),
+    # /resgates/cliente/<id>: WHERE cliente_id [AND status] ORDER BY data_resgate DESC
+    ("ix_resgates_cliente_data", "resgates", "cliente_id, data_resgate, id"),
+    # /resgates?status=: WHERE status ORDER BY data_resgate DESC; contagem por status
+    ("ix_resgates_status_data", "resgates", "status, data_resgate, id"),
+    # /resgates sem filtro e resgates do mês no dashboard
+    ("ix_resgates_data", "resgates", "data_resgate, id"),
+    # brindes da campanha (join campanhas -> brindes)
+    ("ix_brindes_campanha", "brindes", "campanha_id"),
+    # /clientes: ORDER BY nome, id (paginação por cursor)
+    ("ix_clientes_nome", "clientes", "nome, id"),
+    # login: WHERE lower(username) = lower(:u)
+    ("ix_usuarios_username_lower", "usuarios", "lower(username)"),
+]
+
+
+def upgrade(conn):
+    for nome, tabela, colunas in INDICES:
+        criar_indice(conn, nome, tabela, colunas)
+    # saldo de pontos: uma linha por cliente. Bancos de antes da constraint podem ter
+    # duplicatas, juntadas antes (numa transação própria; `conn` está em AUTOCOMMIT)
+    with conn.engine.begin() as tx:
+        deduplicar_saldos(tx)
+    criar_indice(conn, "uq_pontos_cliente_id", "pontos", "cliente_id", unico=True)
@@ -0,0 +1,33 @@
+# src/migrations/v0002_permissoes_mascara.py
+"""
+Permissões por loja em formato único + máscara de bits.
+
+Havia usuários gravados em dois formatos de `permissoes`: o da tela de admin
+({"lojas": {LOJA: {view, create, edit}}}) e o antigo por ação
+({"lojas": {"view": [LOJA, ...]}}), que era o único lido nas checagens.
+Esta migração reescreve todos no formato da tela de admin e preenche
+`usuarios.permissoes_mascara` (a coluna é criada na subida do app, que o
+migrate.py executa antes).
+"""
+import json
+
+from sqlalchemy import text
+
+from src.utils.permissions import mascara_permissoes, normalizar_permissoes
+
+DESCRICAO = "Permissões de usuários no formato único e permissoes_mascara preenchida"
+TRANSACAO = True
+
+
+def upgrade(conn):
+    if conn.dialect.name == "postgresql":
+        gravar = text("UPDATE usuarios SET permissoes = CAST(:p AS jsonb), permissoes_mascara = :m WHERE id = :id")
+    else:
+        gravar = text("UPDATE usuarios SET permissoes = :p, permissoes_mascara = :m WHERE id = :id")
+    for uid, perms, atual in conn.execute(text("SELECT id, permissoes, permissoes_mascara FROM usuarios")).all():
+        if isinstance(perms, str):
+            perms = json.loads(perms or "{}")
+        novo = normalizar_permissoes(perms)
+        mascara = mascara_permissoes(novo)
+        if novo != perms or mascara != atual:
+            conn.execute(gravar, {"id": uid, "p": json.dumps(novo), "m": mascara})
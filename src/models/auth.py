@@ -4,7 +4,7 @@ import enum
 
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Index, text
+from sqlalchemy import Index, func, text
 
 from src.models.user import db  # reaproveita a instância do SQLAlchemy
 
@@ -29,6 +29,8 @@ class Usuario(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.Enum(RoleEnum, name="roleenum"), nullable=False, default=RoleEnum.ATENDENTE)
     permissoes = db.Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    # bits loja x ação de `permissoes` (src/utils/permissions.py), gravados junto com o JSON
+    permissoes_mascara = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     # Status e auditoria
     ativo = db.Column(db.Boolean, nullable=False, default=True)
@@ -41,6 +43,8 @@ class Usuario(db.Model):
     __table_args__ = (
         # Índice para aceleração da busca por token de redefinição
         Index("ix_usuarios_reset_token", "reset_token", unique=True),
+        # login compara lower(username)
+        Index("ix_usuarios_username_lower", func.lower(username)),
     )
 
     # -----------------------
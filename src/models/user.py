@@ -24,6 +24,7 @@ class StatusResgateEnum(Enum):
 
 class Cliente(db.Model):
     __tablename__ = 'clientes'
+    __table_args__ = (db.Index('ix_clientes_nome', 'nome', 'id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     cpf = db.Column(db.String(11), unique=True, nullable=False)
@@ -32,6 +33,15 @@ class Cliente(db.Model):
     email = db.Column(db.String(120), nullable=True)
     sem_email = db.Column(db.Boolean, default=False)
     data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Agregados desnormalizados (mantidos por src/utils/agregados.py)
+    total_visitas = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    valor_total_compras = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    ultima_visita = db.Column(db.DateTime, nullable=True)
+    pontos_totais = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Texto normalizado para busca (mantido por src/utils/busca.py)
+    busca = db.Column(db.String(300), nullable=True)
     
     # Relacionamentos
     visitas = db.relationship('Visita', backref='cliente', lazy=True)
@@ -50,12 +60,20 @@ class Cliente(db.Model):
             'email': self.email,
             'sem_email': self.sem_email,
             'data_cadastro': self.data_cadastro.isoformat() if self.data_cadastro else None,
-            'total_visitas': len(self.visitas),
-            'pontos_totais': sum([p.pontos_acumulados for p in self.pontos])
+            'total_visitas': self.total_visitas or 0,
+            'valor_total_compras': self.valor_total_compras or 0.0,
+            'ultima_visita': self.ultima_visita.isoformat() if self.ultima_visita else None,
+            'pontos_totais': self.pontos_totais or 0
         }
 
 class Visita(db.Model):
     __tablename__ = 'visitas'
+    # índices das consultas quentes (bancos existentes: src/migrations/v0001_indices_consultas.py)
+    __table_args__ = (
+        db.Index('ix_visitas_cliente_data', 'cliente_id', 'data_visita', 'id'),
+        db.Index('ix_visitas_data', 'data_visita', 'id'),
+        db.Index('ix_visitas_loja_data', 'loja', 'data_visita', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
@@ -75,8 +93,34 @@ class Visita(db.Model):
             'loja': self.loja.value if self.loja else None
         }
 
+class VisitaDiaria(db.Model):
+    """Rollup diário de visitas por loja (mantido por src/utils/agregados.py)."""
+    __tablename__ = 'visitas_diarias'
+
+    dia = db.Column(db.Date, primary_key=True)
+    loja = db.Column(db.String(20), primary_key=True, default='')  # nome do LojaEnum; '' = sem loja
+    total_visitas = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<VisitaDiaria {self.dia} {self.loja} - {self.total_visitas}>'
+
+class ClienteLoja(db.Model):
+    """Agregados de cada cliente por loja (mantidos por src/utils/agregados.py)."""
+    __tablename__ = 'clientes_lojas'
+
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id', ondelete='CASCADE'), primary_key=True)
+    loja = db.Column(db.String(20), primary_key=True, default='')  # nome do LojaEnum; '' = sem loja
+    total_visitas = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<ClienteLoja {self.cliente_id} {self.loja} - {self.total_visitas}>'
+
 class Ponto(db.Model):
+    """Saldo de pontos do cliente (uma linha por cliente; movimentos em `pontos_movimentos`)."""
     __tablename__ = 'pontos'
+    __table_args__ = (db.UniqueConstraint('cliente_id', name='uq_pontos_cliente_id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
@@ -96,6 +140,33 @@ class Ponto(db.Model):
             'data_atualizacao': self.data_atualizacao.isoformat() if self.data_atualizacao else None
         }
 
+class MovimentoPonto(db.Model):
+    """Extrato de pontos (somente inserção): cada crédito/débito aplicado ao saldo em `pontos`."""
+    __tablename__ = 'pontos_movimentos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id', ondelete='CASCADE'), nullable=False, index=True)
+    # sem FK de propósito: visitas pode ser particionada / arquivada
+    visita_id = db.Column(db.Integer, nullable=True, index=True)
+    pontos = db.Column(db.Integer, nullable=False)
+    motivo = db.Column(db.String(30), nullable=False)
+    fator = db.Column(db.Float, nullable=True)
+    data = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<MovimentoPonto {self.cliente_id} {self.pontos:+d}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'cliente_id': self.cliente_id,
+            'visita_id': self.visita_id,
+            'pontos': self.pontos,
+            'motivo': self.motivo,
+            'fator': self.fator,
+            'data': self.data.isoformat() if self.data else None
+        }
+
 class Produto(db.Model):
     __tablename__ = 'produtos'
     
@@ -149,6 +220,7 @@ class Campanha(db.Model):
 
 class Brinde(db.Model):
     __tablename__ = 'brindes'
+    __table_args__ = (db.Index('ix_brindes_campanha', 'campanha_id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False)
@@ -158,6 +230,8 @@ class Brinde(db.Model):
     
     # Relacionamentos
     produto = db.relationship('Produto', backref='brindes')
+    # contadores fragmentados do estoque (brindes muito disputados; ver src/utils/estoque.py)
+    slots_estoque = db.relationship('EstoqueSlot', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Brinde {self.nivel.value}>'
@@ -168,12 +242,39 @@ class Brinde(db.Model):
             'produto_id': self.produto_id,
             'campanha_id': self.campanha_id,
             'nivel': self.nivel.value,
-            'quantidade_disponivel': self.quantidade_disponivel,
+            'quantidade_disponivel': self.estoque_total,
             'produto': self.produto.to_dict() if self.produto else None
         }
 
+class EstoqueSlot(db.Model):
+    """Fatia do estoque de um brinde: as reservas se espalham entre os slots em vez de disputar uma linha."""
+    __tablename__ = 'brindes_estoque_slots'
+
+    brinde_id = db.Column(db.Integer, db.ForeignKey('brindes.id', ondelete='CASCADE'), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<EstoqueSlot {self.brinde_id}/{self.slot} - {self.quantidade}>'
+
+# estoque total = contador do brinde + soma dos slots (sem slots, só o contador)
+Brinde.estoque_total = db.column_property(
+    db.func.coalesce(Brinde.quantidade_disponivel, 0) + db.func.coalesce(
+        db.select(db.func.sum(EstoqueSlot.quantidade))
+        .where(EstoqueSlot.brinde_id == Brinde.id)
+        .correlate_except(EstoqueSlot)
+        .scalar_subquery(),
+        0,
+    )
+)
+
 class Resgate(db.Model):
     __tablename__ = 'resgates'
+    __table_args__ = (
+        db.Index('ix_resgates_cliente_data', 'cliente_id', 'data_resgate', 'id'),
+        db.Index('ix_resgates_status_data', 'status', 'data_resgate', 'id'),
+        db.Index('ix_resgates_data', 'data_resgate', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
@@ -6,6 +6,8 @@ from unicodedata import normalize as ucnorm
 from src.routes.auth import login_required, roles_required
 from src.models.user import db
 from src.models.auth import Usuario, RoleEnum
+from src.utils.paginacao import CursorInvalido, modo_cursor, pagina_por_cursor
+from src.utils.permissions import mascara_permissoes
 
 admin_bp = Blueprint("admin", __name__)
 
@@ -108,6 +110,13 @@ def list_users():
         qry = qry.filter(or_(Usuario.nome.ilike(like),
                              Usuario.username.ilike(like),
                              Usuario.email.ilike(like)))
+    if modo_cursor():
+        try:
+            return jsonify(pagina_por_cursor(
+                qry, [(Usuario.id, True)], "users", lambda u: u.to_dict(), per_page
+            ))
+        except CursorInvalido as e:
+            return jsonify({"error": str(e)}), 400
     pg = qry.order_by(Usuario.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
     return jsonify({
         "users": [u.to_dict() for u in pg.items],
@@ -225,5 +234,7 @@ def set_user_permissions(uid):
     data = request.get_json(silent=True) or {}
     new_perms = _sanitize_permissoes(data)
     u.permissoes = new_perms
+    # compilada aqui, uma vez: as checagens por request só testam bits
+    u.permissoes_mascara = mascara_permissoes(new_perms)
     db.session.commit()
     return jsonify(u.to_dict())
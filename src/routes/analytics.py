@@ -0,0 +1,90 @@
+# src/routes/analytics.py
+from flask import Blueprint, request, jsonify, session
+from datetime import datetime
+
+from src.routes.visita import _normalize_loja_for_enum
+from src.utils import analytics
+from src.utils.permissions import lojas_restriction
+
+analytics_bp = Blueprint('analytics', __name__)
+
+
+def _loja_e_restricao():
+    """(loja pedida ou None, restrição de 'view'); levanta ValueError p/ loja inválida/sem acesso."""
+    lojas = lojas_restriction("view")
+    loja = None
+    if request.args.get('loja'):
+        loja = _normalize_loja_for_enum(request.args['loja'])
+        if not loja:
+            raise ValueError('Loja inválida')
+        if lojas is not None and loja not in lojas:
+            raise PermissionError('Sem permissão para esta loja')
+    return loja, lojas
+
+
+@analytics_bp.route('/analytics/rfm', methods=['GET'])
+def rfm():
+    """
+    Segmentação RFM (recência, frequência, valor) dos clientes.
+    ?loja=           considera só as visitas da loja
+    ?segmento=&page=&per_page=   lista os clientes de um segmento
+    """
+    try:
+        try:
+            loja, lojas = _loja_e_restricao()
+        except PermissionError as e:
+            return jsonify({'error': str(e)}), 403
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        res = analytics.rfm(loja, lojas)
+        out = {
+            'loja': loja,
+            'referencia': datetime.utcfromtimestamp(res['referencia']).isoformat(),
+            'total_clientes': int(res['ids'].size),
+            'total_visitas': res['total_visitas'],
+            'limites': res.get('limites'),
+            'segmentos': analytics.resumo_segmentos(res),
+        }
+
+        segmento = request.args.get('segmento')
+        if segmento:
+            page = max(request.args.get('page', 1, type=int), 1)
+            per_page = max(1, min(request.args.get('per_page', 50, type=int), 500))
+            try:
+                out['membros'] = analytics.membros_segmento(res, segmento, page, per_page)
+            except ValueError as e:
+                return jsonify({'error': str(e), 'segmentos': list(analytics.SEGMENTOS)}), 400
+
+        return jsonify(out)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@analytics_bp.route('/analytics/coortes', methods=['GET'])
+def coortes():
+    """
+    Retenção por coorte de cadastro (mês): fração dos clientes de cada coorte
+    que voltou a visitar k meses depois.
+    ?por_loja=1     coortes separadas pela loja da primeira visita
+    ?meses=12       só as N coortes mais recentes
+    ?recalcular=1   (ADMIN) refaz o artefato do zero
+    """
+    try:
+        lojas = lojas_restriction("view")
+        # sem visão de todas as lojas: só as linhas das lojas permitidas
+        por_loja = request.args.get('por_loja', '').lower() in ('1', 'true') or lojas is not None
+        meses = request.args.get('meses', type=int)
+        recalcular = (request.args.get('recalcular', '').lower() in ('1', 'true')
+                      and session.get('role') == 'ADMIN')
+
+        art = analytics.coortes(recalcular=recalcular)
+        return jsonify({
+            'mes_aberto': analytics.rotulo_mes(art['mes_aberto']) if art['mes_aberto'] >= 0 else None,
+            'por_loja': por_loja,
+            'coortes': analytics.matriz_coortes(art, por_loja, lojas, meses),
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -2,6 +2,7 @@
 from flask import Blueprint, request, jsonify, session
 from functools import wraps
 from datetime import datetime, timedelta
+from sqlalchemy import func
 import secrets
 
 from src.models.user import db
@@ -43,7 +44,7 @@ def login():
     if not username or not password:
         return jsonify({"error": "Informe usuário e senha"}), 400
 
-    u = Usuario.query.filter(Usuario.username.ilike(username)).first()
+    u = Usuario.query.filter(func.lower(Usuario.username) == username.lower()).first()
     if not u or not u.check_password(password) or not u.ativo:
         return jsonify({"error": "Credenciais inválidas"}), 401
 
@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, Campanha, Brinde, Produto, LojaEnum, NivelEnum
+from src.utils import estoque
+from src.utils.cache import marcar
+from src.utils.paginacao import CursorInvalido, modo_cursor, pagina_por_cursor
 from datetime import datetime
 
 campanha_bp = Blueprint('campanha', __name__)
@@ -26,6 +29,12 @@ def listar_campanhas():
             except ValueError:
                 return jsonify({'error': 'Loja inválida'}), 400
         
+        if modo_cursor():
+            return jsonify(pagina_por_cursor(
+                query, [(Campanha.data_inicio, True), (Campanha.id, True)],
+                'campanhas', lambda c: c.to_dict(), per_page
+            ))
+        
         campanhas = query.order_by(Campanha.data_inicio.desc())\
                          .paginate(page=page, per_page=per_page, error_out=False)
         
@@ -36,6 +45,8 @@ def listar_campanhas():
             'current_page': page
         })
         
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -77,6 +88,7 @@ def criar_campanha():
         )
         
         db.session.add(campanha)
+        marcar('campanhas')
         db.session.commit()
         
         return jsonify(campanha.to_dict()), 201
@@ -137,6 +149,7 @@ def atualizar_campanha(campanha_id):
         if 'fator_pontuacao' in data:
             campanha.fator_pontuacao = data['fator_pontuacao']
         
+        marcar('campanhas')
         db.session.commit()
         return jsonify(campanha.to_dict())
         
@@ -161,6 +174,7 @@ def excluir_campanha(campanha_id):
             return jsonify({'error': 'Não é possível excluir campanha com resgates vinculados'}), 400
         
         db.session.delete(campanha)
+        marcar('campanhas')
         db.session.commit()
         
         return jsonify({'message': 'Campanha excluída com sucesso'})
@@ -183,6 +197,12 @@ def listar_produtos():
         if nome_filter:
             query = query.filter(Produto.nome.ilike(f'%{nome_filter}%'))
         
+        if modo_cursor():
+            return jsonify(pagina_por_cursor(
+                query, [(Produto.nome, False), (Produto.id, False)],
+                'produtos', lambda p: p.to_dict(), per_page
+            ))
+        
         produtos = query.order_by(Produto.nome)\
                        .paginate(page=page, per_page=per_page, error_out=False)
         
@@ -193,6 +213,8 @@ def listar_produtos():
             'current_page': page
         })
         
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -291,6 +313,16 @@ def criar_brinde():
         )
         
         db.session.add(brinde)
+        
+        # estoque fragmentado em N contadores (brindes muito disputados)
+        if data.get('slots_estoque'):
+            db.session.flush()
+            try:
+                estoque.definir(brinde, slots=int(data['slots_estoque']))
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 400
+        
         db.session.commit()
         
         return jsonify(brinde.to_dict()), 201
@@ -306,8 +338,16 @@ def atualizar_brinde(brinde_id):
         brinde = Brinde.query.get_or_404(brinde_id)
         data = request.get_json()
         
-        if 'quantidade_disponivel' in data:
-            brinde.quantidade_disponivel = data['quantidade_disponivel']
+        if 'quantidade_disponivel' in data or 'slots_estoque' in data:
+            try:
+                estoque.definir(
+                    brinde,
+                    quantidade=data.get('quantidade_disponivel'),
+                    slots=int(data['slots_estoque']) if data.get('slots_estoque') is not None else None,
+                )
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 400
         
         if 'nivel' in data:
             try:
@@ -1,5 +1,10 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, Cliente, Visita, Ponto, NivelEnum
+from src.utils import ranking
+from src.utils.busca import buscar_clientes
+from src.utils.cache import marcar
+from src.utils.paginacao import CursorInvalido, modo_cursor, pagina_por_cursor
+from src.utils.pontos import nivel_por_pontos
 from datetime import datetime
 import re
 
@@ -12,12 +17,7 @@ def validar_cpf(cpf):
 
 def calcular_nivel_por_pontos(pontos):
     """Calcula o nível baseado na pontuação"""
-    if pontos >= 1000:
-        return NivelEnum.OURO
-    elif pontos >= 500:
-        return NivelEnum.PRATA
-    else:
-        return NivelEnum.BRONZE
+    return nivel_por_pontos(pontos)
 
 def cpf_mask(cpf: str) -> str:
     """Formata CPF como 000.000.000-00 (se tiver 11 dígitos)"""
@@ -28,33 +28,17 @@ def cpf_mask(cpf: str) -> str:
 @cliente_bp.route('/clientes/search', methods=['GET'])
 def search_clientes():
     """
-    Busca clientes por nome (ILIKE) ou por dígitos do CPF (parcial).
+    Busca clientes por nome (sem acento) ou por dígitos do CPF/telefone,
+    usando o motor indexado de src/utils/busca.py.
     Uso: GET /api/clientes/search?q=<texto ou cpf>
-    Retorna [{ id, nome, cpf, label }]
+    Retorna [{ id, nome, cpf, label }] ordenado por CPF exato > prefixo > fuzzy
     """
     try:
         q = (request.args.get('q') or '').strip()
         if not q:
             return jsonify([])
 
-        digits = re.sub(r'\D', '', q)
-        query = db.session.query(Cliente)
-
-        conds = []
-        # Busca por CPF "sem máscara" quando houver dígitos
-        if digits:
-            cpf_digits = db.func.replace(db.func.replace(Cliente.cpf, '.', ''), '-', '')
-            conds.append(cpf_digits.like(f'%{digits}%'))
-
-        # Sempre considera nome também
-        conds.append(Cliente.nome.ilike(f'%{q}%'))
-
-        results = (
-            query.filter(db.or_(*conds))
-                 .order_by(Cliente.nome.asc())
-                 .limit(20)
-                 .all()
-        )
+        results = buscar_clientes(q, limite=20)
 
         return jsonify([
             {
@@ -84,6 +68,12 @@ def listar_clientes():
         if cpf_filter:
             query = query.filter(Cliente.cpf.like(f'%{cpf_filter}%'))
         
+        if modo_cursor():
+            return jsonify(pagina_por_cursor(
+                query, [(Cliente.nome, False), (Cliente.id, False)],
+                'clientes', lambda c: c.to_dict(), per_page
+            ))
+        
         clientes = query.paginate(
             page=page, per_page=per_page, error_out=False
         )
@@ -94,6 +84,8 @@ def listar_clientes():
             'pages': clientes.pages,
             'current_page': page
         })
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -136,6 +128,7 @@ def criar_cliente():
         )
         
         db.session.add(ponto)
+        marcar('clientes')
         db.session.commit()
         
         return jsonify(cliente.to_dict()), 201
@@ -192,6 +185,10 @@ def atualizar_cliente(cliente_id):
             if data['sem_email']:
                 cliente.email = None
         
+        # nome/CPF ficam em cache nos rankings (top-clientes): relidos após o commit
+        if db.session.is_modified(cliente) and {'nome', 'cpf'} & set(data):
+            ranking.agendar_recarga()
+        marcar('clientes')
         db.session.commit()
         return jsonify(cliente.to_dict())
     except Exception as e:
@@ -215,6 +212,8 @@ def excluir_cliente(cliente_id):
             return jsonify({'error': 'Não é possível excluir cliente com resgates pendentes'}), 400
         
         db.session.delete(cliente)
+        ranking.agendar_recarga()
+        marcar('clientes')
         db.session.commit()
         
         return jsonify({'message': 'Cliente excluído com sucesso'})
@@ -0,0 +1,141 @@
+# src/routes/relatorio.py
+from flask import Blueprint, current_app, jsonify, request, send_file, session, url_for
+
+from src.routes.auth import login_required
+from src.routes.visita import filtros_relatorio_visitas
+from src.utils import jobs, relatorios
+from src.utils.exportacao import FORMATOS_STREAMING
+from src.utils.permissions import lojas_restriction
+
+relatorio_bp = Blueprint('relatorio', __name__)
+
+# nome -> (parser de filtros, ação de permissão p/ lojas ou None, TipoRelatorio)
+_RELATORIOS = {
+    'clientes-detalhado': (
+        relatorios.filtros_clientes_detalhado,
+        None,
+        jobs.TipoRelatorio(
+            linhas=lambda f, lojas: relatorios.linhas_clientes_detalhado(f),
+            contar=lambda f, lojas: relatorios.contar_clientes_detalhado(f),
+            colunas=relatorios.COLUNAS_CLIENTES_DETALHADO,
+            achatar=relatorios.achatar_clientes_detalhado,
+        ),
+    ),
+    'campanhas-performance': (
+        relatorios.filtros_campanhas_performance,
+        None,
+        jobs.TipoRelatorio(
+            linhas=lambda f, lojas: relatorios.relatorio_campanhas_performance(f),
+            contar=None,
+            colunas=relatorios.COLUNAS_CAMPANHAS_PERFORMANCE,
+            achatar=relatorios.achatar_campanhas_performance,
+        ),
+    ),
+    'visitas': (
+        filtros_relatorio_visitas,
+        'view',
+        jobs.TipoRelatorio(
+            linhas=relatorios.linhas_visitas,
+            contar=lambda f, lojas: relatorios.estatisticas_visitas(f, lojas)['total_visitas'],
+            colunas=relatorios.COLUNAS_VISITAS,
+            achatar=None,
+        ),
+    ),
+}
+
+
+def _job_do_usuario(job_id):
+    """Job visível para quem o criou (ou ADMIN); senão None."""
+    estado = jobs.obter(job_id)
+    if not estado:
+        return None
+    if estado['usuario_id'] != session.get('user_id') and session.get('role') != 'ADMIN':
+        return None
+    return estado
+
+
+def _publico(estado):
+    out = {k: v for k, v in estado.items() if k not in ('usuario_id', 'lojas')}
+    if estado['total']:
+        out['progresso'] = round(min(estado['linhas'] / estado['total'], 1.0) * 100, 1)
+    elif estado['status'] == 'concluido':
+        out['progresso'] = 100.0
+    out['status_url'] = url_for('relatorio.status_job', job_id=estado['id'])
+    if estado['status'] == 'concluido':
+        out['download_url'] = url_for('relatorio.baixar_job', job_id=estado['id'])
+    return out
+
+
+@relatorio_bp.route('/relatorios/jobs', methods=['POST'])
+@login_required
+def criar_job():
+    """
+    Enfileira um relatório.
+    Body: {"relatorio": "visitas" | "clientes-detalhado" | "campanhas-performance",
+           "formato": "csv" | "ndjson", "parametros": {...mesmos filtros da rota síncrona}}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        nome = data.get('relatorio')
+        if nome not in _RELATORIOS:
+            return jsonify({'error': 'Relatório inválido',
+                            'disponiveis': sorted(_RELATORIOS)}), 400
+
+        formato = data.get('formato', 'csv')
+        if formato not in FORMATOS_STREAMING:
+            return jsonify({'error': 'Formato inválido'}), 400
+
+        parametros = data.get('parametros') or {}
+        if not isinstance(parametros, dict):
+            return jsonify({'error': 'parametros deve ser um objeto'}), 400
+        parametros = {k: str(v) for k, v in parametros.items() if v is not None}
+
+        parser, acao, tipo = _RELATORIOS[nome]
+        try:
+            filtros = parser(parametros)
+        except relatorios.FiltroInvalido as e:
+            return jsonify({'error': str(e)}), 400
+
+        # permissões resolvidas agora: o job roda fora da request
+        lojas = lojas_restriction(acao) if acao else None
+
+        try:
+            estado = jobs.enfileirar(
+                current_app._get_current_object(), session['user_id'],
+                nome, tipo, formato, parametros, filtros, lojas,
+            )
+        except jobs.FilaCheia as e:
+            resp = jsonify({'error': str(e)})
+            resp.headers['Retry-After'] = '30'
+            return resp, 429
+
+        return jsonify(_publico(estado)), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@relatorio_bp.route('/relatorios/jobs/<job_id>', methods=['GET'])
+@login_required
+def status_job(job_id):
+    estado = _job_do_usuario(job_id)
+    if not estado:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(_publico(estado))
+
+
+@relatorio_bp.route('/relatorios/jobs/<job_id>/download', methods=['GET'])
+@login_required
+def baixar_job(job_id):
+    estado = _job_do_usuario(job_id)
+    if not estado:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    caminho = jobs.arquivo_resultado(estado)
+    if not caminho:
+        return jsonify({'error': 'Relatório ainda não disponível', 'status': estado['status']}), 409
+    return send_file(
+        caminho,
+        mimetype='application/gzip',
+        as_attachment=True,
+        download_name=f"{estado['relatorio']}_{estado['id'][:8]}.{estado['formato']}.gz",
+    )
@@ -1,65 +1,21 @@
 from flask import Blueprint, request, jsonify
-from src.models.user import db, Cliente, Brinde, Resgate, Ponto, StatusResgateEnum, NivelEnum
+from collections import Counter
+from sqlalchemy import or_, select, update
+from src.models.user import db, Resgate, StatusResgateEnum
+from src.utils import elegibilidade, estoque, voucher
+from src.utils.cache import marcar
+from src.utils.paginacao import CursorInvalido, modo_cursor, pagina_por_cursor
 from datetime import datetime
 import uuid
-import secrets
 
 resgate_bp = Blueprint('resgate', __name__)
 
-def gerar_voucher_codigo():
-    """Gera um código único para o voucher"""
-    return f"VCH-{secrets.token_hex(4).upper()}-{datetime.now().strftime('%Y%m%d')}"
+_resgates = Resgate.__table__
 
 def verificar_elegibilidade_cliente(cliente_id, brinde_id):
     """Verifica se o cliente é elegível para resgatar o brinde"""
     try:
-        cliente = Cliente.query.get(cliente_id)
-        if not cliente:
-            return False, "Cliente não encontrado"
-        
-        brinde = Brinde.query.get(brinde_id)
-        if not brinde:
-            return False, "Brinde não encontrado"
-        
-        # Verificar se a campanha está ativa
-        if not brinde.campanha.ativa:
-            return False, "Campanha não está ativa"
-        
-        # Verificar se está dentro do período da campanha
-        agora = datetime.utcnow()
-        if agora < brinde.campanha.data_inicio or agora > brinde.campanha.data_fim:
-            return False, "Campanha fora do período de validade"
-        
-        # Verificar disponibilidade do brinde
-        if brinde.quantidade_disponivel <= 0:
-            return False, "Brinde não disponível"
-        
-        # Verificar pontos do cliente
-        ponto = Ponto.query.filter_by(cliente_id=cliente_id).first()
-        if not ponto:
-            return False, "Cliente não possui pontos registrados"
-        
-        # Verificar se o nível do cliente permite o brinde
-        nivel_cliente = ponto.nivel_atual
-        nivel_brinde = brinde.nivel
-        
-        # Hierarquia: Bronze < Prata < Ouro
-        niveis_hierarquia = {
-            NivelEnum.BRONZE: 1,
-            NivelEnum.PRATA: 2,
-            NivelEnum.OURO: 3
-        }
-        
-        if niveis_hierarquia[nivel_cliente] < niveis_hierarquia[nivel_brinde]:
-            return False, f"Nível insuficiente. Necessário: {nivel_brinde.value}, Atual: {nivel_cliente.value}"
-        
-        # Verificar threshold de visitas se configurado
-        total_visitas = len(cliente.visitas)
-        if total_visitas < brinde.campanha.threshold_visitas:
-            return False, f"Número de visitas insuficiente. Necessário: {brinde.campanha.threshold_visitas}, Atual: {total_visitas}"
-        
-        return True, "Cliente elegível"
-        
+        return elegibilidade.verificar(cliente_id, brinde_id)
     except Exception as e:
         return False, f"Erro ao verificar elegibilidade: {str(e)}"
 
@@ -113,21 +69,23 @@ def criar_resgate():
             return jsonify({'error': 'Já existe um resgate pendente para este brinde'}), 400
         
         # Criar resgate
-        voucher_codigo = gerar_voucher_codigo()
-        
         resgate = Resgate(
             cliente_id=cliente_id,
             brinde_id=brinde_id,
-            voucher_codigo=voucher_codigo,
             status=StatusResgateEnum.PENDENTE
         )
         
-        db.session.add(resgate)
+        # Baixa atômica do estoque (UPDATE condicional): sem estoque, nada é gravado
+        if not estoque.reservar(brinde_id):
+            db.session.rollback()
+            return jsonify({'error': 'Brinde não disponível'}), 400
         
-        # Reduzir quantidade disponível do brinde
-        brinde = Brinde.query.get(brinde_id)
-        brinde.quantidade_disponivel -= 1
+        db.session.add(resgate)
+        # voucher assinado carrega o id do resgate: precisa do flush antes
+        db.session.flush()
+        resgate.voucher_codigo = voucher.gerar(resgate.id, resgate.brinde_id)
         
+        marcar('resgates')
         db.session.commit()
         
         return jsonify(resgate.to_dict()), 201
@@ -148,6 +106,7 @@ def entregar_brinde(resgate_id):
         resgate.status = StatusResgateEnum.ENTREGUE
         resgate.data_entrega = datetime.utcnow()
         
+        marcar('resgates')
         db.session.commit()
         
         return jsonify(resgate.to_dict())
@@ -160,18 +119,23 @@ def entregar_brinde(resgate_id):
 def cancelar_resgate(resgate_id):
     """Cancela um resgate"""
     try:
-        resgate = Resgate.query.get_or_404(resgate_id)
-        
-        if resgate.status == StatusResgateEnum.ENTREGUE:
-            return jsonify({'error': 'Não é possível cancelar resgate já entregue'}), 400
+        # PENDENTE -> CANCELADO num UPDATE condicional: só quem mudou o status devolve o estoque
+        cancelado = db.session.execute(
+            update(_resgates)
+            .where(_resgates.c.id == resgate_id, _resgates.c.status == StatusResgateEnum.PENDENTE)
+            .values(status=StatusResgateEnum.CANCELADO)
+            .returning(_resgates.c.brinde_id)
+        ).first()
+        if cancelado is not None:
+            estoque.devolver(cancelado.brinde_id)
         
-        # Devolver quantidade ao brinde
-        if resgate.status == StatusResgateEnum.PENDENTE:
-            brinde = Brinde.query.get(resgate.brinde_id)
-            brinde.quantidade_disponivel += 1
+        resgate = Resgate.query.populate_existing().get_or_404(resgate_id)
         
-        resgate.status = StatusResgateEnum.CANCELADO
+        if cancelado is None and resgate.status == StatusResgateEnum.ENTREGUE:
+            db.session.rollback()
+            return jsonify({'error': 'Não é possível cancelar resgate já entregue'}), 400
         
+        marcar('resgates')
         db.session.commit()
         
         return jsonify(resgate.to_dict())
@@ -180,6 +144,132 @@ def cancelar_resgate(resgate_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+LOTE_MAX_RESGATES = 5000
+
+
+def _transicao_lote(novo_status):
+    """
+    PENDENTE -> `novo_status` para uma lista de resgates (ids ou códigos de
+    voucher), set-based numa transação: uma leitura para resolver os itens,
+    um UPDATE ... WHERE status = PENDENTE RETURNING e, no cancelamento, a
+    devolução do estoque agrupada por brinde.
+    """
+    data = request.get_json(silent=True)
+    itens = data.get('resgates') if isinstance(data, dict) else data
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'error': 'Envie uma lista em "resgates" (ids ou códigos de voucher)'}), 400
+    if len(itens) > LOTE_MAX_RESGATES:
+        return jsonify({'error': f'Máximo de {LOTE_MAX_RESGATES} resgates por lote'}), 413
+
+    resultados = [None] * len(itens)
+
+    def erro(i, msg, resgate_id=None):
+        resultados[i] = {'indice': i, 'status': 'erro', 'resgate_id': resgate_id, 'error': msg}
+
+    # 1) ids e vouchers (assinatura conferida em memória, sem banco)
+    pedidos = []  # (indice, resgate_id | None, voucher | None, brinde_id do voucher | None)
+    for i, item in enumerate(itens):
+        if (isinstance(item, int) and not isinstance(item, bool)) or (isinstance(item, str) and item.strip().isdigit()):
+            pedidos.append((i, int(item), None, None))
+            continue
+        if not isinstance(item, str):
+            erro(i, 'Item inválido')
+            continue
+        decodificado = voucher.decodificar(item)
+        if decodificado is None:
+            erro(i, 'Voucher inválido')
+            continue
+        tipo, resgate_id, brinde_id = decodificado
+        pedidos.append((i, resgate_id, voucher.normalizar(item), brinde_id))
+
+    # 2) uma leitura: por id (ids e vouchers assinados) e por código (vouchers antigos)
+    ids = {p[1] for p in pedidos if p[1] is not None}
+    legados = {p[2] for p in pedidos if p[1] is None}
+    filtro = []
+    if ids:
+        filtro.append(_resgates.c.id.in_(ids))
+    if legados:
+        filtro.append(_resgates.c.voucher_codigo.in_(legados))
+    linhas = db.session.execute(
+        select(_resgates.c.id, _resgates.c.brinde_id, _resgates.c.voucher_codigo, _resgates.c.status)
+        .where(or_(*filtro))
+    ).all() if filtro else []
+    por_id = {r.id: r for r in linhas}
+    por_codigo = {r.voucher_codigo: r for r in linhas if r.voucher_codigo}
+
+    # 3) cada item vira um resgate PENDENTE alvo ou um resultado já decidido
+    alvos, vistos = {}, set()
+    for i, resgate_id, codigo, brinde_id in pedidos:
+        if resgate_id is None:
+            linha = por_codigo.get(codigo)
+        else:
+            linha = por_id.get(resgate_id)
+            if linha and codigo and (linha.brinde_id != brinde_id or linha.voucher_codigo != codigo):
+                linha = None
+        if linha is None:
+            erro(i, 'Voucher não encontrado' if codigo else 'Resgate não encontrado', resgate_id)
+        elif linha.id in vistos:
+            erro(i, 'Resgate repetido no lote', linha.id)
+        elif linha.status == StatusResgateEnum.PENDENTE:
+            alvos[linha.id] = i
+        elif novo_status == StatusResgateEnum.CANCELADO and linha.status == StatusResgateEnum.CANCELADO:
+            resultados[i] = {'indice': i, 'status': 'cancelado', 'resgate_id': linha.id}
+        elif novo_status == StatusResgateEnum.CANCELADO:
+            erro(i, 'Não é possível cancelar resgate já entregue', linha.id)
+        else:
+            erro(i, 'Resgate não está pendente', linha.id)
+        if linha is not None:
+            vistos.add(linha.id)
+
+    # 4) transição set-based; quem outra request mudou no meio não volta no RETURNING
+    alterados = []
+    if alvos:
+        valores = {'status': novo_status}
+        if novo_status == StatusResgateEnum.ENTREGUE:
+            valores['data_entrega'] = datetime.utcnow()
+        alterados = db.session.execute(
+            update(_resgates)
+            .where(_resgates.c.id.in_(list(alvos)), _resgates.c.status == StatusResgateEnum.PENDENTE)
+            .values(**valores)
+            .returning(_resgates.c.id, _resgates.c.brinde_id)
+        ).all()
+        if novo_status == StatusResgateEnum.CANCELADO:
+            estoque.devolver_lote(Counter(r.brinde_id for r in alterados))
+        marcar('resgates')
+    db.session.commit()
+
+    rotulo = novo_status.name.lower()
+    for r in alterados:
+        i = alvos.pop(r.id)
+        resultados[i] = {'indice': i, 'status': rotulo, 'resgate_id': r.id}
+    for resgate_id, i in alvos.items():
+        erro(i, 'Resgate não está mais pendente', resgate_id)
+
+    return jsonify({
+        'recebidos': len(itens),
+        'alterados': len(alterados),
+        'erros': sum(1 for r in resultados if r['status'] == 'erro'),
+        'resultados': resultados,
+    })
+
+@resgate_bp.route('/resgates/entregar-lote', methods=['POST'])
+def entregar_lote():
+    """Entrega vários resgates (ids ou vouchers) de uma vez; resultado por item"""
+    try:
+        return _transicao_lote(StatusResgateEnum.ENTREGUE)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@resgate_bp.route('/resgates/cancelar-lote', methods=['POST'])
+def cancelar_lote():
+    """Cancela vários resgates (ids ou vouchers) de uma vez, devolvendo o estoque; resultado por item"""
+    try:
+        return _transicao_lote(StatusResgateEnum.CANCELADO)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @resgate_bp.route('/resgates/cliente/<int:cliente_id>', methods=['GET'])
 def listar_resgates_cliente(cliente_id):
     """Lista todos os resgates de um cliente"""
@@ -197,6 +287,12 @@ def listar_resgates_cliente(cliente_id):
             except ValueError:
                 return jsonify({'error': 'Status inválido'}), 400
         
+        if modo_cursor():
+            return jsonify(pagina_por_cursor(
+                query, [(Resgate.data_resgate, True), (Resgate.id, True)],
+                'resgates', lambda r: r.to_dict(), per_page
+            ))
+        
         resgates = query.order_by(Resgate.data_resgate.desc())\
                        .paginate(page=page, per_page=per_page, error_out=False)
         
@@ -207,6 +303,8 @@ def listar_resgates_cliente(cliente_id):
             'current_page': page
         })
         
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -237,6 +335,12 @@ def listar_resgates():
             data_fim = datetime.fromisoformat(data_fim)
             query = query.filter(Resgate.data_resgate <= data_fim)
         
+        if modo_cursor():
+            return jsonify(pagina_por_cursor(
+                query, [(Resgate.data_resgate, True), (Resgate.id, True)],
+                'resgates', lambda r: r.to_dict(), per_page
+            ))
+        
         resgates = query.order_by(Resgate.data_resgate.desc())\
                        .paginate(page=page, per_page=per_page, error_out=False)
         
@@ -247,6 +351,8 @@ def listar_resgates():
             'current_page': page
         })
         
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -254,7 +360,20 @@ def listar_resgates():
 def buscar_por_voucher(voucher_codigo):
     """Busca resgate por código do voucher"""
     try:
-        resgate = Resgate.query.filter_by(voucher_codigo=voucher_codigo).first()
+        # formato + HMAC em memória: código malformado/forjado não chega ao banco
+        decodificado = voucher.decodificar(voucher_codigo)
+        if decodificado is None:
+            return jsonify({'error': 'Voucher inválido'}), 404
+        
+        tipo, resgate_id, brinde_id = decodificado
+        codigo = voucher.normalizar(voucher_codigo)
+        if tipo == 'assinado':
+            resgate = db.session.get(Resgate, resgate_id)
+            if resgate and (resgate.brinde_id != brinde_id or resgate.voucher_codigo != codigo):
+                resgate = None
+        else:
+            # vouchers antigos (VCH-...): aleatórios, só pela coluna
+            resgate = Resgate.query.filter_by(voucher_codigo=codigo).first()
         
         if not resgate:
             return jsonify({'error': 'Voucher não encontrado'}), 404
@@ -266,39 +385,30 @@ def buscar_por_voucher(voucher_codigo):
 
 @resgate_bp.route('/resgates/brindes-disponiveis/<int:cliente_id>', methods=['GET'])
 def listar_brindes_disponiveis(cliente_id):
-    """Lista brindes disponíveis para um cliente"""
+    """Lista brindes disponíveis para um cliente (regras avaliadas em lote, em memória)"""
     try:
-        cliente = Cliente.query.get(cliente_id)
-        if not cliente:
+        estado = elegibilidade.estado_cliente(cliente_id)
+        if not estado:
             return jsonify({'error': 'Cliente não encontrado'}), 404
         
-        # Buscar campanhas ativas
+        # brindes com estoque de campanhas ativas e vigentes (campanha e produto na mesma consulta)
         agora = datetime.utcnow()
-        campanhas_ativas = db.session.query(Brinde)\
-                                   .join(Brinde.campanha)\
-                                   .filter(
-                                       Brinde.quantidade_disponivel > 0,
-                                       Brinde.campanha.has(ativa=True),
-                                       Brinde.campanha.has(data_inicio <= agora),
-                                       Brinde.campanha.has(data_fim >= agora)
-                                   ).all()
+        brindes = elegibilidade.brindes_candidatos(agora)
         
         brindes_disponiveis = []
         
-        for brinde in campanhas_ativas:
-            elegivel, mensagem = verificar_elegibilidade_cliente(cliente_id, brinde.id)
-            
-            brinde_dict = brinde.to_dict()
-            brinde_dict['elegivel'] = elegivel
-            brinde_dict['mensagem_elegibilidade'] = mensagem
+        for r in elegibilidade.avaliar(estado, brindes, agora):
+            brinde_dict = r['brinde'].to_dict()
+            brinde_dict['elegivel'] = r['elegivel']
+            brinde_dict['mensagem_elegibilidade'] = r['mensagem']
+            brinde_dict['motivos_inelegibilidade'] = r['motivos']
             
             brindes_disponiveis.append(brinde_dict)
         
         return jsonify({
             'brindes_disponiveis': brindes_disponiveis,
-            'cliente': cliente.to_dict()
+            'cliente': estado.cliente.to_dict()
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
@@ -1,9 +1,9 @@
 # src/routes/visita.py
 
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from sqlalchemy import or_
+from flask import Blueprint, current_app, request, jsonify
+from datetime import datetime, timezone
 import re
+from sqlalchemy import insert, select
 from unicodedata import normalize as ucnorm
 
 from src.models.user import (
@@ -11,13 +11,17 @@ from src.models.user import (
     Cliente,
     Visita,
     Ponto,
-    NivelEnum,
     LojaEnum,
 )
 from src.utils.permissions import (
     ensure_loja_allowed,
     filter_query_by_lojas,
+    lojas_restriction,
 )
+from src.utils import agregados, busca, relatorios
+from src.utils import pontos as pontos_saldo, pontuacao, visita_rapida
+from src.utils.exportacao import FORMATOS_STREAMING, resposta_streaming
+from src.utils.paginacao import CursorInvalido, modo_cursor, pagina_por_cursor
 
 visita_bp = Blueprint('visita', __name__)
 
@@ -73,33 +77,61 @@ def _normalize_loja_for_enum(loja_raw):
 # ========================= Regras de Pontuação =========================
 
 def calcular_nivel_por_pontos(pontos):
-    if pontos >= 1000:
-        return NivelEnum.OURO
-    elif pontos >= 500:
-        return NivelEnum.PRATA
-    else:
-        return NivelEnum.BRONZE
-
-def atualizar_pontos_cliente(cliente_id, valor_compra, loja=None):
-    fator_pontuacao = 1.0
-    pontos_compra = int(float(valor_compra) * fator_pontuacao)
-
-    ponto = Ponto.query.filter_by(cliente_id=cliente_id).first()
-    if not ponto:
-        ponto = Ponto(
-            cliente_id=cliente_id,
-            pontos_acumulados=0,
-            nivel_atual=NivelEnum.BRONZE
-        )
-        db.session.add(ponto)
-
-    ponto.pontos_acumulados += pontos_compra
-    ponto.nivel_atual = calcular_nivel_por_pontos(ponto.pontos_acumulados)
-    ponto.data_atualizacao = datetime.utcnow()
-    return pontos_compra
+    return pontos_saldo.nivel_por_pontos(pontos)
+
+def atualizar_pontos_cliente(cliente_id, valor_compra, loja=None, visita_id=None,
+                             motivo='visita', data_visita=None):
+    """
+    Lança os pontos da compra no extrato e no saldo (UPSERT atômico), com o
+    fator da campanha vigente para a loja/data. Retorna (pontos_lancados, saldo, nivel).
+    """
+    fator_pontuacao = pontuacao.fator_pontuacao(loja, data_visita)
+    pontos_compra = pontuacao.pontos_da_compra(valor_compra, fator_pontuacao)
+
+    saldo, nivel = pontos_saldo.lancar(cliente_id, pontos_compra, motivo, visita_id, fator_pontuacao)
+    agregados.pontos_alterados(cliente_id, pontos_compra)
+    return pontos_compra, saldo, nivel
+
+def ajustar_pontos_visita(visita, valor_antigo, novo_valor=0, motivo='ajuste_visita'):
+    """
+    Recalcula os pontos da visita para `novo_valor` (0 = estorno) com o mesmo
+    fator do crédito original e lança só a diferença para o que já foi lançado.
+    Visitas anteriores ao extrato foram pontuadas com fator 1.0.
+    """
+    lancado = pontos_saldo.lancado_na_visita(visita.id)
+    if lancado is None:
+        lancado = (pontuacao.pontos_da_compra(valor_antigo, 1.0), 1.0)
+    ja_lancado, fator = lancado
+    diferenca = pontuacao.pontos_da_compra(novo_valor, fator) - ja_lancado
+    if diferenca:
+        pontos_saldo.lancar(visita.cliente_id, diferenca, motivo, visita.id, fator)
+        agregados.pontos_alterados(visita.cliente_id, diferenca)
+    return diferenca
 
 # ========================= Endpoints =========================
 
+def _registrar_visita_orm(cliente_id, valor_compra, loja_enum):
+    """Caminho ORM (dialetos sem UPSERT/RETURNING, ou VISITA_CAMINHO_RAPIDO desligado)."""
+    visita = Visita(
+        cliente_id=cliente_id,
+        valor_compra=valor_compra,
+        loja=loja_enum,
+        data_visita=datetime.utcnow()
+    )
+    db.session.add(visita)
+    db.session.flush()
+    agregados.visita_registrada(visita)
+
+    pontos_ganhos, saldo, nivel = atualizar_pontos_cliente(
+        cliente_id, valor_compra, loja_enum, visita_id=visita.id, data_visita=visita.data_visita
+    )
+    return {
+        'visita': visita.to_dict(),
+        'pontos_ganhos': pontos_ganhos,
+        'pontos_totais': saldo,
+        'nivel_atual': nivel
+    }
+
 @visita_bp.route('/visitas', methods=['POST'])
 def registrar_visita():
     """Registra uma nova visita e atualiza pontos (aceita JSON ou form)."""
@@ -108,18 +140,13 @@ def registrar_visita():
         valor_compra = _get_param('valor_compra') or _get_param('valor') or _get_param('valorCompra')
         loja_raw     = _get_param('loja')
         cpf_raw      = _get_param('cpf') or _get_param('cliente_cpf') or _get_param('cpf_digitado')
+        cpf = _only_digits(cpf_raw) if not cliente_id and cpf_raw else None
 
-        if not cliente_id and cpf_raw:
-            cpf = _only_digits(cpf_raw)
-            cli = Cliente.query.filter(Cliente.cpf == cpf).first()
-            if cli:
-                cliente_id = cli.id
-
-        if not cliente_id or not valor_compra:
+        if not (cliente_id or cpf) or not valor_compra:
             return jsonify({'error': 'cliente_id e valor_compra são obrigatórios'}), 400
 
         try:
-            cliente_id = int(cliente_id)
+            cliente_id = int(cliente_id) if cliente_id else None
             valor_compra = float(valor_compra)
         except Exception:
             return jsonify({'error': 'Formato inválido para cliente_id/valor_compra'}), 400
@@ -127,10 +154,6 @@ def registrar_visita():
         if valor_compra <= 0:
             return jsonify({'error': 'Valor da compra deve ser maior que zero'}), 400
 
-        cliente = Cliente.query.get(cliente_id)
-        if not cliente:
-            return jsonify({'error': 'Cliente não encontrado'}), 404
-
         # Normaliza loja -> Enum + valida permissões de criação
         loja_enum = None
         if loja_raw:
@@ -147,25 +170,177 @@ def registrar_visita():
             except KeyError:
                 return jsonify({'error': f'Loja inválida (recebido: {loja_raw})'}), 400
 
-        visita = Visita(
-            cliente_id=cliente_id,
-            valor_compra=valor_compra,
-            loja=loja_enum,
-            data_visita=datetime.utcnow()
-        )
-        db.session.add(visita)
-        db.session.flush()
+        if current_app.config.get('VISITA_CAMINHO_RAPIDO', True) and visita_rapida.disponivel():
+            # cliente (id ou CPF), visita, pontos e agregados numa ida ao banco (Postgres)
+            resposta = visita_rapida.registrar(cliente_id, cpf, valor_compra, loja_enum)
+        else:
+            if cpf:
+                cli = Cliente.query.filter(Cliente.cpf == cpf).first()
+                cliente_id = cli.id if cli else None
+            cliente = Cliente.query.get(cliente_id) if cliente_id else None
+            resposta = _registrar_visita_orm(cliente_id, valor_compra, loja_enum) if cliente else None
+
+        if resposta is None:
+            db.session.rollback()
+            if cpf:
+                # CPF sem cadastro: mesmo retorno de antes (sem cliente_id)
+                return jsonify({'error': 'cliente_id e valor_compra são obrigatórios'}), 400
+            return jsonify({'error': 'Cliente não encontrado'}), 404
 
-        pontos_ganhos = atualizar_pontos_cliente(cliente_id, valor_compra, loja_enum)
+        resposta['nivel_atual'] = resposta['nivel_atual'].value
         db.session.commit()
+        return jsonify(resposta), 201
 
-        ponto = Ponto.query.filter_by(cliente_id=cliente_id).first()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+LOTE_MAX_VISITAS = 5000
+
+
+@visita_bp.route('/visitas/lote', methods=['POST'])
+def registrar_visitas_lote():
+    """
+    Registra várias visitas de uma vez (reenvio do PDV após ficar offline).
+    Body: {"visitas": [{"cliente_id" | "cpf", "valor_compra", "loja", "data_visita"?}, ...]}
+    As linhas válidas são gravadas juntas; as inválidas voltam com o erro, por índice.
+    """
+    try:
+        data = request.get_json(silent=True)
+        itens = data.get('visitas') if isinstance(data, dict) else data
+        if not isinstance(itens, list) or not itens:
+            return jsonify({'error': 'Envie uma lista em "visitas"'}), 400
+        if len(itens) > LOTE_MAX_VISITAS:
+            return jsonify({'error': f'Máximo de {LOTE_MAX_VISITAS} visitas por lote'}), 413
+
+        resultados = [None] * len(itens)
+
+        def erro(i, msg):
+            resultados[i] = {'indice': i, 'status': 'erro', 'error': msg}
+
+        # 1) validação linha a linha (sem banco)
+        linhas = []
+        for i, item in enumerate(itens):
+            if not isinstance(item, dict):
+                erro(i, 'Linha inválida')
+                continue
+            cliente_id = item.get('cliente_id') or item.get('clienteId') or item.get('cliente')
+            valor_compra = item.get('valor_compra') or item.get('valor') or item.get('valorCompra')
+            cpf = _only_digits(item.get('cpf') or item.get('cliente_cpf') or '')
+            try:
+                cliente_id = int(cliente_id) if cliente_id else None
+                valor_compra = float(valor_compra) if valor_compra else None
+            except Exception:
+                erro(i, 'Formato inválido para cliente_id/valor_compra')
+                continue
+            if not (cliente_id or cpf) or not valor_compra:
+                erro(i, 'cliente_id (ou cpf) e valor_compra são obrigatórios')
+                continue
+            if valor_compra <= 0:
+                erro(i, 'Valor da compra deve ser maior que zero')
+                continue
+
+            loja_norm = None
+            if item.get('loja'):
+                loja_norm = _normalize_loja_for_enum(item['loja'])
+                if not loja_norm:
+                    erro(i, f"Loja inválida (recebido: {item['loja']})")
+                    continue
+
+            data_visita = None
+            if item.get('data_visita'):
+                try:
+                    data_visita = datetime.fromisoformat(item['data_visita'])
+                except (TypeError, ValueError):
+                    erro(i, 'data_visita inválida')
+                    continue
+                # com fuso (ex.: "...Z" do PDV): grava em UTC sem fuso, como as demais datas
+                if data_visita.tzinfo is not None:
+                    data_visita = data_visita.astimezone(timezone.utc).replace(tzinfo=None)
+
+            linhas.append({'indice': i, 'cliente_id': cliente_id, 'cpf': cpf,
+                           'valor_compra': valor_compra, 'loja': loja_norm,
+                           'data_visita': data_visita})
+
+        # 2) permissão de criação: uma checagem por loja distinta
+        negadas = {}
+        for loja_norm in {l['loja'] for l in linhas if l['loja']}:
+            ok, allowed = ensure_loja_allowed(loja_norm, "create")
+            if not ok:
+                negadas[loja_norm] = sorted(allowed)
+
+        # 3) CPFs e ids de cliente resolvidos com um IN cada
+        cpfs = {l['cpf'] for l in linhas if not l['cliente_id']}
+        por_cpf = dict(db.session.execute(
+            select(Cliente.cpf, Cliente.id).where(Cliente.cpf.in_(cpfs))
+        ).all()) if cpfs else {}
+        for l in linhas:
+            if not l['cliente_id']:
+                l['cliente_id'] = por_cpf.get(l['cpf'])
+        ids = {l['cliente_id'] for l in linhas if l['cliente_id']}
+        existentes = set(db.session.execute(
+            select(Cliente.id).where(Cliente.id.in_(ids))
+        ).scalars()) if ids else set()
+
+        agora = datetime.utcnow()
+        validas = []
+        for l in linhas:
+            if l['loja'] in negadas:
+                erro(l['indice'], f"Usuário não tem permissão de CRIAR para a loja {l['loja']}. "
+                                  f"Permitidas: {negadas[l['loja']]}")
+            elif l['cliente_id'] not in existentes:
+                erro(l['indice'], 'Cliente não encontrado')
+            else:
+                validas.append({
+                    'indice': l['indice'],
+                    'cliente_id': l['cliente_id'],
+                    'valor_compra': l['valor_compra'],
+                    'loja': LojaEnum[l['loja']] if l['loja'] else None,
+                    'data_visita': l['data_visita'] or agora,
+                })
+
+        clientes = {}
+        if validas:
+            # 4) INSERT em lote, ids na ordem das linhas
+            novos_ids = db.session.execute(
+                insert(Visita).returning(Visita.id, sort_by_parameter_order=True),
+                [{k: v[k] for k in ('cliente_id', 'valor_compra', 'loja', 'data_visita')} for v in validas],
+            ).scalars().all()
+
+            # 5) pontos (extrato + saldo) e agregados: uma atualização por cliente
+            pontos_por_cliente = {}
+            campanhas = pontuacao.indice()
+            for v in validas:
+                v['fator'] = campanhas.fator(v['loja'], v['data_visita'])
+                v['pontos'] = pontuacao.pontos_da_compra(v['valor_compra'], v['fator'])
+                pontos_por_cliente[v['cliente_id']] = pontos_por_cliente.get(v['cliente_id'], 0) + v['pontos']
+            saldos = pontos_saldo.lancar_lote([
+                {'cliente_id': v['cliente_id'], 'pontos': v['pontos'], 'motivo': 'visita',
+                 'visita_id': visita_id, 'fator': v['fator']}
+                for v, visita_id in zip(validas, novos_ids)
+            ])
+            agregados.visitas_registradas_lote(validas, pontos_por_cliente)
+            db.session.commit()
+            clientes = {
+                cid: {'pontos_totais': saldo, 'nivel_atual': nivel.value}
+                for cid, (saldo, nivel) in saldos.items()
+            }
+
+            for v, visita_id in zip(validas, novos_ids):
+                resultados[v['indice']] = {
+                    'indice': v['indice'], 'status': 'criada', 'visita_id': visita_id,
+                    'cliente_id': v['cliente_id'], 'pontos_ganhos': v['pontos'],
+                }
+
+        criadas = len(validas)
         return jsonify({
-            'visita': visita.to_dict(),
-            'pontos_ganhos': pontos_ganhos,
-            'pontos_totais': ponto.pontos_acumulados if ponto else 0,
-            'nivel_atual': ponto.nivel_atual.value if ponto else 'Bronze'
-        }), 201
+            'recebidas': len(itens),
+            'criadas': criadas,
+            'erros': len(itens) - criadas,
+            'resultados': resultados,
+            'clientes': clientes,
+        }), 201 if criadas and criadas == len(itens) else 200
 
     except Exception as e:
         db.session.rollback()
@@ -183,10 +358,18 @@ def listar_visitas_cliente(cliente_id):
         if not cliente:
             return jsonify({'error': 'Cliente não encontrado'}), 404
 
-        q = Visita.query.filter_by(cliente_id=cliente_id).order_by(Visita.data_visita.desc())
+        q = Visita.query.filter_by(cliente_id=cliente_id)
         q = filter_query_by_lojas(q, Visita.loja, "view")
 
-        visitas = q.paginate(page=page, per_page=per_page, error_out=False)
+        if modo_cursor():
+            out = pagina_por_cursor(
+                q, [(Visita.data_visita, True), (Visita.id, True)],
+                'visitas', lambda v: v.to_dict(), per_page
+            )
+            out['cliente'] = cliente.to_dict()
+            return jsonify(out)
+
+        visitas = q.order_by(Visita.data_visita.desc()).paginate(page=page, per_page=per_page, error_out=False)
 
         return jsonify({
             'visitas': [v.to_dict() for v in visitas.items],
@@ -195,6 +378,8 @@ def listar_visitas_cliente(cliente_id):
             'current_page': page,
             'cliente': cliente.to_dict()
         })
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -214,6 +399,7 @@ def atualizar_visita(visita_id):
     try:
         visita = Visita.query.get_or_404(visita_id)
         data = request.get_json(silent=True) or {}
+        loja_antiga = visita.loja
 
         # Se alterar loja, valida permissão de edição na nova loja
         if 'loja' in data and data['loja']:
@@ -236,9 +422,9 @@ def atualizar_visita(visita_id):
             visita.valor_compra = novo_valor
 
         if 'valor_compra' in data and valor_antigo != visita.valor_compra:
-            diferenca = visita.valor_compra - valor_antigo
-            atualizar_pontos_cliente(visita.cliente_id, diferenca, visita.loja)
+            ajustar_pontos_visita(visita, valor_antigo, visita.valor_compra)
 
+        agregados.visita_alterada(visita, valor_antigo, loja_antiga)
         db.session.commit()
         return jsonify(visita.to_dict())
 
@@ -256,7 +442,8 @@ def excluir_visita(visita_id):
         if not ok:
             return jsonify({'error': f'Sem permissão para excluir nesta loja. Permitidas: {sorted(allowed)}'}), 403
 
-        atualizar_pontos_cliente(visita.cliente_id, -visita.valor_compra, visita.loja)
+        ajustar_pontos_visita(visita, visita.valor_compra, 0, motivo='estorno_visita')
+        agregados.visita_excluida(visita)
         db.session.delete(visita)
         db.session.commit()
         return jsonify({'message': 'Visita excluída com sucesso'})
@@ -276,21 +463,14 @@ def obter_pontos_cliente(cliente_id):
 
         ponto = Ponto.query.filter_by(cliente_id=cliente_id).first()
         if not ponto:
-            ponto = Ponto(
-                cliente_id=cliente_id,
-                pontos_acumulados=0,
-                nivel_atual=NivelEnum.BRONZE
-            )
-            db.session.add(ponto)
+            pontos_saldo.garantir_registro(cliente_id)
             db.session.commit()
-
-        total_visitas = len(cliente.visitas)
-        valor_total_compras = sum([v.valor_compra for v in cliente.visitas])
+            ponto = Ponto.query.filter_by(cliente_id=cliente_id).first()
 
         return jsonify({
             'pontos': ponto.to_dict(),
-            'total_visitas': total_visitas,
-            'valor_total_compras': valor_total_compras,
+            'total_visitas': cliente.total_visitas or 0,
+            'valor_total_compras': cliente.valor_total_compras or 0.0,
             'cliente': cliente.to_dict()
         })
 
@@ -298,49 +478,78 @@ def obter_pontos_cliente(cliente_id):
         return jsonify({'error': str(e)}), 500
 
 
-@visita_bp.route('/relatorio/visitas', methods=['GET'])
-def relatorio_visitas():
-    """Relatório com filtro de data/loja + restrição por permissão de 'view'."""
+def filtros_relatorio_visitas(args) -> dict:
+    """Converte os parâmetros do relatório de visitas; levanta FiltroInvalido."""
     try:
-        data_inicio = request.args.get('data_inicio')
-        data_fim    = request.args.get('data_fim')
-        loja_raw    = request.args.get('loja')
+        data_inicio = datetime.fromisoformat(args['data_inicio']) if args.get('data_inicio') else None
+        data_fim = datetime.fromisoformat(args['data_fim']) if args.get('data_fim') else None
+    except ValueError:
+        raise relatorios.FiltroInvalido('Data inválida')
 
-        q = Visita.query
+    loja_norm = None
+    if args.get('loja'):
+        # o usuário já será filtrado, mas se especificar loja, normalize
+        loja_norm = _normalize_loja_for_enum(args['loja'])
+        if not loja_norm:
+            raise relatorios.FiltroInvalido('Loja inválida')
 
-        if data_inicio:
-            di = datetime.fromisoformat(data_inicio)
-            q = q.filter(Visita.data_visita >= di)
+    return {'data_inicio': data_inicio, 'data_fim': data_fim, 'loja': loja_norm}
 
-        if data_fim:
-            df = datetime.fromisoformat(data_fim)
-            q = q.filter(Visita.data_visita <= df)
 
-        if loja_raw:
-            # o usuário já será filtrado, mas se especificar loja, normalize
-            loja_norm = _normalize_loja_for_enum(loja_raw)
-            if not loja_norm:
-                return jsonify({'error': 'Loja inválida'}), 400
-            q = q.filter(Visita.loja == LojaEnum[loja_norm])
+@visita_bp.route('/relatorio/visitas', methods=['GET'])
+def relatorio_visitas():
+    """
+    Relatório com filtro de data/loja + restrição por permissão de 'view'.
+    ?format=json (padrão, paginado: page/per_page ou cursor) | ndjson | csv (streaming).
+    """
+    try:
+        formato = request.args.get('format', 'json')
+        if formato != 'json' and formato not in FORMATOS_STREAMING:
+            return jsonify({'error': 'Formato inválido'}), 400
+
+        try:
+            filtros = filtros_relatorio_visitas(request.args)
+        except relatorios.FiltroInvalido as e:
+            return jsonify({'error': str(e)}), 400
 
         # aplica restrição por permissão de visualização
-        q = filter_query_by_lojas(q, Visita.loja, "view")
+        lojas = lojas_restriction("view")
 
-        visitas = q.order_by(Visita.data_visita.desc()).all()
+        if formato in FORMATOS_STREAMING:
+            return resposta_streaming(
+                formato, relatorios.linhas_visitas(filtros, lojas),
+                colunas_csv=relatorios.COLUNAS_VISITAS,
+                nome_arquivo='visitas',
+            )
+
+        estatisticas = relatorios.estatisticas_visitas(filtros, lojas)
+        q = relatorios.consulta_visitas(filtros, lojas)
+        per_page = request.args.get('per_page', 100, type=int)
 
-        total_visitas = len(visitas)
-        valor_total = sum([v.valor_compra for v in visitas])
-        valor_medio = valor_total / total_visitas if total_visitas > 0 else 0
+        if modo_cursor():
+            out = pagina_por_cursor(
+                q, [(Visita.data_visita, True), (Visita.id, True)],
+                'visitas', lambda v: v.to_dict(), per_page
+            )
+            out['estatisticas'] = estatisticas
+            return jsonify(out)
+
+        page = request.args.get('page', 1, type=int)
+        visitas = q.order_by(Visita.data_visita.desc(), Visita.id.desc())\
+                   .paginate(page=page, per_page=per_page, max_per_page=1000,
+                             error_out=False, count=False)
 
         return jsonify({
-            'visitas': [v.to_dict() for v in visitas],
-            'estatisticas': {
-                'total_visitas': total_visitas,
-                'valor_total': valor_total,
-                'valor_medio': valor_medio
-            }
+            'visitas': [v.to_dict() for v in visitas.items],
+            'total': estatisticas['total_visitas'],
+            'pages': -(-estatisticas['total_visitas'] // visitas.per_page),
+            'current_page': page,
+            'per_page': visitas.per_page,
+            'estatisticas': estatisticas
         })
 
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -349,7 +558,7 @@ def relatorio_visitas():
 
 @visita_bp.route('/clientes/cpf/<cpf>', methods=['GET'])
 def buscar_cliente_por_cpf(cpf):
-    cliente = Cliente.query.filter_by(cpf=cpf).first()
+    cliente = busca.cliente_por_cpf(cpf)
     if not cliente:
         return jsonify({'error': 'Cliente não encontrado'}), 404
     return jsonify(cliente.to_dict())
@@ -359,11 +568,5 @@ def buscar_clientes():
     termo = (request.args.get('q') or '').strip()
     if not termo:
         return jsonify([])
-    clientes = (Cliente.query
-                .filter(or_(
-                    Cliente.nome.ilike(f'%{termo}%'),
-                    Cliente.cpf.ilike(f'%{termo}%')
-                ))
-                .limit(15)
-                .all())
+    clientes = busca.buscar_clientes(termo, limite=15)
     return jsonify([c.to_dict() for c in clientes])
@@ -0,0 +1,352 @@
+# src/utils/agregados.py
+"""
+Manutenção dos agregados desnormalizados:
+  - `clientes` (total_visitas, valor_total_compras, ultima_visita, pontos_totais);
+  - `clientes_lojas` (visitas e valor de cada cliente por loja);
+  - `visitas_diarias` (rollup por dia e loja: quantidade e soma de valor_compra).
+
+As funções emitem UPDATEs/UPSERTs atômicos na sessão corrente, então rodam na
+mesma transação da escrita da visita/ponto que as originou. Os valores novos
+(RETURNING) são repassados ao ranking em memória, aplicado após o commit.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import String, case, cast, delete, func, insert, literal, select, text, update
+
+from src.models.user import db, Cliente, ClienteLoja, Visita, Ponto, VisitaDiaria
+from src.utils import ranking
+from src.utils.cache import marcar
+from src.utils.sql import dialeto, insert_upsert
+
+# colunas de `clientes` mantidas aqui (criadas zeradas pelo ALTER TABLE da subida)
+COLUNAS_CLIENTE = ("total_visitas", "valor_total_compras", "ultima_visita", "pontos_totais")
+
+# pg_advisory_lock: só um worker preenche os agregados na subida
+_LOCK_ID = 7_340_220
+
+
+def _update_cliente(cliente_id: int, **valores) -> None:
+    stmt = (
+        update(Cliente)
+        .where(Cliente.id == cliente_id)
+        .values(**valores)
+        .execution_options(synchronize_session=False)
+    )
+    if dialeto() in ("postgresql", "sqlite"):
+        stmt = stmt.returning(Cliente.pontos_totais, Cliente.total_visitas, Cliente.valor_total_compras)
+        row = db.session.execute(stmt).first()
+        if row is not None:
+            ranking.agendar(None, cliente_id, pontos=row[0], visitas=row[1], valor=row[2])
+    else:
+        db.session.execute(stmt)
+        ranking.agendar_recarga()
+
+
+def _loja_rollup(loja) -> str:
+    return loja.name if loja else ""
+
+
+def _somar_cliente_loja(cliente_id: int, loja, visitas: int, valor: float) -> None:
+    """UPSERT atômico em clientes_lojas(cliente_id, loja)."""
+    chave = {"cliente_id": cliente_id, "loja": _loja_rollup(loja)}
+
+    stmt = insert_upsert(ClienteLoja)
+    if stmt is not None:
+        stmt = stmt.values(**chave, total_visitas=visitas, valor_total=valor)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["cliente_id", "loja"],
+            set_={
+                "total_visitas": ClienteLoja.total_visitas + stmt.excluded.total_visitas,
+                "valor_total": ClienteLoja.valor_total + stmt.excluded.valor_total,
+            },
+        ).returning(ClienteLoja.total_visitas, ClienteLoja.valor_total)
+        row = db.session.execute(stmt).first()
+        if loja is not None and row is not None:
+            ranking.agendar(loja.name, cliente_id, visitas=row[0], valor=row[1])
+        return
+
+    res = db.session.execute(
+        update(ClienteLoja)
+        .where(ClienteLoja.cliente_id == cliente_id, ClienteLoja.loja == chave["loja"])
+        .values(total_visitas=ClienteLoja.total_visitas + visitas,
+                valor_total=ClienteLoja.valor_total + valor)
+        .execution_options(synchronize_session=False)
+    )
+    if not res.rowcount:
+        db.session.execute(insert(ClienteLoja).values(**chave, total_visitas=visitas, valor_total=valor))
+    ranking.agendar_recarga()
+
+
+def _somar_diario(data_visita: datetime, loja, visitas: int, valor: float) -> None:
+    """UPSERT atômico em visitas_diarias(dia, loja)."""
+    dia = (data_visita or datetime.utcnow()).date()
+    chave = {"dia": dia, "loja": _loja_rollup(loja)}
+
+    stmt = insert_upsert(VisitaDiaria)
+    if stmt is not None:
+        stmt = stmt.values(**chave, total_visitas=visitas, valor_total=valor)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["dia", "loja"],
+            set_={
+                "total_visitas": VisitaDiaria.total_visitas + stmt.excluded.total_visitas,
+                "valor_total": VisitaDiaria.valor_total + stmt.excluded.valor_total,
+            },
+        )
+        db.session.execute(stmt)
+        return
+
+    res = db.session.execute(
+        update(VisitaDiaria)
+        .where(VisitaDiaria.dia == chave["dia"], VisitaDiaria.loja == chave["loja"])
+        .values(total_visitas=VisitaDiaria.total_visitas + visitas,
+                valor_total=VisitaDiaria.valor_total + valor)
+        .execution_options(synchronize_session=False)
+    )
+    if not res.rowcount:
+        db.session.execute(insert(VisitaDiaria).values(**chave, total_visitas=visitas, valor_total=valor))
+
+
+def visita_registrada(visita: Visita) -> None:
+    """Soma a nova visita aos agregados do cliente e ao rollup diário."""
+    marcar("visitas")
+    data = visita.data_visita or datetime.utcnow()
+    _update_cliente(
+        visita.cliente_id,
+        total_visitas=Cliente.total_visitas + 1,
+        valor_total_compras=Cliente.valor_total_compras + visita.valor_compra,
+        ultima_visita=case(
+            (Cliente.ultima_visita.is_(None), data),
+            (Cliente.ultima_visita < data, data),
+            else_=Cliente.ultima_visita,
+        ),
+    )
+    _somar_diario(data, visita.loja, 1, visita.valor_compra)
+    _somar_cliente_loja(visita.cliente_id, visita.loja, 1, visita.valor_compra)
+
+
+def visita_alterada(visita: Visita, valor_antigo: float, loja_antiga=None) -> None:
+    """Aplica a diferença de valor/loja de uma visita editada."""
+    marcar("visitas")
+    diferenca = (visita.valor_compra or 0) - (valor_antigo or 0)
+    if diferenca:
+        _update_cliente(
+            visita.cliente_id,
+            valor_total_compras=Cliente.valor_total_compras + diferenca,
+        )
+
+    if loja_antiga != visita.loja:
+        _somar_diario(visita.data_visita, loja_antiga, -1, -(valor_antigo or 0))
+        _somar_diario(visita.data_visita, visita.loja, 1, visita.valor_compra)
+        _somar_cliente_loja(visita.cliente_id, loja_antiga, -1, -(valor_antigo or 0))
+        _somar_cliente_loja(visita.cliente_id, visita.loja, 1, visita.valor_compra)
+    elif diferenca:
+        _somar_diario(visita.data_visita, visita.loja, 0, diferenca)
+        _somar_cliente_loja(visita.cliente_id, visita.loja, 0, diferenca)
+
+
+def visita_excluida(visita: Visita) -> None:
+    """Retira a visita dos agregados (chamar antes do DELETE)."""
+    marcar("visitas")
+    ultima = (
+        select(func.max(Visita.data_visita))
+        .where(Visita.cliente_id == visita.cliente_id, Visita.id != visita.id)
+        .scalar_subquery()
+    )
+    _update_cliente(
+        visita.cliente_id,
+        total_visitas=Cliente.total_visitas - 1,
+        valor_total_compras=Cliente.valor_total_compras - visita.valor_compra,
+        ultima_visita=ultima,
+    )
+    _somar_diario(visita.data_visita, visita.loja, -1, -visita.valor_compra)
+    _somar_cliente_loja(visita.cliente_id, visita.loja, -1, -visita.valor_compra)
+
+
+def visitas_registradas_lote(visitas: list[dict], pontos: dict[int, int]) -> None:
+    """
+    Versão em lote de `visita_registrada` + `pontos_alterados`.
+    visitas: [{cliente_id, valor_compra, loja, data_visita}]; pontos: {cliente_id: pontos}.
+    Um UPDATE por cliente (agregados e pontos juntos) e um UPSERT por dia/loja
+    e por cliente/loja, em vez de um conjunto de statements por visita.
+    """
+    if not visitas:
+        return
+    marcar("visitas")
+    if any(pontos.values()):
+        marcar("pontos")
+
+    por_cliente: dict = {}
+    por_dia: dict = {}
+    por_cliente_loja: dict = {}
+    for v in visitas:
+        data = v["data_visita"] or datetime.utcnow()
+        n, valor, ultima = por_cliente.get(v["cliente_id"], (0, 0.0, data))
+        por_cliente[v["cliente_id"]] = (n + 1, valor + v["valor_compra"], max(ultima, data))
+
+        chave = (data.date(), v["loja"])
+        primeira, n, valor = por_dia.get(chave, (data, 0, 0.0))
+        por_dia[chave] = (primeira, n + 1, valor + v["valor_compra"])
+
+        chave = (v["cliente_id"], v["loja"])
+        n, valor = por_cliente_loja.get(chave, (0, 0.0))
+        por_cliente_loja[chave] = (n + 1, valor + v["valor_compra"])
+
+    for cliente_id, (n, valor, ultima) in por_cliente.items():
+        valores = dict(
+            total_visitas=Cliente.total_visitas + n,
+            valor_total_compras=Cliente.valor_total_compras + valor,
+            ultima_visita=case(
+                (Cliente.ultima_visita.is_(None), ultima),
+                (Cliente.ultima_visita < ultima, ultima),
+                else_=Cliente.ultima_visita,
+            ),
+        )
+        if pontos.get(cliente_id):
+            valores["pontos_totais"] = Cliente.pontos_totais + pontos[cliente_id]
+        _update_cliente(cliente_id, **valores)
+
+    for (_dia, loja), (data, n, valor) in por_dia.items():
+        _somar_diario(data, loja, n, valor)
+    for (cliente_id, loja), (n, valor) in por_cliente_loja.items():
+        _somar_cliente_loja(cliente_id, loja, n, valor)
+
+
+def pontos_alterados(cliente_id: int, pontos: int) -> None:
+    """Mantém clientes.pontos_totais em linha com a soma de `pontos`."""
+    if not pontos:
+        return
+    marcar("pontos")
+    _update_cliente(cliente_id, pontos_totais=Cliente.pontos_totais + pontos)
+
+
+def reconciliar_clientes(lote: int = 5000) -> int:
+    """
+    Recalcula todos os agregados a partir de `visitas` e `pontos`, em lotes de ids
+    (um commit por lote, para não segurar uma transação gigante).
+    Retorna a quantidade de clientes processados.
+    """
+    total = 0
+    ultimo_id = 0
+    while True:
+        ids = db.session.execute(
+            select(Cliente.id)
+            .where(Cliente.id > ultimo_id)
+            .order_by(Cliente.id)
+            .limit(lote)
+        ).scalars().all()
+        if not ids:
+            break
+
+        visitas = select(Visita).where(Visita.cliente_id == Cliente.id)
+        stmt = (
+            update(Cliente)
+            .where(Cliente.id.between(ids[0], ids[-1]))
+            .values(
+                total_visitas=visitas.with_only_columns(func.count(Visita.id)).scalar_subquery(),
+                valor_total_compras=visitas.with_only_columns(
+                    func.coalesce(func.sum(Visita.valor_compra), 0)
+                ).scalar_subquery(),
+                ultima_visita=visitas.with_only_columns(func.max(Visita.data_visita)).scalar_subquery(),
+                pontos_totais=select(func.coalesce(func.sum(Ponto.pontos_acumulados), 0))
+                .where(Ponto.cliente_id == Cliente.id)
+                .scalar_subquery(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+        total += len(ids)
+        ultimo_id = ids[-1]
+    return total
+
+
+def reconstruir_visitas_diarias() -> int:
+    """Recalcula visitas_diarias inteira a partir de `visitas`. Retorna o nº de linhas."""
+    dia = func.date(Visita.data_visita)
+    loja = func.coalesce(cast(Visita.loja, String), "")
+    origem = (
+        select(dia, loja, func.count(Visita.id), func.coalesce(func.sum(Visita.valor_compra), 0))
+        .where(Visita.data_visita.isnot(None))
+        .group_by(dia, loja)
+    )
+    db.session.execute(delete(VisitaDiaria))
+    db.session.execute(
+        insert(VisitaDiaria).from_select(
+            ["dia", "loja", "total_visitas", "valor_total"], origem
+        )
+    )
+    db.session.commit()
+    return db.session.query(func.count()).select_from(VisitaDiaria).scalar()
+
+
+def reconstruir_clientes_lojas() -> int:
+    """Recalcula clientes_lojas inteira a partir de `visitas`. Retorna o nº de linhas."""
+    loja = func.coalesce(cast(Visita.loja, String), "")
+    origem = (
+        select(Visita.cliente_id, loja, func.count(Visita.id),
+               func.coalesce(func.sum(Visita.valor_compra), 0))
+        .group_by(Visita.cliente_id, loja)
+    )
+    db.session.execute(delete(ClienteLoja))
+    db.session.execute(
+        insert(ClienteLoja).from_select(
+            ["cliente_id", "loja", "total_visitas", "valor_total"], origem
+        )
+    )
+    db.session.commit()
+    ranking.agendar_recarga()
+    return db.session.query(func.count()).select_from(ClienteLoja).scalar()
+
+
+# ------------------------------ subida do app ------------------------------
+
+@contextmanager
+def _exclusivo(engine):
+    """Postgres: um processo por vez (advisory lock numa conexão própria)."""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _LOCK_ID})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+            conn.commit()
+
+
+def _vazia_com_visitas(modelo) -> bool:
+    """Rollup sem nenhuma linha num banco que já tem visitas (tabela recém-criada)."""
+    return db.session.execute(select(literal(1)).select_from(modelo).limit(1)).first() is None \
+        and db.session.execute(select(Visita.id).limit(1)).first() is not None
+
+
+def preencher_na_subida(engine, colunas_adicionadas=()) -> list[str]:
+    """
+    Chamado na subida, depois de `adicionar_colunas_faltantes`. Preenche o que
+    o schema novo criou vazio, sem depender de rodar os scripts à mão:
+      - colunas de agregado recém-criadas em `clientes` (nascem zeradas) ou
+        `clientes_lojas` vazia com visitas no banco: reconciliar_clientes e
+        clientes_lojas reconstruída (por último: enquanto vazia, a subida
+        seguinte refaz tudo, mesmo se esta for interrompida);
+      - `visitas_diarias` vazia com visitas no banco: reconstruída.
+    As checagens são baratas (uma linha); depois de preenchido, não faz nada.
+    Devolve o que foi preenchido.
+    """
+    novas = bool({f"clientes.{c}" for c in COLUNAS_CLIENTE} & set(colunas_adicionadas))
+    if not novas and not _vazia_com_visitas(ClienteLoja) and not _vazia_com_visitas(VisitaDiaria):
+        return []
+    feitos = []
+    with _exclusivo(engine):
+        # refeitas depois da trava: outro worker pode ter acabado de preencher
+        if novas or _vazia_com_visitas(ClienteLoja):
+            reconciliar_clientes()
+            reconstruir_clientes_lojas()
+            feitos += ["clientes", "clientes_lojas"]
+        if _vazia_com_visitas(VisitaDiaria):
+            reconstruir_visitas_diarias()
+            feitos.append("visitas_diarias")
+    return feitos
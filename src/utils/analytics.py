@@ -0,0 +1,510 @@
+# src/utils/analytics.py
+"""
+Análises sobre o histórico de visitas, vetorizadas com NumPy.
+
+As visitas são lidas numa única consulta colunar (cliente_id, epoch, valor)
+direto do cursor do driver e convertidas em arrays, ordenados por cliente e data. Os agrupamentos por
+cliente saem das fronteiras entre ids consecutivos, sem laço em Python.
+
+Os resultados ficam em memória até a próxima escrita de visita: a marca
+d'água é (max(visitas.id), versão do domínio 'visitas'), lida a cada request
+com uma consulta barata. ANALYTICS_TTL (padrão 600s) limita a defasagem de
+edições/exclusões feitas por outros processos.
+"""
+import calendar
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import Float, case, cast, extract, func, select
+
+from src.models.user import db, Cliente, Visita, LojaEnum
+from src.utils import cache
+from src.utils.sql import dialeto
+
+TTL = float(os.getenv("ANALYTICS_TTL", 600))
+LOTE_LEITURA = 100_000
+
+SEGUNDOS_DIA = 86400.0
+QUANTIS = (0.2, 0.4, 0.6, 0.8)
+
+_lock = threading.Lock()
+_resultados: dict = {}
+
+
+# ------------------------------- leitura -------------------------------
+
+def _epoch(dt: datetime) -> float:
+    return float(calendar.timegm(dt.timetuple()))
+
+
+def _restringir(stmt, loja: str | None, lojas):
+    if loja:
+        stmt = stmt.where(Visita.loja == LojaEnum[loja])
+    if lojas is not None:
+        stmt = stmt.where(Visita.loja.in_([LojaEnum[n] for n in sorted(lojas)]))
+    return stmt
+
+
+def _epoch_sql(col):
+    """Coluna DateTime em segundos desde 1970 (float), calculada no banco."""
+    if dialeto() == "sqlite":
+        return (func.julianday(col) - 2440587.5) * 86400.0
+    return cast(extract("epoch", col), Float)
+
+
+def ler_colunas(stmt, ncols: int) -> np.ndarray:
+    """
+    Executa `stmt` direto no cursor do driver e devolve uma matriz float64
+    (linhas x ncols), lida em blocos de LOTE_LEITURA. No Postgres usa cursor
+    nomeado (server-side) para não trazer tudo para a memória de uma vez.
+    Os parâmetros são renderizados como literais: use só valores internos
+    (enums, números), nunca texto vindo da request.
+    """
+    conn = db.session.connection()
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    dbapi = conn.connection.dbapi_connection
+    if dialeto() == "postgresql":
+        cur = dbapi.cursor(name="analytics_leitura")
+        cur.itersize = LOTE_LEITURA
+    else:
+        cur = dbapi.cursor()
+    try:
+        cur.execute(sql)
+        partes = []
+        while True:
+            bloco = cur.fetchmany(LOTE_LEITURA)
+            if not bloco:
+                break
+            partes.append(np.array(bloco, dtype=np.float64))
+    finally:
+        cur.close()
+    return np.concatenate(partes) if partes else np.empty((0, ncols))
+
+
+def carregar_visitas(loja: str | None = None, lojas=None):
+    """
+    (cliente_id int64, epoch float64, valor float64), ordenados por cliente e data.
+    `lojas` é a restrição de permissão (None = todas). A ordenação é feita
+    aqui (lexsort), mais barata que um ORDER BY sobre a tabela inteira.
+    """
+    stmt = _restringir(
+        select(Visita.cliente_id, _epoch_sql(Visita.data_visita), Visita.valor_compra)
+        .where(Visita.data_visita.isnot(None)),
+        loja, lojas,
+    )
+    m = ler_colunas(stmt, 3)
+    cliente_id = m[:, 0].astype(np.int64)
+    ordem = np.lexsort((m[:, 1], cliente_id))
+    return cliente_id[ordem], m[ordem, 1], m[ordem, 2]
+
+
+def marca_dagua() -> tuple:
+    """Muda a cada visita inserida (qualquer processo) ou escrita neste processo."""
+    max_id = db.session.execute(select(func.max(Visita.id))).scalar()
+    return (max_id or 0, cache.versao("visitas"))
+
+
+def em_cache(chave, marca, calcular):
+    """Resultado guardado para `chave` se a marca d'água não mudou; senão recalcula."""
+    agora = time.monotonic()
+    item = _resultados.get(chave)
+    if item is not None and item[0] == marca and item[1] > agora:
+        return item[2]
+    valor = calcular()
+    with _lock:
+        _resultados[chave] = (marca, agora + TTL, valor)
+    return valor
+
+
+def _grupos(cliente_id: np.ndarray):
+    """Ids únicos e índice de início de cada grupo (entrada ordenada por cliente)."""
+    if cliente_id.size == 0:
+        return cliente_id, np.empty(0, dtype=np.int64)
+    inicio = np.flatnonzero(np.r_[True, cliente_id[1:] != cliente_id[:-1]])
+    return cliente_id[inicio], inicio
+
+
+# ------------------------------- RFM -------------------------------
+
+SEGMENTOS = (
+    "Campeões",
+    "Leais",
+    "Potenciais leais",
+    "Novos",
+    "Precisam de atenção",
+    "Em risco",
+    "Hibernando",
+)
+
+
+def _pontuar(valores: np.ndarray, inverso: bool = False):
+    """
+    Score 1..5 por quintis de posição; `inverso` dá 5 aos menores valores
+    (recência). Empates ficam com a posição do primeiro do grupo: numa
+    frequência com 60% dos clientes em 1 visita, todos esses têm F=1 (por
+    limite de quantil, o empate no limite subiria o grupo inteiro de faixa).
+    Os limites de quantil voltam só para exibição.
+    """
+    chave = -valores if inverso else valores
+    posicao = np.searchsorted(np.sort(chave), chave, side="left")  # 0..n-1, empates juntos
+    score = (posicao * 5 // valores.size).astype(np.int8) + 1
+    return score, np.quantile(valores, QUANTIS)
+
+
+def calcular_rfm(cliente_id: np.ndarray, epoch: np.ndarray, valor: np.ndarray, referencia: float) -> dict:
+    ids, inicio = _grupos(cliente_id)
+    if ids.size == 0:
+        return {"ids": ids, "referencia": referencia, "total_visitas": 0}
+
+    frequencia = np.diff(np.r_[inicio, cliente_id.size])
+    monetario = np.add.reduceat(valor, inicio)
+    ultima = epoch[np.r_[inicio[1:], cliente_id.size] - 1]
+    recencia = np.maximum(referencia - ultima, 0) / SEGUNDOS_DIA
+
+    r, lim_r = _pontuar(recencia, inverso=True)
+    f, lim_f = _pontuar(frequencia)
+    m, lim_m = _pontuar(monetario)
+
+    segmento = np.select(
+        [
+            (r >= 4) & (f >= 4) & (m >= 4),
+            (r >= 3) & (f >= 4),
+            (r >= 4) & (f >= 2),
+            (r >= 4),
+            (r == 3),
+            (f >= 3),
+        ],
+        np.arange(6),
+        default=6,
+    ).astype(np.int8)
+
+    return {
+        "ids": ids,
+        "recencia": recencia,
+        "frequencia": frequencia,
+        "monetario": monetario,
+        "r": r, "f": f, "m": m,
+        "segmento": segmento,
+        "limites": {
+            "recencia_dias": lim_r.round(2).tolist(),
+            "frequencia": lim_f.round(2).tolist(),
+            "monetario": lim_m.round(2).tolist(),
+        },
+        "referencia": referencia,
+        "total_visitas": int(cliente_id.size),
+    }
+
+
+def rfm(loja: str | None = None, lojas=None) -> dict:
+    """RFM (arrays por cliente) das visitas visíveis; em cache até a próxima escrita."""
+    chave = ("rfm", loja, tuple(sorted(lojas)) if lojas is not None else None)
+
+    def calcular():
+        cid, epoch, valor = carregar_visitas(loja, lojas)
+        return calcular_rfm(cid, epoch, valor, _epoch(datetime.utcnow()))
+
+    return em_cache(chave, marca_dagua(), calcular)
+
+
+def resumo_segmentos(res: dict) -> list[dict]:
+    if res["ids"].size == 0:
+        return [{"segmento": nome, "clientes": 0, "valor_total": 0.0,
+                 "recencia_media_dias": None, "frequencia_media": None} for nome in SEGMENTOS]
+
+    seg = res["segmento"]
+    n = len(SEGMENTOS)
+    clientes = np.bincount(seg, minlength=n)
+    valor = np.bincount(seg, weights=res["monetario"], minlength=n)
+    recencia = np.bincount(seg, weights=res["recencia"], minlength=n)
+    frequencia = np.bincount(seg, weights=res["frequencia"], minlength=n)
+
+    out = []
+    for i, nome in enumerate(SEGMENTOS):
+        c = int(clientes[i])
+        out.append({
+            "segmento": nome,
+            "clientes": c,
+            "valor_total": round(float(valor[i]), 2),
+            "recencia_media_dias": round(float(recencia[i] / c), 1) if c else None,
+            "frequencia_media": round(float(frequencia[i] / c), 2) if c else None,
+        })
+    return out
+
+
+def membros_segmento(res: dict, segmento: str, page: int, per_page: int) -> dict:
+    """Página de clientes do segmento, do maior para o menor valor gasto."""
+    if segmento not in SEGMENTOS:
+        raise ValueError("Segmento inválido")
+    if res["ids"].size == 0:
+        return {"segmento": segmento, "clientes": [], "total": 0, "page": page, "per_page": per_page}
+
+    idx = np.flatnonzero(res["segmento"] == SEGMENTOS.index(segmento))
+    idx = idx[np.argsort(-res["monetario"][idx], kind="stable")]
+    pagina = idx[(page - 1) * per_page: page * per_page]
+
+    ids = res["ids"][pagina].tolist()
+    nomes = dict(db.session.execute(
+        select(Cliente.id, Cliente.nome).where(Cliente.id.in_(ids))
+    ).all()) if ids else {}
+
+    return {
+        "segmento": segmento,
+        "clientes": [
+            {
+                "id": cid,
+                "nome": nomes.get(cid),
+                "recencia_dias": round(float(res["recencia"][i]), 1),
+                "frequencia": int(res["frequencia"][i]),
+                "monetario": round(float(res["monetario"][i]), 2),
+                "score": f"{res['r'][i]}{res['f'][i]}{res['m'][i]}",
+            }
+            for cid, i in zip(ids, pagina.tolist())
+        ],
+        "total": int(idx.size),
+        "page": page,
+        "per_page": per_page,
+    }
+
+
+# ------------------------------- coortes -------------------------------
+#
+# Coorte = mês de cadastro do cliente (e, opcionalmente, a loja da primeira
+# visita). A matriz conta, para cada coorte e cada deslocamento k em meses,
+# quantos clientes da coorte visitaram alguma loja no mês coorte + k.
+#
+# O artefato (em memória e em ANALYTICS_DIR/coortes.npz) guarda:
+#   cli_id / cli_mes / cli_loja  por cliente (loja da 1ª visita, ou SEM_VISITA);
+#   base[l, c, k]                contagens dos meses fechados (< mes_aberto);
+#   aberto[l, c]                 contagens do mês corrente (mes_aberto).
+# A atualização lê só os clientes novos e as visitas desde o início do mês
+# aberto: meses fechados não são relidos. Visitas retroativas, edições e
+# exclusões em meses fechados só entram num recálculo completo.
+
+ANALYTICS_DIR = os.getenv(
+    "ANALYTICS_DIR", os.path.join(tempfile.gettempdir(), "fidelidade_analytics")
+)
+
+LOJAS = list(LojaEnum)
+SEM_LOJA = len(LOJAS)        # 1ª visita sem loja informada
+SEM_VISITA = len(LOJAS) + 1  # cliente ainda sem visitas
+N_GRUPOS = len(LOJAS) + 2
+
+_coortes: dict = {}
+_lock_coortes = threading.Lock()
+
+
+def _mes(epoch: np.ndarray) -> np.ndarray:
+    """Epoch (s) -> meses desde 1970-01."""
+    return epoch.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+
+
+def _inicio_mes(mes: int) -> datetime:
+    return np.datetime64(int(mes), "M").astype("datetime64[s]").item()
+
+
+def rotulo_mes(mes: int) -> str:
+    return str(np.datetime64(int(mes), "M"))
+
+
+def _codigo_loja():
+    return case(
+        *[(Visita.loja == loja, i) for i, loja in enumerate(LOJAS)],
+        else_=SEM_LOJA,
+    )
+
+
+def _caminho_coortes() -> str:
+    return os.path.join(ANALYTICS_DIR, "coortes.npz")
+
+
+def _salvar_coortes(art: dict) -> None:
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+    destino = _caminho_coortes()
+    tmp = destino + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **{k: np.asarray(v) for k, v in art.items()})
+    os.replace(tmp, destino)
+
+
+def _abrir_coortes() -> dict | None:
+    try:
+        with np.load(_caminho_coortes()) as z:
+            art = {k: z[k] for k in z.files}
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+    for k in ("mes0", "mes_aberto", "max_cliente_id"):
+        art[k] = int(art[k])
+    art["marca"] = tuple(int(x) for x in art["marca"])
+    return art
+
+
+def _vazio() -> dict:
+    return {
+        "cli_id": np.empty(0, dtype=np.int64),
+        "cli_mes": np.empty(0, dtype=np.int64),
+        "cli_loja": np.empty(0, dtype=np.int8),
+        "base": np.zeros((N_GRUPOS, 0, 0), dtype=np.int64),
+        "aberto": np.zeros((N_GRUPOS, 0), dtype=np.int64),
+        "mes0": 0,
+        "mes_aberto": -1,   # nada processado ainda
+        "max_cliente_id": 0,
+        "marca": (0, 0, 0),
+    }
+
+
+def _crescer(art: dict, n: int) -> None:
+    """Garante matrizes para n coortes (e n deslocamentos)."""
+    atual = art["base"].shape[1]
+    if n <= atual:
+        return
+    base = np.zeros((N_GRUPOS, n, n), dtype=np.int64)
+    base[:, :atual, :atual] = art["base"]
+    aberto = np.zeros((N_GRUPOS, n), dtype=np.int64)
+    aberto[:, :atual] = art["aberto"]
+    art["base"], art["aberto"] = base, aberto
+
+
+def _atualizar_coortes(art: dict, agora: datetime, marca: tuple) -> dict:
+    cur = int(_mes(np.array([_epoch(agora)]))[0])
+    primeira_carga = art["mes_aberto"] < 0
+
+    # 1) clientes novos (ids crescentes: só anexar)
+    novos = ler_colunas(
+        select(Cliente.id, _epoch_sql(Cliente.data_cadastro))
+        .where(Cliente.id > art["max_cliente_id"], Cliente.data_cadastro.isnot(None))
+        .order_by(Cliente.id),
+        2,
+    )
+    if novos.size:
+        mes_novos = _mes(novos[:, 1])
+        if primeira_carga:
+            art["mes0"] = int(mes_novos.min())
+        elif mes_novos.min() < art["mes0"]:
+            # cadastro retroativo anterior à 1ª coorte: refaz tudo
+            return _atualizar_coortes(_vazio(), agora, marca)
+        art["cli_id"] = np.r_[art["cli_id"], novos[:, 0].astype(np.int64)]
+        art["cli_mes"] = np.r_[art["cli_mes"], mes_novos]
+        art["cli_loja"] = np.r_[art["cli_loja"], np.full(len(novos), SEM_VISITA, dtype=np.int8)]
+        art["max_cliente_id"] = int(art["cli_id"][-1])
+    if art["cli_id"].size == 0:
+        art["marca"] = marca
+        return art
+    if primeira_carga:
+        art["mes_aberto"] = art["mes0"]
+
+    _crescer(art, cur - art["mes0"] + 1)
+
+    # 2) visitas desde o início do mês aberto (na 1ª carga, todas)
+    stmt = select(Visita.cliente_id, _epoch_sql(Visita.data_visita), _codigo_loja()) \
+        .where(Visita.data_visita.isnot(None))
+    if not primeira_carga:
+        stmt = stmt.where(Visita.data_visita >= _inicio_mes(art["mes_aberto"]))
+    v = ler_colunas(stmt, 3)
+
+    pos = np.searchsorted(art["cli_id"], v[:, 0].astype(np.int64))
+    pos = np.minimum(pos, art["cli_id"].size - 1)
+    # só clientes conhecidos; visitas com data futura ficam de fora
+    conhecido = (art["cli_id"][pos] == v[:, 0].astype(np.int64)) & (v[:, 1] <= _epoch(agora))
+    idx, epoch, loja = pos[conhecido], v[conhecido, 1], v[conhecido, 2].astype(np.int8)
+
+    # loja da 1ª visita para quem ainda não tinha nenhuma
+    ordem = np.lexsort((epoch, idx))
+    idx_o = idx[ordem]
+    inicio = np.flatnonzero(np.r_[True, idx_o[1:] != idx_o[:-1]]) if idx_o.size else idx_o
+    primeiros, loja_primeira = idx_o[inicio], loja[ordem][inicio]
+    sem = art["cli_loja"][primeiros] == SEM_VISITA
+    art["cli_loja"][primeiros[sem]] = loja_primeira[sem]
+
+    # 3) pares distintos (cliente, mês) -> células (grupo, coorte, deslocamento)
+    pares = np.unique(idx.astype(np.int64) * (cur + 1) + _mes(epoch))
+    p_idx, p_mes = pares // (cur + 1), pares % (cur + 1)
+    coorte = art["cli_mes"][p_idx] - art["mes0"]
+    desloc = p_mes - art["cli_mes"][p_idx]
+    ok = desloc >= 0
+    p_idx, p_mes, coorte, desloc = p_idx[ok], p_mes[ok], coorte[ok], desloc[ok]
+    grupo = art["cli_loja"][p_idx].astype(np.int64)
+
+    n = art["base"].shape[1]
+    fechado = p_mes < cur
+    art["base"] += np.bincount(
+        (grupo[fechado] * n + coorte[fechado]) * n + desloc[fechado],
+        minlength=N_GRUPOS * n * n,
+    ).reshape(N_GRUPOS, n, n)
+    art["aberto"] = np.bincount(
+        grupo[~fechado] * n + coorte[~fechado], minlength=N_GRUPOS * n
+    ).reshape(N_GRUPOS, n)
+
+    art["mes_aberto"] = cur
+    art["marca"] = marca
+    return art
+
+
+def _marca_coortes() -> tuple:
+    max_cli = db.session.execute(select(func.max(Cliente.id))).scalar()
+    return marca_dagua() + (max_cli or 0,)
+
+
+def coortes(recalcular: bool = False) -> dict:
+    """Artefato de coortes atualizado (incremental, salvo em ANALYTICS_DIR)."""
+    marca = _marca_coortes()
+    with _lock_coortes:
+        art = None if recalcular else (_coortes.get("art") or _abrir_coortes())
+        if art is not None and art["marca"] == marca:
+            _coortes["art"] = art
+            return art
+        art = _atualizar_coortes(art or _vazio(), datetime.utcnow(), marca)
+        _salvar_coortes(art)
+        _coortes["art"] = art
+        return art
+
+
+def matriz_coortes(art: dict, por_loja: bool = False, lojas=None, meses: int | None = None) -> list[dict]:
+    """
+    Linhas da matriz: {mes, [loja], clientes, ativos[k], retencao[k]}.
+    `lojas` (restrição de permissão) limita as linhas às lojas da 1ª visita permitidas.
+    """
+    if art["cli_id"].size == 0:
+        return []
+    n = art["base"].shape[1]
+    cont = art["base"].copy()
+    c = np.arange(n)
+    k = art["mes_aberto"] - art["mes0"] - c
+    valido = k >= 0
+    cont[:, c[valido], k[valido]] += art["aberto"][:, c[valido]]
+
+    tamanhos = np.bincount(
+        art["cli_loja"].astype(np.int64) * n + (art["cli_mes"] - art["mes0"]),
+        minlength=N_GRUPOS * n,
+    ).reshape(N_GRUPOS, n)
+
+    if por_loja:
+        grupos = [g for g in range(N_GRUPOS)
+                  if lojas is None or (g < len(LOJAS) and LOJAS[g].name in lojas)]
+    else:
+        grupos = [None]
+        cont, tamanhos = cont.sum(axis=0, keepdims=True), tamanhos.sum(axis=0, keepdims=True)
+
+    primeira = 0 if not meses else max(0, n - meses)
+    linhas = []
+    for g in grupos:
+        gi = 0 if g is None else g
+        for ci in range(primeira, n):
+            total = int(tamanhos[gi, ci])
+            if not total:
+                continue
+            ativos = cont[gi, ci, : n - ci]
+            linha = {"mes": rotulo_mes(art["mes0"] + ci)}
+            if g is not None:
+                linha["loja"] = (LOJAS[g].value if g < len(LOJAS)
+                                 else "Sem loja" if g == SEM_LOJA else None)
+            linha.update({
+                "clientes": total,
+                "ativos": ativos.tolist(),
+                "retencao": (ativos / total).round(4).tolist(),
+            })
+            linhas.append(linha)
+    return linhas
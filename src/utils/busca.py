@@ -0,0 +1,206 @@
+# src/utils/busca.py
+"""
+Motor de busca de clientes (autocomplete, /clientes/buscar, /clientes/cpf).
+
+Cada cliente tem a coluna `busca` = nome sem acento em minúsculas + dígitos
+do CPF + dígitos do telefone, mantida por eventos do ORM. A consulta usa:
+  - Postgres com pg_trgm: índices GIN trigram + btree text_pattern_ops em `busca`
+    (criados por reindexar_busca.py);
+  - SQLite: tabela FTS5 `clientes_fts` (external content + triggers);
+  - demais casos: LIKE em `busca` (sem índice, só para não quebrar).
+
+Ranking: CPF exato, depois prefixo (nome ou CPF), depois fuzzy/substring.
+"""
+import re
+from unicodedata import normalize as ucnorm
+
+from sqlalchemy import case, event, func, or_, select, text
+
+from src.models.user import db, Cliente
+
+# estratégia escolhida em preparar_busca(): 'trgm' | 'fts5' | 'like'
+_estrategia = "like"
+
+_RE_ESPACO = re.compile(r"\s+")
+_RE_NAO_PALAVRA = re.compile(r"[^\w\s]")
+
+
+def _only_digits(s) -> str:
+    return re.sub(r"\D", "", s or "")
+
+
+def normalizar_texto(s: str) -> str:
+    """'  José  da SILVA ' -> 'jose da silva'"""
+    s = ucnorm("NFKD", s or "").encode("ASCII", "ignore").decode("ASCII").lower()
+    s = _RE_NAO_PALAVRA.sub(" ", s)
+    return _RE_ESPACO.sub(" ", s).strip()
+
+
+def texto_busca(nome, cpf, telefone) -> str:
+    partes = [normalizar_texto(nome), _only_digits(cpf), _only_digits(telefone)]
+    return " ".join(p for p in partes if p)
+
+
+@event.listens_for(Cliente, "before_insert")
+@event.listens_for(Cliente, "before_update")
+def _atualizar_coluna_busca(mapper, connection, target):
+    target.busca = texto_busca(target.nome, target.cpf, target.telefone)
+
+
+# ------------------------- preparação / índices -------------------------
+
+_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS clientes_fts USING fts5(
+        busca, content='clientes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS clientes_fts_ai AFTER INSERT ON clientes BEGIN
+        INSERT INTO clientes_fts(rowid, busca) VALUES (new.id, new.busca);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS clientes_fts_ad AFTER DELETE ON clientes BEGIN
+        INSERT INTO clientes_fts(clientes_fts, rowid, busca) VALUES ('delete', old.id, old.busca);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS clientes_fts_au AFTER UPDATE OF busca ON clientes BEGIN
+        INSERT INTO clientes_fts(clientes_fts, rowid, busca) VALUES ('delete', old.id, old.busca);
+        INSERT INTO clientes_fts(rowid, busca) VALUES (new.id, new.busca);
+    END""",
+]
+
+_PG_INDICES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clientes_busca_trgm "
+    "ON clientes USING gin (busca gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clientes_busca_prefixo "
+    "ON clientes (busca text_pattern_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_clientes_cpf_prefixo "
+    "ON clientes (cpf text_pattern_ops)",
+]
+
+
+def preparar_busca(engine) -> str:
+    """
+    Chamado na subida do app. Preenche `busca` dos clientes que ainda não a
+    têm (coluna recém-criada: sem isso a busca por nome não acha ninguém). No
+    SQLite cria a FTS5 (barato); no Postgres só detecta se pg_trgm está
+    instalado — os índices são criados por reindexar_busca.py, fora do
+    caminho de inicialização.
+    """
+    global _estrategia
+    # antes da FTS: o 'rebuild' indexaria os NULLs (e o trigger de UPDATE corrige uma FTS já existente)
+    if db.session.execute(select(Cliente.id).where(Cliente.busca.is_(None)).limit(1)).first():
+        preencher_coluna_busca()
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            existia = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='clientes_fts'"
+            )).first()
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not existia:
+                conn.execute(text("INSERT INTO clientes_fts(clientes_fts) VALUES ('rebuild')"))
+        _estrategia = "fts5"
+    elif engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            tem_trgm = conn.execute(text(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )).first()
+        _estrategia = "trgm" if tem_trgm else "like"
+    else:
+        _estrategia = "like"
+    return _estrategia
+
+
+def criar_indices_postgres(engine) -> None:
+    """CREATE EXTENSION pg_trgm + índices de busca (CONCURRENTLY, em autocommit)."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for ddl in _PG_INDICES:
+            conn.execute(text(ddl))
+
+
+def preencher_coluna_busca(lote: int = 2000, todos: bool = False) -> int:
+    """Backfill de clientes.busca (só os nulos, ou todos com todos=True)."""
+    total = 0
+    ultimo_id = 0
+    while True:
+        q = (select(Cliente.id, Cliente.nome, Cliente.cpf, Cliente.telefone)
+             .where(Cliente.id > ultimo_id)
+             .order_by(Cliente.id)
+             .limit(lote))
+        if not todos:
+            q = q.where(Cliente.busca.is_(None))
+        rows = db.session.execute(q).all()
+        if not rows:
+            break
+        db.session.execute(
+            Cliente.__table__.update()
+            .where(Cliente.__table__.c.id == db.bindparam("_id"))
+            .values(busca=db.bindparam("_busca")),
+            [{"_id": r.id, "_busca": texto_busca(r.nome, r.cpf, r.telefone)} for r in rows],
+        )
+        db.session.commit()
+        total += len(rows)
+        ultimo_id = rows[-1].id
+    return total
+
+
+# ------------------------------- consultas -------------------------------
+
+def _escape_like(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def cliente_por_cpf(cpf: str):
+    """Lookup exato por CPF (aceita máscara). Usa o índice único de `cpf`."""
+    digits = _only_digits(cpf)
+    if not digits:
+        return None
+    return Cliente.query.filter(Cliente.cpf == digits).first()
+
+
+def buscar_clientes(termo: str, limite: int = 20) -> list[Cliente]:
+    """Busca ranqueada: CPF exato > prefixo > fuzzy."""
+    termo_norm = normalizar_texto(termo)
+    digits = _only_digits(termo)
+    if not termo_norm and not digits:
+        return []
+
+    prefixo = _escape_like(termo_norm) + "%"
+    conds = [Cliente.busca.like(prefixo, escape="\\")]
+    rank_prefixo = [Cliente.busca.like(prefixo, escape="\\")]
+    if digits:
+        conds.append(Cliente.cpf == digits)
+        conds.append(Cliente.cpf.like(_escape_like(digits) + "%", escape="\\"))
+        rank_prefixo.append(Cliente.cpf.like(_escape_like(digits) + "%", escape="\\"))
+
+    whens = [(Cliente.cpf == digits, 0)] if digits else []
+    whens.append((or_(*rank_prefixo), 1))
+    ordem = [case(*whens, else_=2)]
+
+    if _estrategia == "trgm":
+        # termos curtos não têm trigramas úteis: só prefixo
+        if len(termo_norm) >= 3:
+            conds.append(Cliente.busca.like(f"%{_escape_like(termo_norm)}%", escape="\\"))
+            conds.append(Cliente.busca.op("%")(termo_norm))
+            ordem.append(func.similarity(Cliente.busca, termo_norm).desc())
+        query = Cliente.query.filter(or_(*conds))
+
+    elif _estrategia == "fts5":
+        # candidatos só pelos índices: MATCH na FTS (prefixo de cada palavra,
+        # inclusive os dígitos do CPF) UNION faixa do CPF no índice único; o
+        # LIKE em `busca` fica só no ranking, sobre os candidatos
+        tokens = termo_norm.split() or [digits]
+        expr = " AND ".join(f'"{t}"*' for t in tokens)
+        candidatos = select(text("rowid")).select_from(text("clientes_fts"))\
+            .where(text("clientes_fts MATCH :expr").bindparams(expr=expr))
+        if digits:
+            # cpf LIKE 'ddd%' como faixa: ':' vem logo depois de '9'
+            candidatos = candidatos.union(
+                select(Cliente.id).where(Cliente.cpf >= digits, Cliente.cpf < digits + ":")
+            )
+        query = Cliente.query.filter(Cliente.id.in_(candidatos))
+
+    else:
+        conds.append(Cliente.busca.like(f"%{_escape_like(termo_norm or digits)}%", escape="\\"))
+        query = Cliente.query.filter(or_(*conds))
+
+    ordem.append(Cliente.nome.asc())
+    return query.order_by(*ordem).limit(limite).all()
@@ -0,0 +1,118 @@
+# src/utils/cache.py
+"""
+Cache em memória (por processo) com TTL e invalidação dirigida por escrita.
+
+As rotas de escrita chamam `marcar('visitas')`, `marcar('clientes')` etc.
+Quando a transação comita, a versão de cada domínio marcado é incrementada;
+entradas de cache que dependem desse domínio deixam de valer na hora. O TTL
+limita o quanto um processo pode ficar defasado de escritas feitas em outros
+processos (gunicorn/serverless).
+"""
+import hashlib
+import json
+import threading
+import time
+
+from flask import jsonify, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models.user import db
+
+_CHAVE_SESSAO = "dominios_alterados"
+
+_versoes: dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def marcar(*dominios: str) -> None:
+    """Registra que a transação corrente altera os domínios informados."""
+    db.session.info.setdefault(_CHAVE_SESSAO, set()).update(dominios)
+
+
+def versao(dominio: str) -> int:
+    return _versoes.get(dominio, 0)
+
+
+def versoes(dominios) -> tuple:
+    return tuple(_versoes.get(d, 0) for d in dominios)
+
+
+def incrementar(*dominios: str) -> None:
+    with _lock:
+        for d in dominios:
+            _versoes[d] = _versoes.get(d, 0) + 1
+
+
+@event.listens_for(Session, "after_commit")
+def _apos_commit(session):
+    dominios = session.info.pop(_CHAVE_SESSAO, None)
+    if dominios:
+        incrementar(*dominios)
+
+
+@event.listens_for(Session, "after_rollback")
+def _apos_rollback(session):
+    session.info.pop(_CHAVE_SESSAO, None)
+
+
+def etag_de(valor) -> str:
+    raw = json.dumps(valor, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+class EntradaCache:
+    __slots__ = ("valor", "etag", "expira", "versoes")
+
+    def __init__(self, valor, etag, expira, versoes):
+        self.valor = valor
+        self.etag = etag
+        self.expira = expira
+        self.versoes = versoes
+
+
+class CacheTTL:
+    def __init__(self, ttl: float = 30):
+        self.ttl = ttl
+        self._itens: dict = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave, deps=()) -> EntradaCache | None:
+        entrada = self._itens.get(chave)
+        if entrada is None:
+            return None
+        if entrada.expira < time.monotonic() or entrada.versoes != versoes(deps):
+            with self._lock:
+                self._itens.pop(chave, None)
+            return None
+        return entrada
+
+    def obter_ou_calcular(self, chave, deps, calcular, ttl: float | None = None) -> EntradaCache:
+        """Devolve a entrada válida ou calcula/guarda uma nova com `calcular()`."""
+        entrada = self.obter(chave, deps)
+        if entrada is not None:
+            return entrada
+        # versões lidas antes do cálculo: uma escrita concorrente invalida o resultado
+        vs = versoes(deps)
+        valor = calcular()
+        entrada = EntradaCache(
+            valor,
+            etag_de(valor),
+            time.monotonic() + (self.ttl if ttl is None else ttl),
+            vs,
+        )
+        with self._lock:
+            self._itens[chave] = entrada
+        return entrada
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+
+
+def resposta_com_etag(entrada: EntradaCache):
+    """jsonify + ETag; devolve 304 se o cliente já tem essa versão (If-None-Match)."""
+    resp = jsonify(entrada.valor)
+    resp.set_etag(entrada.etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
@@ -0,0 +1,107 @@
+# src/utils/elegibilidade.py
+"""
+Elegibilidade de clientes para brindes, avaliada em lote.
+
+O estado do cliente (nível do saldo e `total_visitas`, o agregado mantido
+por src/utils/agregados.py) é lido uma vez, numa consulta; os brindes
+candidatos vêm numa consulta só, com campanha e produto carregados juntos.
+As regras rodam em memória, então a tela de brindes faz o mesmo número de
+consultas com 3 ou 300 brindes ativos.
+
+Regras, na ordem em que aparecem nos motivos:
+  1. campanha ativa;
+  2. agora dentro de [data_inicio, data_fim] da campanha;
+  3. brinde com quantidade disponível;
+  4. cliente com saldo de pontos registrado;
+  5. nível do cliente >= nível do brinde (Bronze < Prata < Ouro);
+  6. total de visitas >= threshold_visitas da campanha.
+"""
+from datetime import datetime
+
+from sqlalchemy.orm import contains_eager, joinedload
+
+from src.models.user import db, Brinde, Campanha, Cliente, NivelEnum, Ponto
+
+ELEGIVEL = "Cliente elegível"
+
+_ORDEM_NIVEL = {NivelEnum.BRONZE: 1, NivelEnum.PRATA: 2, NivelEnum.OURO: 3}
+
+
+class EstadoCliente:
+    __slots__ = ("cliente", "nivel", "total_visitas")
+
+    def __init__(self, cliente: Cliente, nivel: NivelEnum | None):
+        self.cliente = cliente
+        self.nivel = nivel
+        self.total_visitas = cliente.total_visitas or 0
+
+
+def estado_cliente(cliente_id: int) -> EstadoCliente | None:
+    """Cliente + nível do saldo numa consulta (None se o cliente não existe)."""
+    row = db.session.query(Cliente, Ponto.nivel_atual)\
+        .outerjoin(Ponto, Ponto.cliente_id == Cliente.id)\
+        .filter(Cliente.id == cliente_id).first()
+    return EstadoCliente(*row) if row else None
+
+
+def brindes_candidatos(agora: datetime | None = None) -> list[Brinde]:
+    """Brindes com estoque de campanhas ativas e vigentes, com campanha e produto."""
+    agora = agora or datetime.utcnow()
+    return Brinde.query.join(Brinde.campanha)\
+        .options(contains_eager(Brinde.campanha), joinedload(Brinde.produto))\
+        .filter(
+            Brinde.estoque_total > 0,
+            Campanha.ativa.is_(True),
+            Campanha.data_inicio <= agora,
+            Campanha.data_fim >= agora,
+        ).order_by(Brinde.id).all()
+
+
+def motivos(estado: EstadoCliente, brinde: Brinde, agora: datetime) -> list[str]:
+    """Todas as regras que o cliente não cumpre para o brinde (vazia = elegível)."""
+    campanha = brinde.campanha
+    out = []
+    if not campanha.ativa:
+        out.append("Campanha não está ativa")
+    if agora < campanha.data_inicio or agora > campanha.data_fim:
+        out.append("Campanha fora do período de validade")
+    if brinde.estoque_total <= 0:
+        out.append("Brinde não disponível")
+    if estado.nivel is None:
+        out.append("Cliente não possui pontos registrados")
+    elif _ORDEM_NIVEL[estado.nivel] < _ORDEM_NIVEL[brinde.nivel]:
+        out.append(f"Nível insuficiente. Necessário: {brinde.nivel.value}, Atual: {estado.nivel.value}")
+    minimo = campanha.threshold_visitas or 0
+    if estado.total_visitas < minimo:
+        out.append(f"Número de visitas insuficiente. Necessário: {minimo}, Atual: {estado.total_visitas}")
+    return out
+
+
+def avaliar(estado: EstadoCliente, brindes, agora: datetime | None = None) -> list[dict]:
+    """
+    [{'brinde', 'elegivel', 'mensagem', 'motivos'}] na ordem de `brindes`.
+    `mensagem` é o primeiro motivo (ou ELEGIVEL), como na verificação unitária.
+    """
+    agora = agora or datetime.utcnow()
+    out = []
+    for brinde in brindes:
+        falhas = motivos(estado, brinde, agora)
+        out.append({
+            "brinde": brinde,
+            "elegivel": not falhas,
+            "mensagem": falhas[0] if falhas else ELEGIVEL,
+            "motivos": falhas,
+        })
+    return out
+
+
+def verificar(cliente_id: int, brinde_id: int) -> tuple[bool, str]:
+    """Um cliente x um brinde: (elegível, mensagem)."""
+    estado = estado_cliente(cliente_id)
+    if estado is None:
+        return False, "Cliente não encontrado"
+    brinde = db.session.get(Brinde, brinde_id, options=[joinedload(Brinde.campanha)])
+    if brinde is None:
+        return False, "Brinde não encontrado"
+    r = avaliar(estado, [brinde])[0]
+    return r["elegivel"], r["mensagem"]
@@ -0,0 +1,145 @@
+# src/utils/estoque.py
+"""
+Reserva de estoque de brindes sem vender a mais.
+
+A baixa é um UPDATE condicional atômico:
+
+    UPDATE brindes SET quantidade_disponivel = quantidade_disponivel - 1
+    WHERE id = :id AND quantidade_disponivel > 0 RETURNING quantidade_disponivel
+
+Se duas reservas disputam a última unidade, o banco serializa as duas na
+linha e só uma encontra `quantidade_disponivel > 0`; não há leitura seguida
+de escrita no Python. A trava da linha vai até o commit do resgate, e o
+rollback de um resgate que falha devolve a unidade sozinho.
+
+Brindes muito disputados (lançamentos relâmpago) podem ter o estoque
+fragmentado em N slots (`brindes_estoque_slots`). Cada reserva tenta os
+slots com estoque em ordem aleatória, com o mesmo UPDATE condicional, e N
+transações deixam de esperar pela mesma linha. O total lido é
+`Brinde.estoque_total` (contador do brinde + soma dos slots).
+"""
+import random
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm.util import identity_key
+
+from src.models.user import db, Brinde, EstoqueSlot
+
+MAX_SLOTS = 64
+
+_brindes = Brinde.__table__
+_slots = EstoqueSlot.__table__
+
+_BAIXA_BRINDE = update(_brindes)\
+    .where(_brindes.c.id == bindparam("id_brinde"), _brindes.c.quantidade_disponivel > 0)\
+    .values(quantidade_disponivel=_brindes.c.quantidade_disponivel - 1)\
+    .returning(_brindes.c.quantidade_disponivel)
+
+_BAIXA_SLOT = update(_slots)\
+    .where(_slots.c.brinde_id == bindparam("id_brinde"), _slots.c.slot == bindparam("id_slot"),
+           _slots.c.quantidade > 0)\
+    .values(quantidade=_slots.c.quantidade - 1)\
+    .returning(_slots.c.quantidade)
+
+_SLOTS_COM_ESTOQUE = select(_slots.c.slot)\
+    .where(_slots.c.brinde_id == bindparam("id_brinde"), _slots.c.quantidade > 0)
+
+_SLOTS = select(_slots.c.slot).where(_slots.c.brinde_id == bindparam("id_brinde"))
+
+
+def _expirar(brinde_id: int) -> None:
+    """O Brinde carregado na sessão (se houver) relê o estoque no próximo acesso."""
+    obj = db.session.identity_map.get(identity_key(Brinde, brinde_id))
+    if obj is not None:
+        db.session.expire(obj, ["quantidade_disponivel", "estoque_total"])
+
+
+def reservar(brinde_id: int) -> bool:
+    """
+    Baixa uma unidade do brinde. False se não há estoque. Não comita: a
+    reserva vale com o commit da transação (e é desfeita pelo rollback).
+    """
+    row = db.session.execute(_BAIXA_BRINDE, {"id_brinde": brinde_id}).first()
+    if row is None:
+        # contador do brinde zerado: estoque (se houver) está nos slots
+        slots = list(db.session.execute(_SLOTS_COM_ESTOQUE, {"id_brinde": brinde_id}).scalars())
+        random.shuffle(slots)
+        for slot in slots:
+            row = db.session.execute(_BAIXA_SLOT, {"id_brinde": brinde_id, "id_slot": slot}).first()
+            if row is not None:
+                break
+    if row is None:
+        return False
+    _expirar(brinde_id)
+    return True
+
+
+def devolver(brinde_id: int, quantidade: int = 1) -> None:
+    """Devolve unidades ao estoque (num slot aleatório, se o brinde for fragmentado)."""
+    slots = list(db.session.execute(_SLOTS, {"id_brinde": brinde_id}).scalars())
+    if slots:
+        db.session.execute(
+            update(_slots)
+            .where(_slots.c.brinde_id == brinde_id, _slots.c.slot == random.choice(slots))
+            .values(quantidade=_slots.c.quantidade + quantidade)
+        )
+    else:
+        db.session.execute(
+            update(_brindes).where(_brindes.c.id == brinde_id)
+            .values(quantidade_disponivel=func.coalesce(_brindes.c.quantidade_disponivel, 0) + quantidade)
+        )
+    _expirar(brinde_id)
+
+
+def devolver_lote(quantidades: dict) -> None:
+    """
+    Devolve {brinde_id: unidades} de uma vez: um UPDATE agrupado (CASE por id)
+    nos contadores dos brindes e, para os fragmentados, um UPDATE por brinde.
+    """
+    if not quantidades:
+        return
+    fragmentados = set(db.session.execute(
+        select(_slots.c.brinde_id).where(_slots.c.brinde_id.in_(list(quantidades))).distinct()
+    ).scalars())
+    for brinde_id in fragmentados:
+        devolver(brinde_id, quantidades[brinde_id])
+    simples = {b: q for b, q in quantidades.items() if b not in fragmentados}
+    if simples:
+        db.session.execute(
+            update(_brindes).where(_brindes.c.id.in_(list(simples)))
+            .values(quantidade_disponivel=func.coalesce(_brindes.c.quantidade_disponivel, 0)
+                    + case(simples, value=_brindes.c.id, else_=0))
+        )
+        for brinde_id in simples:
+            _expirar(brinde_id)
+
+
+def definir(brinde: Brinde, quantidade: int | None = None, slots: int | None = None) -> None:
+    """
+    Define o estoque total do brinde (`quantidade`; None mantém o atual) e,
+    com `slots`, em quantos contadores ele fica (1 = só o contador do brinde).
+    Sem `slots`, mantém a fragmentação atual. Não comita.
+    """
+    atuais = db.session.execute(
+        select(func.count()).select_from(_slots).where(_slots.c.brinde_id == brinde.id)
+    ).scalar()
+    n = max(atuais, 1) if slots is None else slots
+    if n < 1 or n > MAX_SLOTS:
+        raise ValueError(f"slots deve estar entre 1 e {MAX_SLOTS}")
+    total = brinde.estoque_total if quantidade is None else quantidade
+    if total < 0:
+        raise ValueError("quantidade não pode ser negativa")
+
+    db.session.execute(delete(_slots).where(_slots.c.brinde_id == brinde.id))
+    if n <= 1:
+        brinde.quantidade_disponivel = total
+    else:
+        base, resto = divmod(total, n)
+        db.session.execute(insert(_slots), [
+            {"brinde_id": brinde.id, "slot": i, "quantidade": base + (1 if i < resto else 0)}
+            for i in range(n)
+        ])
+        brinde.quantidade_disponivel = 0
+    db.session.flush()
+    db.session.expire(brinde, ["estoque_total", "slots_estoque"])
+
@@ -0,0 +1,72 @@
+# src/utils/exportacao.py
+"""
+Geração de saída em streaming (NDJSON / CSV) para relatórios grandes.
+
+Os geradores `gerar_ndjson` / `gerar_csv` produzem blocos de texto e são usados
+tanto nas respostas HTTP em streaming quanto nos arquivos dos jobs de relatório.
+"""
+import csv
+import io
+import json
+
+from flask import Response, stream_with_context
+
+LINHAS_POR_BLOCO = 500
+LOTE_BANCO = 1000
+
+FORMATOS_STREAMING = ("ndjson", "csv")
+
+
+def linhas_do_banco(session, stmt, lote: int = LOTE_BANCO):
+    """Executa `stmt` com cursor no servidor (yield_per), sem materializar tudo."""
+    return session.execute(stmt, execution_options={"yield_per": lote})
+
+
+def gerar_ndjson(linhas):
+    buf = []
+    for linha in linhas:
+        buf.append(json.dumps(linha, ensure_ascii=False, default=str))
+        if len(buf) >= LINHAS_POR_BLOCO:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+
+def gerar_csv(colunas, linhas):
+    """`linhas` são dicts planos; `colunas` define cabeçalho e ordem."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=colunas, extrasaction="ignore")
+    writer.writeheader()
+    n = 0
+    for linha in linhas:
+        writer.writerow(linha)
+        n += 1
+        if n >= LINHAS_POR_BLOCO:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+            n = 0
+    if out.tell():
+        yield out.getvalue()
+
+
+def resposta_streaming(formato: str, linhas, colunas_csv=None, achatar=None, nome_arquivo: str = "relatorio"):
+    """
+    Response em streaming. `linhas` é um iterável de dicts; no CSV cada linha
+    passa por `achatar` (dict aninhado -> dict plano) e segue `colunas_csv`.
+    """
+    if formato == "csv":
+        planas = (achatar(l) for l in linhas) if achatar else linhas
+        corpo = gerar_csv(colunas_csv, planas)
+        mimetype = "text/csv; charset=utf-8"
+        ext = "csv"
+    else:
+        corpo = gerar_ndjson(linhas)
+        mimetype = "application/x-ndjson"
+        ext = "ndjson"
+
+    resp = Response(stream_with_context(corpo), content_type=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{nome_arquivo}.{ext}"'
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
@@ -0,0 +1,157 @@
+# src/utils/instrumentacao.py
+"""
+Instrumentação opcional de SQL por request.
+
+Ligada com SQL_INSTRUMENTACAO=1 no .env. Conta statements e tempo de banco
+de cada request, devolve nos headers X-DB-Queries / X-DB-Time-ms, grava uma
+linha de log estruturada (JSON) e sinaliza N+1 quando o mesmo formato de
+statement se repete mais que SQL_N_MAIS_1_LIMITE vezes no mesmo request.
+
+Para testes, `orcamento_queries` garante um teto de queries num bloco:
+
+    with orcamento_queries(app, 5):
+        client.get('/api/dashboard/top-clientes')
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger("fidelidade.sql")
+
+_coletores: ContextVar[tuple] = ContextVar("sql_coletores", default=())
+
+_RE_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"%\(\w+\)s|:\w+|\?|__\[POSTCOMPILE_\w+\]")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_RE_ESPACO = re.compile(r"\s+")
+
+
+def formato_statement(sql: str) -> str:
+    """Reduz um statement ao seu 'formato' (sem literais, parâmetros e listas IN)."""
+    s = _RE_LITERAL.sub("?", sql)
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_LISTA.sub("(?)", s)
+    return _RE_ESPACO.sub(" ", s).strip()
+
+
+class EstatisticasSQL:
+    def __init__(self):
+        self.queries = 0
+        self.tempo = 0.0
+        self.formatos = Counter()
+
+    def registrar(self, statement: str, duracao: float) -> None:
+        self.queries += 1
+        self.tempo += duracao
+        self.formatos[formato_statement(statement)] += 1
+
+    @property
+    def tempo_ms(self) -> float:
+        return round(self.tempo * 1000, 2)
+
+    def repetidos(self, limite: int) -> list[dict]:
+        return [
+            {"formato": fmt, "vezes": n}
+            for fmt, n in self.formatos.most_common()
+            if n > limite
+        ]
+
+
+# ------------------------- eventos do engine -------------------------
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info["_sql_inicio"] = time.perf_counter()
+
+
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    duracao = time.perf_counter() - conn.info.pop("_sql_inicio", time.perf_counter())
+
+    if has_request_context():
+        stats = g.get("_sql_stats")
+        if stats is not None:
+            stats.registrar(statement, duracao)
+    for coletor in _coletores.get():
+        coletor.registrar(statement, duracao)
+
+
+def _registrar_eventos(engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _antes):
+        event.listen(engine, "before_cursor_execute", _antes)
+        event.listen(engine, "after_cursor_execute", _depois)
+
+
+# ------------------------- integração com o Flask -------------------------
+
+def init_instrumentacao_sql(app, db) -> None:
+    """Registra os hooks se SQL_INSTRUMENTACAO estiver ligado."""
+    if not app.config.get("SQL_INSTRUMENTACAO"):
+        return
+
+    limite = int(app.config.get("SQL_N_MAIS_1_LIMITE", 10))
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+    with app.app_context():
+        _registrar_eventos(db.engine)
+
+    @app.before_request
+    def _sql_inicio_request():
+        g._sql_stats = EstatisticasSQL()
+
+    @app.after_request
+    def _sql_fim_request(resp):
+        stats = g.pop("_sql_stats", None)
+        if stats is None:
+            return resp
+
+        resp.headers["X-DB-Queries"] = str(stats.queries)
+        resp.headers["X-DB-Time-ms"] = str(stats.tempo_ms)
+
+        repetidos = stats.repetidos(limite)
+        linha = {
+            "evento": "sql_request",
+            "metodo": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": resp.status_code,
+            "queries": stats.queries,
+            "tempo_ms": stats.tempo_ms,
+        }
+        if repetidos:
+            linha["n_mais_1"] = repetidos
+            logger.warning(json.dumps(linha, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(linha, ensure_ascii=False))
+        return resp
+
+
+@contextmanager
+def orcamento_queries(app, maximo: int):
+    """
+    Helper de teste: falha (AssertionError) se o bloco executar mais de
+    `maximo` statements. Funciona mesmo com SQL_INSTRUMENTACAO desligado.
+    """
+    from src.models.user import db
+
+    with app.app_context():
+        _registrar_eventos(db.engine)
+
+    stats = EstatisticasSQL()
+    token = _coletores.set(_coletores.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _coletores.reset(token)
+
+    if stats.queries > maximo:
+        formatos = "\n".join(f"  {n}x {fmt}" for fmt, n in stats.formatos.most_common(5))
+        raise AssertionError(
+            f"Orçamento de queries estourado: {stats.queries} > {maximo}\n{formatos}"
+        )
@@ -0,0 +1,192 @@
+# src/utils/jobs.py
+"""
+Jobs de relatório em background.
+
+Cada job roda num ThreadPoolExecutor pequeno (RELATORIOS_WORKERS, padrão 2),
+com fila limitada (RELATORIOS_FILA_MAX, padrão 8): relatórios nunca ocupam
+mais que esse número de threads/conexões do pool, e o excesso é recusado
+(FilaCheia -> 429) em vez de acumular.
+
+O resultado vai para RELATORIOS_DIR como `<id>.csv.gz` / `<id>.ndjson.gz`,
+escrito em blocos. O estado (status, progresso, erro) fica num arquivo JSON
+ao lado (`<id>.json`), então qualquer processo que enxergue o diretório
+consegue responder o polling.
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from src.utils.exportacao import gerar_csv, gerar_ndjson
+
+RELATORIOS_DIR = os.getenv(
+    "RELATORIOS_DIR", os.path.join(tempfile.gettempdir(), "fidelidade_relatorios")
+)
+WORKERS = int(os.getenv("RELATORIOS_WORKERS", 2))
+FILA_MAX = int(os.getenv("RELATORIOS_FILA_MAX", 8))
+RETENCAO_HORAS = float(os.getenv("RELATORIOS_RETENCAO_HORAS", 24))
+
+# progresso gravado no sidecar a cada N linhas
+INTERVALO_PROGRESSO = 5000
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{32}$")
+
+# linhas(filtros, lojas) -> iterável de dicts; contar(filtros, lojas) -> int | None
+TipoRelatorio = namedtuple("TipoRelatorio", "linhas contar colunas achatar")
+
+
+class FilaCheia(RuntimeError):
+    pass
+
+
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+_ativos = 0
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="relatorio")
+    return _executor
+
+
+# ------------------------------- sidecar -------------------------------
+
+def _caminho(job_id: str, ext: str) -> str:
+    return os.path.join(RELATORIOS_DIR, f"{job_id}.{ext}")
+
+
+def _gravar_estado(estado: dict) -> None:
+    destino = _caminho(estado["id"], "json")
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(tmp, destino)
+
+
+def obter(job_id: str) -> dict | None:
+    if not _ID_VALIDO.match(job_id or ""):
+        return None
+    try:
+        with open(_caminho(job_id, "json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def arquivo_resultado(estado: dict) -> str | None:
+    if estado.get("status") != "concluido":
+        return None
+    caminho = _caminho(estado["id"], f"{estado['formato']}.gz")
+    return caminho if os.path.exists(caminho) else None
+
+
+def _limpar_antigos() -> None:
+    """Remove resultados/sidecars mais velhos que RELATORIOS_RETENCAO_HORAS."""
+    limite = time.time() - RETENCAO_HORAS * 3600
+    try:
+        nomes = os.listdir(RELATORIOS_DIR)
+    except FileNotFoundError:
+        return
+    for nome in nomes:
+        caminho = os.path.join(RELATORIOS_DIR, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+# ------------------------------- execução -------------------------------
+
+def _executar(app, estado: dict, tipo: TipoRelatorio, filtros, lojas) -> None:
+    global _ativos
+    parcial = _caminho(estado["id"], f"{estado['formato']}.gz.parcial")
+    try:
+        with app.app_context():
+            estado.update(status="executando", iniciado_em=datetime.utcnow().isoformat())
+            if tipo.contar is not None:
+                estado["total"] = tipo.contar(filtros, lojas)
+            _gravar_estado(estado)
+
+            def contadas(linhas):
+                for linha in linhas:
+                    estado["linhas"] += 1
+                    if estado["linhas"] % INTERVALO_PROGRESSO == 0:
+                        _gravar_estado(estado)
+                    yield linha
+
+            linhas = contadas(tipo.linhas(filtros, lojas))
+            if estado["formato"] == "csv":
+                planas = (tipo.achatar(l) for l in linhas) if tipo.achatar else linhas
+                blocos = gerar_csv(tipo.colunas, planas)
+            else:
+                blocos = gerar_ndjson(linhas)
+
+            with gzip.open(parcial, "wt", encoding="utf-8", newline="") as f:
+                for bloco in blocos:
+                    f.write(bloco)
+            os.replace(parcial, _caminho(estado["id"], f"{estado['formato']}.gz"))
+
+            estado.update(status="concluido", concluido_em=datetime.utcnow().isoformat())
+            _gravar_estado(estado)
+    except Exception as e:
+        estado.update(status="erro", erro=str(e), concluido_em=datetime.utcnow().isoformat())
+        _gravar_estado(estado)
+        try:
+            os.remove(parcial)
+        except OSError:
+            pass
+    finally:
+        # a sessão do job é descartada pelo teardown do app context
+        with _lock:
+            _ativos -= 1
+
+
+def enfileirar(app, usuario_id: int, nome: str, tipo: TipoRelatorio, formato: str,
+               parametros: dict, filtros, lojas) -> dict:
+    """
+    Cria o job e o agenda no pool. `filtros` já validados e `lojas` (restrição
+    de permissão) resolvidos na request; `parametros` são os originais, só para
+    registro. Levanta FilaCheia se já houver FILA_MAX jobs pendentes/rodando.
+    """
+    global _ativos
+    with _lock:
+        if _ativos >= FILA_MAX:
+            raise FilaCheia("Fila de relatórios cheia, tente novamente em instantes")
+        _ativos += 1
+
+    try:
+        os.makedirs(RELATORIOS_DIR, exist_ok=True)
+        _limpar_antigos()
+
+        estado = {
+            "id": uuid.uuid4().hex,
+            "relatorio": nome,
+            "formato": formato,
+            "parametros": parametros,
+            "lojas": sorted(lojas) if lojas is not None else None,
+            "usuario_id": usuario_id,
+            "status": "pendente",
+            "linhas": 0,
+            "total": None,
+            "erro": None,
+            "criado_em": datetime.utcnow().isoformat(),
+            "iniciado_em": None,
+            "concluido_em": None,
+        }
+        _gravar_estado(estado)
+        _pool().submit(_executar, app, dict(estado), tipo, filtros, lojas)
+        return estado
+    except Exception:
+        with _lock:
+            _ativos -= 1
+        raise
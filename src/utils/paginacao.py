@@ -0,0 +1,171 @@
+# src/utils/paginacao.py
+"""
+Paginação por cursor (keyset) para os endpoints de listagem.
+
+Ativada quando a request traz `?cursor=` (vazio = primeira página). Em vez de
+OFFSET + COUNT(*), filtra pela última chave vista, então qualquer página custa
+o mesmo que a primeira. O total passa a ser opcional:
+    ?total=1          -> COUNT(*) exato
+    ?total=estimado   -> pg_class.reltuples (Postgres, só sem filtros)
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from flask import request
+from sqlalchemy import and_, or_, text, tuple_
+
+from src.models.user import db
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def modo_cursor() -> bool:
+    """True se a request pediu paginação por cursor."""
+    return "cursor" in request.args
+
+
+def _encode(valores) -> str:
+    def conv(v):
+        return v.isoformat() if isinstance(v, (datetime, date)) else v
+    raw = json.dumps([conv(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str, chaves) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(raw)
+    except Exception:
+        raise CursorInvalido("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != len(chaves):
+        raise CursorInvalido("Cursor inválido")
+
+    out = []
+    for i, ((col, _desc), v) in enumerate(zip(chaves, valores)):
+        if v is None:
+            # só a 1ª chave pode ser anulável (ver _segmentos)
+            if i or not _anulavel(col):
+                raise CursorInvalido("Cursor inválido")
+            out.append(None)
+            continue
+        tipo = col.type.python_type
+        try:
+            if tipo is datetime:
+                v = datetime.fromisoformat(v)
+            elif tipo is date:
+                v = date.fromisoformat(v)
+            else:
+                v = tipo(v)
+        except (TypeError, ValueError):
+            raise CursorInvalido("Cursor inválido")
+        out.append(v)
+    return out
+
+
+def _anulavel(col) -> bool:
+    return bool(getattr(col.expression, "nullable", False))
+
+
+def _nulos_primeiro(desc: bool) -> bool:
+    """
+    Se os NULLs vêm antes dos valores na ordenação da coluna. O Postgres trata
+    NULL como maior que qualquer valor; SQLite e MySQL, como menor.
+    """
+    maiores = db.session.get_bind().dialect.name not in ("sqlite", "mysql", "mariadb")
+    return maiores == desc
+
+
+def _depois(chaves, valores):
+    """
+    Linhas depois da chave (x, y), sem NULLs. Com todas as colunas na mesma
+    direção: (a, b) < (x, y) como row value, que o banco lê como faixa do
+    índice. Senão, a < x OR (a = x AND b > y) mais o limite `a <= x` na 1ª
+    coluna, para o índice ainda começar a leitura no cursor.
+    """
+    col0, desc0 = chaves[0]
+    if len(chaves) == 1:
+        return col0 < valores[0] if desc0 else col0 > valores[0]
+    if all(desc == desc0 for _, desc in chaves):
+        cols, vals = tuple_(*[c for c, _ in chaves]), tuple_(*valores)
+        return cols < vals if desc0 else cols > vals
+    conds = []
+    for i, (col, desc) in enumerate(chaves):
+        iguais = [c == v for (c, _), v in zip(chaves[:i], valores[:i])]
+        conds.append(and_(*iguais, col < valores[i] if desc else col > valores[i]))
+    limite = col0 <= valores[0] if desc0 else col0 >= valores[0]
+    return and_(limite, or_(*conds))
+
+
+def _segmentos(chaves, valores) -> list:
+    """
+    Condições das linhas depois do cursor, em ordem: a página lê cada uma até
+    completar. Só a 1ª chave pode ser NULL; os NULLs dela formam um segmento
+    à parte (antes ou depois dos valores, conforme o dialeto), para a faixa
+    dos valores continuar usando o índice sem `OR coluna IS NULL`.
+    """
+    col0, desc0 = chaves[0]
+    nulos_primeiro = _nulos_primeiro(desc0)
+    if valores[0] is None:
+        segs = [and_(col0.is_(None), _depois(chaves[1:], valores[1:]))] if len(chaves) > 1 else []
+        if nulos_primeiro:
+            segs.append(col0.isnot(None))
+        return segs
+    segs = [_depois(chaves, valores)]
+    if _anulavel(col0) and not nulos_primeiro:
+        segs.append(col0.is_(None))
+    return segs
+
+
+def _total(query, tabela) -> dict:
+    pedido = (request.args.get("total") or "").lower()
+    if not pedido or pedido in ("0", "false"):
+        return {}
+    if pedido == "estimado" and query.whereclause is None \
+            and db.session.get_bind().dialect.name == "postgresql":
+        est = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+            {"t": tabela},
+        ).scalar()
+        if est is not None and est >= 0:
+            return {"total_estimado": int(est)}
+    return {"total": query.order_by(None).count()}
+
+
+def pagina_por_cursor(query, chaves, chave_lista: str, serializar, per_page: int) -> dict:
+    """
+    Executa `query` em modo keyset.
+    chaves: [(coluna, desc: bool), ...] — a última deve ser única (ex.: id);
+    só a primeira pode ser anulável.
+    Retorna {chave_lista: [...], 'next_cursor': str|None, 'per_page': n, [total]}.
+    Levanta CursorInvalido se o cursor recebido não puder ser lido.
+    """
+    per_page = max(1, min(per_page, 200))
+    cursor = request.args.get("cursor") or ""
+
+    ordem = [col.desc() if desc else col.asc() for col, desc in chaves]
+    if cursor:
+        itens = []
+        for cond in _segmentos(chaves, _decode(cursor, chaves)):
+            itens += query.filter(cond).order_by(*ordem).limit(per_page + 1 - len(itens)).all()
+            if len(itens) > per_page:
+                break
+    else:
+        itens = query.order_by(*ordem).limit(per_page + 1).all()
+    tem_mais = len(itens) > per_page
+    itens = itens[:per_page]
+
+    next_cursor = None
+    if tem_mais:
+        ultimo = itens[-1]
+        next_cursor = _encode([getattr(ultimo, col.key) for col, _ in chaves])
+
+    out = {
+        chave_lista: [serializar(i) for i in itens],
+        "next_cursor": next_cursor,
+        "per_page": per_page,
+    }
+    out.update(_total(query, chaves[0][0].table.name))
+    return out
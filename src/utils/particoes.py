@@ -0,0 +1,254 @@
+# src/utils/particoes.py
+"""
+Particionamento mensal de `visitas` por `data_visita` (somente Postgres).
+
+Layout depois de `converter`:
+    visitas                 PARTITION BY RANGE (data_visita), PK (id, data_visita)
+    visitas_p202501 ...     uma partição por mês: [1º dia do mês, 1º dia do mês seguinte)
+    visitas_pdefault        DEFAULT: o que cair fora dos meses criados
+
+Consultas com faixa em `data_visita` (relatório de visitas, cursores, dashboard)
+só leem as partições dos meses envolvidos (partition pruning). O modelo ORM
+não muda: `id` continua vindo da sequence e é único na prática.
+
+  - `converter` troca a tabela comum por uma particionada, numa transação
+    (trava `visitas` enquanto copia: rode numa janela de manutenção);
+  - `garantir_particoes` cria os próximos meses (roda na subida do app e pelo
+    particoes_visitas.py); linhas que já estavam na DEFAULT para o mês são
+    movidas para a partição nova;
+  - `arquivar` desanexa os meses antigos, grava cada um em CSV gzip local e
+    remove a partição. Os agregados (clientes, visitas_diarias,
+    clientes_lojas) continuam contando as visitas arquivadas.
+"""
+import gzip
+import os
+import re
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+TABELA = "visitas"
+PREFIXO = "visitas_p"
+DEFAULT = "visitas_pdefault"
+MESES_FUTUROS = int(os.getenv("PARTICOES_MESES_FUTUROS", 3))
+
+_NOME_MES = re.compile(r"^visitas_p(\d{4})(\d{2})$")
+
+# pg_advisory_xact_lock: vários workers subindo juntos não criam a mesma partição
+_LOCK_ID = 7_340_219
+
+# recriados na tabela particionada (mesmos nomes dos modelos / migração 0001)
+_INDICES = [
+    ("ix_visitas_cliente_data", "cliente_id, data_visita, id"),
+    ("ix_visitas_data", "data_visita, id"),
+    ("ix_visitas_loja_data", "loja, data_visita, id"),
+]
+
+# visitas sem data (não deveria haver: o modelo preenche) vão para a DEFAULT com esta data
+_SEM_DATA = "1970-01-01"
+
+
+class ParticionamentoIndisponivel(RuntimeError):
+    pass
+
+
+def _mes(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _somar_meses(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def nome_particao(mes: date) -> str:
+    return f"{PREFIXO}{mes:%Y%m}"
+
+
+def _exigir_postgres(conn) -> None:
+    if conn.dialect.name != "postgresql":
+        raise ParticionamentoIndisponivel("Particionamento de visitas só existe no Postgres")
+
+
+def particionada(conn) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :t AND c.relnamespace = 'public'::regnamespace"
+    ), {"t": TABELA}).first() is not None
+
+
+def particoes(conn) -> list[date]:
+    """Meses com partição anexada, em ordem."""
+    nomes = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t AND p.relnamespace = 'public'::regnamespace"
+    ), {"t": TABELA}).scalars()
+    meses = []
+    for nome in nomes:
+        m = _NOME_MES.match(nome)
+        if m:
+            meses.append(date(int(m.group(1)), int(m.group(2)), 1))
+    return sorted(meses)
+
+
+def _criar_particao(conn, mes: date) -> None:
+    """
+    Cria a partição do mês como tabela comum, move para ela as linhas do mês
+    que estavam na DEFAULT e a anexa. O CHECK temporário deixa o ATTACH
+    validar a faixa sem varrer a partição nova.
+    """
+    nome, ini, fim = nome_particao(mes), mes, _somar_meses(mes, 1)
+    faixa = {"ini": datetime(ini.year, ini.month, 1), "fim": datetime(fim.year, fim.month, 1)}
+    conn.execute(text(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"WITH movidas AS (DELETE FROM {DEFAULT} WHERE data_visita >= :ini AND data_visita < :fim "
+        f"RETURNING *) INSERT INTO {nome} SELECT * FROM movidas"
+    ), faixa)
+    conn.execute(text(
+        f"ALTER TABLE {nome} ADD CONSTRAINT {nome}_faixa "
+        f"CHECK (data_visita IS NOT NULL AND data_visita >= '{faixa['ini']:%Y-%m-%d}' "
+        f"AND data_visita < '{faixa['fim']:%Y-%m-%d}')"
+    ))
+    conn.execute(text(
+        f"ALTER TABLE {TABELA} ATTACH PARTITION {nome} "
+        f"FOR VALUES FROM ('{faixa['ini']:%Y-%m-%d}') TO ('{faixa['fim']:%Y-%m-%d}')"
+    ))
+    conn.execute(text(f"ALTER TABLE {nome} DROP CONSTRAINT {nome}_faixa"))
+
+
+def garantir_particoes(engine, meses_futuros: int = MESES_FUTUROS, hoje: date | None = None) -> list[str]:
+    """
+    Cria as partições do mês corrente e dos próximos `meses_futuros` que ainda
+    não existem. Não faz nada se `visitas` não for particionada. Devolve os nomes criados.
+    """
+    if engine.dialect.name != "postgresql":
+        return []
+    with engine.begin() as conn:
+        if not particionada(conn):
+            return []
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _LOCK_ID})
+        existentes = set(particoes(conn))
+        atual = _mes(hoje or datetime.utcnow())
+        criadas = []
+        for i in range(meses_futuros + 1):
+            mes = _somar_meses(atual, i)
+            if mes not in existentes:
+                _criar_particao(conn, mes)
+                criadas.append(nome_particao(mes))
+        return criadas
+
+
+def converter(engine, meses_futuros: int = MESES_FUTUROS, saida=print) -> dict:
+    """
+    Converte `visitas` (tabela comum) em tabela particionada por mês, copiando
+    todas as linhas. Tudo numa transação: se algo falhar, nada muda.
+    """
+    with engine.begin() as conn:
+        _exigir_postgres(conn)
+        if particionada(conn):
+            raise ParticionamentoIndisponivel("visitas já é particionada")
+
+        conn.execute(text(f"LOCK TABLE {TABELA} IN ACCESS EXCLUSIVE MODE"))
+        menor, maior, sem_data = conn.execute(text(
+            f"SELECT min(data_visita), max(data_visita), count(*) FILTER (WHERE data_visita IS NULL) "
+            f"FROM {TABELA}"
+        )).one()
+
+        conn.execute(text(f"ALTER TABLE {TABELA} RENAME TO {TABELA}_legado"))
+        conn.execute(text(
+            f"CREATE TABLE {TABELA} (LIKE {TABELA}_legado INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (data_visita)"
+        ))
+        conn.execute(text(f"ALTER TABLE {TABELA} ALTER COLUMN data_visita SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {TABELA} ADD PRIMARY KEY (id, data_visita)"))
+        conn.execute(text(
+            f"ALTER TABLE {TABELA} ADD CONSTRAINT visitas_cliente_id_fkey "
+            f"FOREIGN KEY (cliente_id) REFERENCES clientes (id)"
+        ))
+        # a sequence do id passa a pertencer à tabela nova (senão cairia junto com a legada)
+        conn.execute(text(f"ALTER SEQUENCE {TABELA}_id_seq OWNED BY {TABELA}.id"))
+        conn.execute(text(f"CREATE TABLE {DEFAULT} PARTITION OF {TABELA} DEFAULT"))
+
+        agora = _mes(datetime.utcnow())
+        inicio = _mes(menor) if menor else agora
+        fim = _somar_meses(max(agora, _mes(maior) if maior else agora), meses_futuros)
+        mes, criadas = inicio, 0
+        while mes <= fim:
+            ini, prox = mes, _somar_meses(mes, 1)
+            conn.execute(text(
+                f"CREATE TABLE {nome_particao(mes)} PARTITION OF {TABELA} "
+                f"FOR VALUES FROM ('{ini:%Y-%m-%d}') TO ('{prox:%Y-%m-%d}')"
+            ))
+            mes, criadas = prox, criadas + 1
+        saida(f"{criadas} partições mensais ({inicio:%Y-%m} a {fim:%Y-%m}) + {DEFAULT}")
+
+        copiadas = conn.execute(text(
+            f"INSERT INTO {TABELA} (id, cliente_id, data_visita, valor_compra, loja) "
+            f"SELECT id, cliente_id, COALESCE(data_visita, TIMESTAMP '{_SEM_DATA}'), valor_compra, loja "
+            f"FROM {TABELA}_legado"
+        )).rowcount
+        saida(f"{copiadas} visitas copiadas" + (f" ({sem_data} sem data -> {_SEM_DATA})" if sem_data else ""))
+
+        conn.execute(text(f"DROP TABLE {TABELA}_legado"))
+        for nome, colunas in _INDICES:
+            conn.execute(text(f"CREATE INDEX {nome} ON {TABELA} ({colunas})"))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"ANALYZE {TABELA}"))
+    return {"particoes": criadas, "visitas": copiadas, "sem_data": sem_data}
+
+
+def _tabelas_soltas(conn) -> list[str]:
+    """Partições já desanexadas (arquivamento interrompido antes do DROP)."""
+    nomes = conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+        "AND relnamespace = 'public'::regnamespace AND relname LIKE :p"
+    ), {"p": f"{PREFIXO}%"}).scalars()
+    return sorted(n for n in nomes if _NOME_MES.match(n))
+
+
+def _exportar(conn, nome: str, destino: str) -> int:
+    """COPY da tabela para CSV gzip (grava em .parcial e renomeia). Devolve as linhas."""
+    parcial = destino + ".parcial"
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        with gzip.open(parcial, "wt", encoding="utf-8", newline="") as f:
+            cursor.copy_expert(f"COPY {nome} TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+    finally:
+        cursor.close()
+    with gzip.open(parcial, "rt", encoding="utf-8") as f:
+        linhas = sum(1 for _ in f) - 1
+    os.replace(parcial, destino)
+    return linhas
+
+
+def arquivar(engine, antes: date, diretorio: str, saida=print) -> list[dict]:
+    """
+    Arquiva as partições de meses anteriores a `antes` (1º dia do mês): DETACH,
+    COPY para `<diretorio>/visitas_pAAAAMM.csv.gz`, confere a contagem e DROP.
+    """
+    antes = _mes(antes)
+    os.makedirs(diretorio, exist_ok=True)
+    with engine.begin() as conn:
+        _exigir_postgres(conn)
+        if not particionada(conn):
+            raise ParticionamentoIndisponivel("visitas não é particionada (rode `converter` antes)")
+        alvos = [nome_particao(m) for m in particoes(conn) if m < antes]
+        for nome in alvos:
+            conn.execute(text(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}"))
+        alvos = _tabelas_soltas(conn)
+
+    feitos = []
+    for nome in alvos:
+        with engine.begin() as conn:
+            esperado = conn.execute(text(f"SELECT count(*) FROM {nome}")).scalar()
+            destino = os.path.join(diretorio, f"{nome}.csv.gz")
+            linhas = _exportar(conn, nome, destino)
+            if linhas != esperado:
+                raise RuntimeError(f"{nome}: exportadas {linhas} linhas, esperadas {esperado}; tabela mantida")
+            conn.execute(text(f"DROP TABLE {nome}"))
+        saida(f"{nome}: {linhas} visitas -> {destino}")
+        feitos.append({"particao": nome, "visitas": linhas, "arquivo": destino})
+    return feitos
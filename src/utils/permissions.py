@@ -1,19 +1,85 @@
 # src/utils/permissions.py
+from functools import lru_cache
 from typing import Iterable, Set
-from flask import session
+from flask import g, session
+from sqlalchemy import select, update
 
 from src.models.auth import Usuario, RoleEnum
-from src.models.user import LojaEnum
+from src.models.user import db, LojaEnum
 
 # Todas as lojas válidas (nomes do Enum)
 ALL_LOJAS: Set[str] = {e.name for e in LojaEnum}
 
+# ações com permissão por loja (ordem fixa: define os bits da máscara)
+ACOES = ("view", "create", "edit")
+
+# Máscara de permissões (Usuario.permissoes_mascara): um bit por (loja, ação),
+# bit = índice da loja no LojaEnum * len(ACOES) + índice da ação em ACOES.
+# Lojas novas entram no fim do Enum para não deslocar os bits gravados.
+_BITS = {
+    (loja.name, acao): 1 << (i * len(ACOES) + j)
+    for i, loja in enumerate(LojaEnum)
+    for j, acao in enumerate(ACOES)
+}
+MASCARA_TOTAL = sum(_BITS.values())
+_MASCARA_ACAO = {acao: sum(b for (_, a), b in _BITS.items() if a == acao) for acao in ACOES}
+
+
+class Identidade:
+    """
+    Usuário da request com a máscara de permissões (ADMIN: todos os bits).
+    Carregada uma vez por request (`identidade()`, guardada em flask.g);
+    as checagens são operações de bits, sem consultar o banco nem ler o JSON.
+    """
+    __slots__ = ("usuario", "id", "admin", "mascara")
+
+    def __init__(self, usuario: Usuario):
+        self.usuario = usuario
+        self.id = usuario.id
+        self.admin = usuario.role == RoleEnum.ADMIN
+        if self.admin:
+            self.mascara = MASCARA_TOTAL
+        else:
+            # máscara 0 com lojas no JSON: usuário gravado por fora da tela de admin
+            self.mascara = usuario.permissoes_mascara or (
+                mascara_permissoes(usuario.permissoes) if (usuario.permissoes or {}).get("lojas") else 0
+            )
+
+    def permitidas(self, acao: str) -> frozenset:
+        """Nomes das lojas permitidas para a ação."""
+        return _nomes_da_mascara(self.mascara & _MASCARA_ACAO.get(acao, 0))
+
+    def pode(self, loja: LojaEnum, acao: str) -> bool:
+        return bool(self.mascara & _BITS.get((loja.name, acao), 0))
+
+    def filtro(self, acao: str) -> tuple:
+        """LojaEnum permitidos, em ordem, prontos para `coluna.in_(...)`."""
+        return _lista_in(self.permitidas(acao))
+
+
+def identidade() -> Identidade | None:
+    """Identidade do usuário logado (ou None), carregada uma vez por request."""
+    uid = session.get("user_id")
+    cache = g.get("_identidade")
+    if cache is not None and cache[0] == uid:
+        return cache[1]
+    usuario = db.session.get(Usuario, uid) if uid else None
+    ident = Identidade(usuario) if usuario else None
+    g._identidade = (uid, ident)
+    return ident
+
 def current_user() -> Usuario | None:
     """Retorna o usuário logado (ou None)."""
-    uid = session.get("user_id")
-    if not uid:
-        return None
-    return Usuario.query.get(uid)
+    ident = identidade()
+    return ident.usuario if ident else None
+
+@lru_cache(maxsize=256)
+def _lista_in(lojas: frozenset) -> tuple:
+    return tuple(LojaEnum[name] for name in sorted(lojas))
+
+@lru_cache(maxsize=512)
+def _nomes_da_mascara(bits: int) -> frozenset:
+    return frozenset(loja for (loja, _), b in _BITS.items() if bits & b)
 
 def _norm_list(xs: Iterable[str] | None) -> Set[str]:
     if not xs:
@@ -25,23 +91,64 @@ def _norm_list(xs: Iterable[str] | None) -> Set[str]:
             normed.add(name)
     return normed
 
+def normalizar_permissoes(perms: dict | None) -> dict:
+    """
+    Converte `permissoes` para o formato único, o gravado pela tela de admin:
+        {"lojas": {"INDIANOPOLIS": {"view": true, "create": false, "edit": false}}}
+    Aceita também o formato antigo por ação ({"lojas": {"view": ["INDIANOPOLIS"]}}).
+    Lojas inválidas são descartadas; as outras chaves (ex.: "reset") são mantidas.
+    """
+    perms = dict(perms or {})
+    lojas_cfg = perms.get("lojas")
+    flags: dict = {}
+    for chave, valor in (lojas_cfg.items() if isinstance(lojas_cfg, dict) else ()):
+        if chave in ACOES and isinstance(valor, (list, tuple)):
+            for loja in _norm_list(valor) & ALL_LOJAS:
+                flags.setdefault(loja, dict.fromkeys(ACOES, False))[chave] = True
+        elif isinstance(valor, dict):
+            for loja in _norm_list([chave]) & ALL_LOJAS:
+                atual = flags.setdefault(loja, dict.fromkeys(ACOES, False))
+                for acao in ACOES:
+                    atual[acao] = atual[acao] or bool(valor.get(acao, False))
+    perms["lojas"] = flags
+    return perms
+
+def mascara_permissoes(perms: dict | None) -> int:
+    """Máscara de bits (loja x ação) de um JSON de permissões (qualquer formato)."""
+    mascara = 0
+    for loja, flags in normalizar_permissoes(perms)["lojas"].items():
+        for acao in ACOES:
+            if flags[acao]:
+                mascara |= _BITS[(loja, acao)]
+    return mascara
+
+def preencher_mascaras(engine) -> int:
+    """
+    Preenche `permissoes_mascara` dos usuários que têm lojas no JSON mas
+    máscara 0 (coluna recém-criada, ou usuários gravados antes dela). Roda na
+    subida do app; a migração 0002 também converte o JSON para o formato único.
+    Devolve quantos usuários foram atualizados.
+    """
+    t = Usuario.__table__
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(t.c.id, t.c.permissoes).where(t.c.permissoes_mascara == 0, t.c.role != RoleEnum.ADMIN)
+        ).all()
+        novas = {uid: mascara_permissoes(perms) for uid, perms in rows}
+        for uid, mascara in novas.items():
+            if mascara:
+                conn.execute(update(t).where(t.c.id == uid).values(permissoes_mascara=mascara))
+    return sum(1 for m in novas.values() if m)
+
 def lojas_allowed(action: str) -> Set[str]:
     """
     Conjunto de lojas permitidas para a ação ('view' | 'create' | 'edit').
     ADMIN tem acesso a todas.
     """
-    user = current_user()
-    if not user:
+    ident = identidade()
+    if not ident:
         return set()
-    if user.role == RoleEnum.ADMIN:
-        return set(ALL_LOJAS)
-
-    perms = user.permissoes or {}
-    lojas_cfg = perms.get("lojas") or {}
-    lst = lojas_cfg.get(action) or []
-    allowed = _norm_list(lst)
-    # garante que só retorne lojas válidas do Enum
-    return allowed & ALL_LOJAS
+    return ident.permitidas(action)
 
 def ensure_loja_allowed(loja_name: str, action: str) -> tuple[bool, Set[str]]:
     """
@@ -53,19 +160,33 @@ def ensure_loja_allowed(loja_name: str, action: str) -> tuple[bool, Set[str]]:
         return False, allowed
     return loja_name in allowed, allowed
 
-def filter_query_by_lojas(query, column, action: str):
+def lojas_restriction(action: str) -> Set[str] | None:
     """
-    Restringe uma query por lojas permitidas (para não-admins).
-    'column' é a coluna Enum (ex.: Visita.loja).
+    Restrição de lojas a aplicar em consultas da ação: None = sem restrição
+    (admin / sem usuário), senão o conjunto permitido (vazio = nenhuma).
+    Pode ser calculada na request e repassada a quem roda fora dela (jobs).
     """
-    user = current_user()
-    if not user or user.role == RoleEnum.ADMIN:
-        return query
+    ident = identidade()
+    if not ident or ident.admin:
+        return None
+    return ident.permitidas(action)
 
-    allowed = lojas_allowed(action)
-    if not allowed:
+def restrict_query_to_lojas(query, column, lojas: Set[str] | None):
+    """Aplica uma restrição obtida de `lojas_restriction` à query."""
+    if lojas is None:
+        return query
+    if not lojas:
         # nenhuma loja -> resultado vazio
         return query.filter(False)
+    return query.filter(column.in_(_lista_in(frozenset(lojas))))
 
-    enum_vals = [LojaEnum[name] for name in allowed]
-    return query.filter(column.in_(enum_vals))
+def filter_query_by_lojas(query, column, action: str):
+    """
+    Restringe uma query por lojas permitidas (para não-admins).
+    'column' é a coluna Enum (ex.: Visita.loja).
+    """
+    ident = identidade()
+    if not ident or ident.admin:
+        return query
+    filtro = ident.filtro(action)
+    return query.filter(column.in_(filtro)) if filtro else query.filter(False)
@@ -0,0 +1,186 @@
+# src/utils/pontos.py
+"""
+Saldo de pontos com extrato (ledger).
+
+Todo crédito/débito vira uma linha em `pontos_movimentos` (somente inserção) e
+é aplicado ao saldo em `pontos` por um UPSERT atômico na chave única
+`cliente_id`: `pontos_acumulados = pontos_acumulados + :x`, com o nível
+recalculado por CASE no mesmo statement e o saldo novo devolvido via
+RETURNING. Nada é lido antes de escrever, então terminais concorrentes não
+perdem incrementos nem criam linhas duplicadas.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, cast, func, insert, inspect, literal, select, text, update
+
+from src.models.user import db, Ponto, MovimentoPonto, NivelEnum
+from src.utils.sql import insert_upsert
+
+# (mínimo de pontos, nível), do maior para o menor
+LIMITES_NIVEL = (
+    (1000, NivelEnum.OURO),
+    (500, NivelEnum.PRATA),
+)
+
+
+def nivel_por_pontos(pontos) -> NivelEnum:
+    for minimo, nivel in LIMITES_NIVEL:
+        if (pontos or 0) >= minimo:
+            return nivel
+    return NivelEnum.BRONZE
+
+
+def nivel_sql(expr):
+    """Mesma regra de `nivel_por_pontos`, como expressão SQL sobre `expr`."""
+    tipo = Ponto.__table__.c.nivel_atual.type
+    # CAST explícito: no Postgres um CASE só de literais sairia como text, não como o enum
+    return case(
+        *[(expr >= minimo, cast(literal(nivel, tipo), tipo)) for minimo, nivel in LIMITES_NIVEL],
+        else_=cast(literal(NivelEnum.BRONZE, tipo), tipo),
+    )
+
+
+def _aplicar_saldo(cliente_id: int, pontos: int, agora: datetime):
+    """UPSERT atômico no saldo; devolve (pontos_acumulados, nivel_atual)."""
+    stmt = insert_upsert(Ponto)
+    if stmt is not None:
+        stmt = stmt.values(
+            cliente_id=cliente_id,
+            pontos_acumulados=pontos,
+            nivel_atual=nivel_por_pontos(pontos),
+            data_atualizacao=agora,
+        )
+        novo = Ponto.pontos_acumulados + stmt.excluded.pontos_acumulados
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["cliente_id"],
+            set_={
+                "pontos_acumulados": novo,
+                "nivel_atual": nivel_sql(novo),
+                "data_atualizacao": stmt.excluded.data_atualizacao,
+            },
+        ).returning(Ponto.pontos_acumulados, Ponto.nivel_atual)
+        return tuple(db.session.execute(stmt).one())
+
+    novo = Ponto.pontos_acumulados + pontos
+    res = db.session.execute(
+        update(Ponto)
+        .where(Ponto.cliente_id == cliente_id)
+        .values(pontos_acumulados=novo, nivel_atual=nivel_sql(novo), data_atualizacao=agora)
+        .execution_options(synchronize_session=False)
+    )
+    if not res.rowcount:
+        db.session.execute(insert(Ponto).values(
+            cliente_id=cliente_id, pontos_acumulados=pontos,
+            nivel_atual=nivel_por_pontos(pontos), data_atualizacao=agora,
+        ))
+    return tuple(db.session.execute(
+        select(Ponto.pontos_acumulados, Ponto.nivel_atual).where(Ponto.cliente_id == cliente_id)
+    ).one())
+
+
+def lancar(cliente_id: int, pontos: int, motivo: str, visita_id: int | None = None,
+           fator: float | None = None):
+    """
+    Registra o movimento e aplica ao saldo, na transação corrente.
+    Devolve (saldo, nivel) já com o movimento aplicado.
+    """
+    agora = datetime.utcnow()
+    db.session.execute(insert(MovimentoPonto).values(
+        cliente_id=cliente_id, visita_id=visita_id, pontos=pontos,
+        motivo=motivo, fator=fator, data=agora,
+    ))
+    return _aplicar_saldo(cliente_id, pontos, agora)
+
+
+def lancar_lote(movimentos: list[dict]) -> dict:
+    """
+    movimentos: [{cliente_id, pontos, motivo, visita_id?, fator?}].
+    Um INSERT (executemany) no extrato e um UPSERT de saldo por cliente.
+    Devolve {cliente_id: (saldo, nivel)}.
+    """
+    if not movimentos:
+        return {}
+    agora = datetime.utcnow()
+    db.session.execute(insert(MovimentoPonto), [
+        {"cliente_id": m["cliente_id"], "visita_id": m.get("visita_id"), "pontos": m["pontos"],
+         "motivo": m["motivo"], "fator": m.get("fator"), "data": agora}
+        for m in movimentos
+    ])
+    por_cliente: dict = {}
+    for m in movimentos:
+        por_cliente[m["cliente_id"]] = por_cliente.get(m["cliente_id"], 0) + m["pontos"]
+    return {cid: _aplicar_saldo(cid, pts, agora) for cid, pts in por_cliente.items()}
+
+
+def lancado_na_visita(visita_id: int):
+    """
+    (pontos, fator) já lançados para a visita: soma de todos os movimentos e o
+    fator usado no crédito original. None se a visita é anterior ao extrato.
+    """
+    qtd, soma, fator = db.session.execute(
+        select(
+            func.count(MovimentoPonto.id),
+            func.coalesce(func.sum(MovimentoPonto.pontos), 0),
+            func.max(case((MovimentoPonto.motivo == "visita", MovimentoPonto.fator))),
+        ).where(MovimentoPonto.visita_id == visita_id)
+    ).one()
+    if not qtd:
+        return None
+    return int(soma), (fator if fator is not None else 1.0)
+
+
+def garantir_registro(cliente_id: int) -> None:
+    """Cria o saldo zerado do cliente se ainda não existir (sem corrida)."""
+    stmt = insert_upsert(Ponto)
+    if stmt is not None:
+        db.session.execute(stmt.values(
+            cliente_id=cliente_id, pontos_acumulados=0,
+            nivel_atual=NivelEnum.BRONZE, data_atualizacao=datetime.utcnow(),
+        ).on_conflict_do_nothing(index_elements=["cliente_id"]))
+    elif not db.session.execute(select(Ponto.id).where(Ponto.cliente_id == cliente_id)).first():
+        db.session.add(Ponto(cliente_id=cliente_id, pontos_acumulados=0, nivel_atual=NivelEnum.BRONZE))
+
+
+# ------------------------------ manutenção ------------------------------
+
+def _tem_indice_unico(engine) -> bool:
+    insp = inspect(engine)
+    if any(u["column_names"] == ["cliente_id"] for u in insp.get_unique_constraints("pontos")):
+        return True
+    return any(i["unique"] and i["column_names"] == ["cliente_id"] for i in insp.get_indexes("pontos"))
+
+
+def deduplicar_saldos(conn=None) -> int:
+    """
+    Junta linhas duplicadas de `pontos` do mesmo cliente numa só (a de menor id),
+    somando os saldos (cada duplicata recebeu parte dos incrementos). Devolve o
+    número de linhas removidas. Com `conn` (ex.: migração), roda nela e quem
+    chamou faz o commit; sem, usa a sessão e commita.
+    """
+    executar = conn.execute if conn is not None else db.session.execute
+    pontos = Ponto.__table__
+    duplicados = executar(text(
+        "SELECT cliente_id, MIN(id), SUM(COALESCE(pontos_acumulados, 0)) "
+        "FROM pontos GROUP BY cliente_id HAVING COUNT(*) > 1"
+    )).all()
+    removidas = 0
+    for cliente_id, manter, total in duplicados:
+        executar(
+            pontos.update().where(pontos.c.id == manter)
+            .values(pontos_acumulados=total, nivel_atual=nivel_por_pontos(total),
+                    data_atualizacao=datetime.utcnow())
+        )
+        res = executar(pontos.delete().where(pontos.c.cliente_id == cliente_id, pontos.c.id != manter))
+        removidas += res.rowcount or 0
+    if conn is None:
+        db.session.commit()
+    return removidas
+
+
+def conferir_unicidade(engine) -> bool:
+    """
+    True se pontos(cliente_id) tem o índice único exigido pelo UPSERT. Só
+    confere: a deduplicação e o índice (CONCURRENTLY no Postgres, sem travar
+    escritas) ficam na migração 0001.
+    """
+    return _tem_indice_unico(engine)
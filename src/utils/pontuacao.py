@@ -0,0 +1,125 @@
+# src/utils/pontuacao.py
+"""
+Fator de pontuação das campanhas, resolvido em memória.
+
+As campanhas ativas são carregadas uma vez e viram um índice de intervalos
+por loja (mais um para as campanhas globais, `loja` nula): os instantes de
+início/fim de todas as campanhas cortam a linha do tempo em intervalos
+elementares, e cada intervalo guarda o fator já resolvido. Descobrir o fator
+de uma visita é um `bisect` em cada um dos dois índices, sem consultar
+`campanhas`.
+
+Regra para campanhas sobrepostas: vale o MAIOR fator entre todas as campanhas
+ativas que cobrem o instante, globais ou da loja da visita (fatores não se
+acumulam). Sem campanha, o fator é 1.0. A janela da campanha inclui as duas
+pontas (`data_inicio <= data_visita <= data_fim`).
+
+O índice é reconstruído quando `criar/atualizar/excluir_campanha` comitam
+(versão 'campanhas' do cache) e, no máximo, a cada PONTUACAO_TTL segundos,
+para enxergar mudanças feitas por outros processos.
+"""
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from src.models.user import db, Campanha
+from src.utils import cache
+
+TTL = float(os.getenv("PONTUACAO_TTL", 60))
+
+FATOR_PADRAO = 1.0
+
+# a janela é fechada; o intervalo elementar é [início, fim + 1µs)
+_RESOLUCAO = timedelta(microseconds=1)
+
+
+class IndiceIntervalos:
+    """Linha do tempo de uma loja: limites ordenados e o fator de cada trecho."""
+    __slots__ = ("limites", "fatores")
+
+    def __init__(self, campanhas):
+        """campanhas: [(inicio, fim_exclusivo, fator)]."""
+        eventos = sorted({t for ini, fim, _ in campanhas for t in (ini, fim)})
+        # fatores[i] vale em [limites[i], limites[i+1]); None = sem campanha
+        fatores = [None] * len(eventos)
+        for ini, fim, fator in campanhas:
+            a = bisect_right(eventos, ini) - 1
+            b = bisect_right(eventos, fim) - 1
+            for i in range(a, b):
+                if fatores[i] is None or fator > fatores[i]:
+                    fatores[i] = fator
+        self.limites = eventos
+        self.fatores = fatores
+
+    def fator(self, momento: datetime):
+        i = bisect_right(self.limites, momento) - 1
+        return self.fatores[i] if i >= 0 else None
+
+
+class IndiceCampanhas:
+    __slots__ = ("por_loja", "campanhas")
+
+    def __init__(self, linhas):
+        """linhas: [(loja | None, data_inicio, data_fim, fator)] das campanhas ativas."""
+        grupos: dict = {}
+        for loja, ini, fim, fator in linhas:
+            if ini is None or fim is None or fim < ini:
+                continue
+            grupos.setdefault(loja, []).append(
+                (ini, fim + _RESOLUCAO, float(fator if fator is not None else FATOR_PADRAO))
+            )
+        self.por_loja = {loja: IndiceIntervalos(c) for loja, c in grupos.items()}
+        self.campanhas = len(linhas)
+
+    def fator(self, loja, momento: datetime) -> float:
+        """Maior fator entre campanhas globais e da `loja` (LojaEnum ou None) em `momento`."""
+        melhor = None
+        for chave in (None, loja) if loja is not None else (None,):
+            indice = self.por_loja.get(chave)
+            if indice is None:
+                continue
+            f = indice.fator(momento)
+            if f is not None and (melhor is None or f > melhor):
+                melhor = f
+        return FATOR_PADRAO if melhor is None else melhor
+
+
+_lock = threading.Lock()
+_indice: IndiceCampanhas | None = None
+_versao = None
+_expira = 0.0
+
+
+def _carregar() -> IndiceCampanhas:
+    linhas = db.session.execute(
+        select(Campanha.loja, Campanha.data_inicio, Campanha.data_fim, Campanha.fator_pontuacao)
+        .where(Campanha.ativa.is_(True))
+    ).all()
+    return IndiceCampanhas(linhas)
+
+
+def indice() -> IndiceCampanhas:
+    """Índice vigente; reconstrói se uma campanha mudou ou o TTL venceu."""
+    global _indice, _versao, _expira
+    v = cache.versao("campanhas")
+    if _indice is not None and _versao == v and _expira > time.monotonic():
+        return _indice
+    with _lock:
+        if _indice is None or _versao != v or _expira <= time.monotonic():
+            _indice = _carregar()
+            _versao = v
+            _expira = time.monotonic() + TTL
+        return _indice
+
+
+def fator_pontuacao(loja, momento: datetime | None = None) -> float:
+    """Fator aplicável a uma compra na `loja` (LojaEnum ou None) em `momento` (padrão: agora)."""
+    return indice().fator(loja, momento or datetime.utcnow())
+
+
+def pontos_da_compra(valor_compra, fator: float) -> int:
+    return int(float(valor_compra) * fator)
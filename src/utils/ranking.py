@@ -0,0 +1,167 @@
+# src/utils/ranking.py
+"""
+Rankings (top-N) de clientes mantidos em memória, por processo.
+
+Placares:
+  - globais: 'pontos', 'visitas', 'valor' (colunas agregadas de `clientes`);
+  - por loja: 'visitas', 'valor' (tabela `clientes_lojas`).
+
+Cada placar guarda os CAPACIDADE melhores (com folga sobre o top-N exibido) e
+o `corte`, um limite superior do score de quem ficou de fora. As escritas de
+visita/pontos repassam os valores novos (RETURNING) via `agendar()`, aplicados
+só depois do commit. Se um membro cai abaixo do `corte`, a ordem deixa de ser
+garantida e o placar é recarregado do SQL na próxima leitura. RANKING_TTL
+(padrão 300s) força a recarga periódica, cobrindo escritas de outros processos.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from src.models.user import db, Cliente, ClienteLoja
+
+TOP_N = 10
+CAPACIDADE = TOP_N * 3
+TTL = float(os.getenv("RANKING_TTL", 300))
+
+METRICAS_GLOBAIS = ("pontos", "visitas", "valor")
+METRICAS_LOJA = ("visitas", "valor")
+
+_CHAVE_EVENTOS = "ranking_eventos"
+
+_lock = threading.RLock()
+_placares: dict = {}
+_resumos: dict[int, dict] = {}
+
+
+class Placar:
+    def __init__(self, capacidade: int = CAPACIDADE):
+        self.capacidade = capacidade
+        self.scores: dict[int, float] = {}
+        self.corte = 0
+        self.sujo = True
+        self.carregado_em = 0.0
+
+    def carregar(self, linhas) -> None:
+        """linhas: [(cliente_id, score)] em ordem decrescente, até capacidade + 1."""
+        self.scores = dict(linhas[:self.capacidade])
+        self.corte = linhas[self.capacidade][1] if len(linhas) > self.capacidade else 0
+        self.sujo = False
+        self.carregado_em = time.monotonic()
+
+    def oferecer(self, cliente_id: int, score) -> None:
+        if self.sujo:
+            return
+        if cliente_id in self.scores:
+            self.scores[cliente_id] = score
+            if score < self.corte:
+                self.sujo = True
+            return
+        if len(self.scores) < self.capacidade:
+            self.scores[cliente_id] = score
+            return
+        menor = min(self.scores, key=self.scores.get)
+        if score > self.scores[menor]:
+            self.corte = max(self.corte, self.scores.pop(menor))
+            self.scores[cliente_id] = score
+        else:
+            self.corte = max(self.corte, score)
+
+    def top(self, n: int) -> list[tuple[int, float]]:
+        return sorted(self.scores.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+def _placar(loja: str | None, metrica: str) -> Placar:
+    chave = (loja, metrica)
+    p = _placares.get(chave)
+    if p is None:
+        p = _placares[chave] = Placar()
+    return p
+
+
+# ------------------------------- escrita -------------------------------
+
+def agendar(loja: str | None, cliente_id: int, **scores) -> None:
+    """Registra valores novos de um cliente; aplicados no after_commit."""
+    db.session.info.setdefault(_CHAVE_EVENTOS, []).append((loja, cliente_id, scores))
+
+
+def agendar_recarga() -> None:
+    db.session.info.setdefault(_CHAVE_EVENTOS, []).append(None)
+
+
+def invalidar() -> None:
+    """Força a recarga de todos os placares na próxima leitura."""
+    with _lock:
+        for p in _placares.values():
+            p.sujo = True
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_eventos(session):
+    eventos = session.info.pop(_CHAVE_EVENTOS, None)
+    if not eventos:
+        return
+    with _lock:
+        for ev in eventos:
+            if ev is None:
+                invalidar()
+                continue
+            loja, cliente_id, scores = ev
+            for metrica, score in scores.items():
+                _placar(loja, metrica).oferecer(cliente_id, score)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_eventos(session):
+    session.info.pop(_CHAVE_EVENTOS, None)
+
+
+# ------------------------------- leitura -------------------------------
+
+_COLUNAS_GLOBAIS = {
+    "pontos": Cliente.pontos_totais,
+    "visitas": Cliente.total_visitas,
+    "valor": Cliente.valor_total_compras,
+}
+_COLUNAS_LOJA = {
+    "visitas": ClienteLoja.total_visitas,
+    "valor": ClienteLoja.valor_total,
+}
+
+
+def _recarregar(loja: str | None, metrica: str, placar: Placar) -> None:
+    if loja is None:
+        col = _COLUNAS_GLOBAIS[metrica]
+        q = select(Cliente.id, Cliente.nome, Cliente.cpf, col)
+    else:
+        col = _COLUNAS_LOJA[metrica]
+        q = (select(Cliente.id, Cliente.nome, Cliente.cpf, col)
+             .join(ClienteLoja, ClienteLoja.cliente_id == Cliente.id)
+             .where(ClienteLoja.loja == loja))
+    rows = db.session.execute(
+        q.order_by(col.desc(), Cliente.id).limit(placar.capacidade + 1)
+    ).all()
+    for r in rows:
+        _resumos[r[0]] = {"id": r[0], "nome": r[1], "cpf": r[2]}
+    placar.carregar([(r[0], r[3] or 0) for r in rows])
+
+
+def top(loja: str | None, metrica: str, n: int = TOP_N) -> list[tuple[dict, float]]:
+    """Top-n [(resumo_cliente, score)] do placar; recarrega do SQL se preciso."""
+    with _lock:
+        placar = _placar(loja, metrica)
+        if placar.sujo or time.monotonic() - placar.carregado_em > TTL:
+            _recarregar(loja, metrica, placar)
+        itens = placar.top(n)
+
+        faltando = [cid for cid, _ in itens if cid not in _resumos]
+        if faltando:
+            for cid, nome, cpf in db.session.execute(
+                select(Cliente.id, Cliente.nome, Cliente.cpf).where(Cliente.id.in_(faltando))
+            ):
+                _resumos[cid] = {"id": cid, "nome": nome, "cpf": cpf}
+
+        return [(_resumos[cid], score) for cid, score in itens if cid in _resumos]
@@ -0,0 +1,322 @@
+# src/utils/relatorios.py
+"""
+Consultas dos relatórios pesados, separadas das rotas para serem usadas tanto
+nas respostas síncronas/streaming quanto nos jobs em background.
+
+Cada relatório tem:
+  - `filtros_*(args)`: valida/converte os parâmetros (levanta FiltroInvalido);
+  - `linhas_*(filtros)`: gerador de dicts, lendo o banco em lotes (yield_per);
+  - `COLUNAS_*` / `achatar_*`: formato plano para CSV.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, case, func, or_, select
+
+from src.models.user import (
+    db, Cliente, Ponto, Resgate, Brinde, Campanha, Visita, LojaEnum, NivelEnum, StatusResgateEnum,
+)
+from src.utils.exportacao import linhas_do_banco
+from src.utils.permissions import restrict_query_to_lojas
+
+
+class FiltroInvalido(ValueError):
+    pass
+
+
+def _data(valor):
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise FiltroInvalido(f"Data inválida: {valor}")
+
+
+def _inteiro(valor):
+    if valor in (None, ""):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise FiltroInvalido(f"Número inválido: {valor}")
+
+
+# ====================== Relatório detalhado de clientes ======================
+
+def filtros_clientes_detalhado(args) -> dict:
+    nivel = args.get("nivel")
+    if nivel:
+        try:
+            NivelEnum(nivel)
+        except ValueError:
+            raise FiltroInvalido("Nível inválido")
+    return {
+        "nivel": nivel or None,
+        "data_cadastro_inicio": _data(args.get("data_cadastro_inicio")),
+        "data_cadastro_fim": _data(args.get("data_cadastro_fim")),
+        "min_visitas": _inteiro(args.get("min_visitas")),
+        "min_pontos": _inteiro(args.get("min_pontos")),
+    }
+
+
+def consulta_clientes_detalhado(filtros: dict):
+    """
+    Um único SELECT: clientes (agregados desnormalizados) + pontos + contagem
+    de resgates por status, agrupada numa subconsulta. Todos os filtros,
+    inclusive min_visitas/min_pontos, vão para o WHERE.
+    """
+    resgates = (
+        select(
+            Resgate.cliente_id,
+            func.sum(case((Resgate.status == StatusResgateEnum.PENDENTE, 1), else_=0)).label("pendentes"),
+            func.sum(case((Resgate.status == StatusResgateEnum.ENTREGUE, 1), else_=0)).label("entregues"),
+        )
+        .group_by(Resgate.cliente_id)
+        .subquery()
+    )
+
+    pontos = func.coalesce(Ponto.pontos_acumulados, 0)
+    stmt = (
+        select(
+            Cliente,
+            pontos.label("pontos"),
+            Ponto.nivel_atual,
+            func.coalesce(resgates.c.pendentes, 0).label("pendentes"),
+            func.coalesce(resgates.c.entregues, 0).label("entregues"),
+        )
+        .outerjoin(Ponto, Ponto.cliente_id == Cliente.id)
+        .outerjoin(resgates, resgates.c.cliente_id == Cliente.id)
+    )
+
+    if filtros.get("nivel"):
+        stmt = stmt.where(Ponto.nivel_atual == NivelEnum(filtros["nivel"]))
+    if filtros.get("data_cadastro_inicio"):
+        stmt = stmt.where(Cliente.data_cadastro >= filtros["data_cadastro_inicio"])
+    if filtros.get("data_cadastro_fim"):
+        stmt = stmt.where(Cliente.data_cadastro <= filtros["data_cadastro_fim"])
+    if filtros.get("min_visitas"):
+        stmt = stmt.where(Cliente.total_visitas >= filtros["min_visitas"])
+    if filtros.get("min_pontos"):
+        stmt = stmt.where(pontos >= filtros["min_pontos"])
+
+    return stmt.order_by(Cliente.id)
+
+
+def linhas_clientes_detalhado(filtros: dict):
+    for cliente, pontos, nivel, pendentes, entregues in linhas_do_banco(
+        db.session, consulta_clientes_detalhado(filtros)
+    ):
+        total_visitas = cliente.total_visitas or 0
+        valor_total = cliente.valor_total_compras or 0.0
+        yield {
+            "cliente": cliente.to_dict(),
+            "pontos": {
+                "total": int(pontos or 0),
+                "nivel": nivel.value if nivel else "Bronze",
+            },
+            "estatisticas": {
+                "total_visitas": total_visitas,
+                "valor_total_compras": valor_total,
+                "valor_medio_compra": valor_total / total_visitas if total_visitas > 0 else 0,
+                "ultima_visita": cliente.ultima_visita.isoformat() if cliente.ultima_visita else None,
+                "resgates_pendentes": int(pendentes or 0),
+                "resgates_entregues": int(entregues or 0),
+            },
+        }
+
+
+def contar_clientes_detalhado(filtros: dict) -> int:
+    stmt = consulta_clientes_detalhado(filtros).order_by(None).subquery()
+    return db.session.execute(select(func.count()).select_from(stmt)).scalar()
+
+
+COLUNAS_CLIENTES_DETALHADO = [
+    "id", "cpf", "nome", "telefone", "email", "data_cadastro",
+    "pontos", "nivel", "total_visitas", "valor_total_compras", "valor_medio_compra",
+    "ultima_visita", "resgates_pendentes", "resgates_entregues",
+]
+
+
+def achatar_clientes_detalhado(linha: dict) -> dict:
+    c = linha["cliente"]
+    e = linha["estatisticas"]
+    return {
+        "id": c["id"], "cpf": c["cpf"], "nome": c["nome"], "telefone": c["telefone"],
+        "email": c["email"], "data_cadastro": c["data_cadastro"],
+        "pontos": linha["pontos"]["total"], "nivel": linha["pontos"]["nivel"],
+        **{k: e[k] for k in (
+            "total_visitas", "valor_total_compras", "valor_medio_compra",
+            "ultima_visita", "resgates_pendentes", "resgates_entregues",
+        )},
+    }
+
+
+# ====================== Performance das campanhas ======================
+
+def filtros_campanhas_performance(args) -> dict:
+    """
+    ativa=true|false; data_inicio/data_fim: campanhas cuja vigência cruza o
+    intervalo informado (qualquer um dos dois pode ser omitido).
+    """
+    ativa = args.get("ativa")
+    return {
+        "ativa": None if ativa in (None, "") else ativa.lower() == "true",
+        "data_inicio": _data(args.get("data_inicio")),
+        "data_fim": _data(args.get("data_fim")),
+    }
+
+
+def _contar_por_status(status):
+    return func.sum(case((Resgate.status == status, 1), else_=0))
+
+
+def relatorio_campanhas_performance(filtros: dict) -> list[dict]:
+    """
+    Quatro consultas no total, independente do número de campanhas/visitas:
+    campanhas, brindes agrupados, resgates agrupados por status e a janela de
+    visitas (campanhas JOIN visitas no período e loja) agrupada por campanha.
+    """
+    campanhas_q = select(Campanha)
+    if filtros.get("ativa") is not None:
+        campanhas_q = campanhas_q.where(Campanha.ativa == filtros["ativa"])
+    if filtros.get("data_inicio"):
+        campanhas_q = campanhas_q.where(Campanha.data_fim >= filtros["data_inicio"])
+    if filtros.get("data_fim"):
+        campanhas_q = campanhas_q.where(Campanha.data_inicio <= filtros["data_fim"])
+
+    campanhas = db.session.execute(campanhas_q.order_by(Campanha.id)).scalars().all()
+    if not campanhas:
+        return []
+    ids = [c.id for c in campanhas]
+
+    brindes = {
+        cid: (tipos, disponivel)
+        for cid, tipos, disponivel in db.session.execute(
+            select(
+                Brinde.campanha_id,
+                func.count(Brinde.id),
+                func.coalesce(func.sum(Brinde.estoque_total), 0),  # contador + slots
+            )
+            .where(Brinde.campanha_id.in_(ids))
+            .group_by(Brinde.campanha_id)
+        )
+    }
+
+    resgates = {
+        cid: (total, entregues, pendentes)
+        for cid, total, entregues, pendentes in db.session.execute(
+            select(
+                Brinde.campanha_id,
+                func.count(Resgate.id),
+                _contar_por_status(StatusResgateEnum.ENTREGUE),
+                _contar_por_status(StatusResgateEnum.PENDENTE),
+            )
+            .join(Brinde, Resgate.brinde_id == Brinde.id)
+            .where(Brinde.campanha_id.in_(ids))
+            .group_by(Brinde.campanha_id)
+        )
+    }
+
+    visitas = {
+        cid: (total, valor)
+        for cid, total, valor in db.session.execute(
+            select(
+                Campanha.id,
+                func.count(Visita.id),
+                func.coalesce(func.sum(Visita.valor_compra), 0),
+            )
+            .join(Visita, and_(
+                Visita.data_visita >= Campanha.data_inicio,
+                Visita.data_visita <= Campanha.data_fim,
+                or_(Campanha.loja.is_(None), Visita.loja == Campanha.loja),
+            ))
+            .where(Campanha.id.in_(ids))
+            .group_by(Campanha.id)
+        )
+    }
+
+    relatorio = []
+    for campanha in campanhas:
+        total_tipos, disponivel = brindes.get(campanha.id, (0, 0))
+        total_resgates, entregues, pendentes = resgates.get(campanha.id, (0, 0, 0))
+        total_visitas, valor_visitas = visitas.get(campanha.id, (0, 0))
+        relatorio.append({
+            "campanha": campanha.to_dict(),
+            "brindes": {
+                "total_tipos": total_tipos,
+                "total_disponivel": int(disponivel or 0),
+            },
+            "resgates": {
+                "total": total_resgates,
+                "entregues": int(entregues or 0),
+                "pendentes": int(pendentes or 0),
+                "taxa_entrega": (entregues / total_resgates * 100) if total_resgates > 0 else 0,
+            },
+            "visitas_periodo": {
+                "total": total_visitas,
+                "valor_total": float(valor_visitas or 0),
+            },
+        })
+    return relatorio
+
+
+COLUNAS_CAMPANHAS_PERFORMANCE = [
+    "id", "nome", "loja", "data_inicio", "data_fim", "ativa",
+    "brindes_tipos", "brindes_disponivel",
+    "resgates_total", "resgates_entregues", "resgates_pendentes", "taxa_entrega",
+    "visitas_total", "visitas_valor_total",
+]
+
+
+def achatar_campanhas_performance(linha: dict) -> dict:
+    c = linha["campanha"]
+    return {
+        **{k: c[k] for k in ("id", "nome", "loja", "data_inicio", "data_fim", "ativa")},
+        "brindes_tipos": linha["brindes"]["total_tipos"],
+        "brindes_disponivel": linha["brindes"]["total_disponivel"],
+        **{f"resgates_{k}": v for k, v in linha["resgates"].items() if k != "taxa_entrega"},
+        "taxa_entrega": linha["resgates"]["taxa_entrega"],
+        "visitas_total": linha["visitas_periodo"]["total"],
+        "visitas_valor_total": linha["visitas_periodo"]["valor_total"],
+    }
+
+
+# ====================== Relatório de visitas ======================
+
+def consulta_visitas(filtros: dict, lojas=None):
+    """
+    Visitas filtradas por data/loja. `lojas` é a restrição de permissão já
+    resolvida (`lojas_restriction('view')`), para a consulta não depender da
+    request (jobs em background).
+    """
+    q = Visita.query
+    if filtros.get("data_inicio"):
+        q = q.filter(Visita.data_visita >= filtros["data_inicio"])
+    if filtros.get("data_fim"):
+        q = q.filter(Visita.data_visita <= filtros["data_fim"])
+    if filtros.get("loja"):
+        q = q.filter(Visita.loja == LojaEnum[filtros["loja"]])
+    return restrict_query_to_lojas(q, Visita.loja, lojas)
+
+
+def estatisticas_visitas(filtros: dict, lojas=None) -> dict:
+    """count/sum/avg numa única agregação, com os mesmos filtros da listagem."""
+    total, valor_total, valor_medio = consulta_visitas(filtros, lojas).with_entities(
+        func.count(Visita.id),
+        func.coalesce(func.sum(Visita.valor_compra), 0),
+        func.coalesce(func.avg(Visita.valor_compra), 0),
+    ).one()
+    return {
+        "total_visitas": total,
+        "valor_total": float(valor_total),
+        "valor_medio": float(valor_medio),
+    }
+
+
+def linhas_visitas(filtros: dict, lojas=None):
+    q = consulta_visitas(filtros, lojas).order_by(Visita.data_visita.desc(), Visita.id.desc())
+    for (visita,) in linhas_do_banco(db.session, q.statement):
+        yield visita.to_dict()
+
+
+COLUNAS_VISITAS = ["id", "cliente_id", "data_visita", "valor_compra", "loja"]
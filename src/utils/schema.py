@@ -0,0 +1,29 @@
+# src/utils/schema.py
+"""
+O app só usa db.create_all(), que cria tabelas novas mas não altera as
+existentes. Este módulo adiciona as colunas novas dos modelos que ainda
+não existem no banco (ALTER TABLE ... ADD COLUMN).
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+def adicionar_colunas_faltantes(engine, tabelas) -> list[str]:
+    """
+    Para cada Table em `tabelas`, cria no banco as colunas declaradas no modelo
+    que ainda não existem. Retorna a lista 'tabela.coluna' adicionada.
+    """
+    insp = inspect(engine)
+    adicionadas = []
+    with engine.begin() as conn:
+        for tabela in tabelas:
+            if not insp.has_table(tabela.name):
+                continue
+            existentes = {c["name"] for c in insp.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in existentes:
+                    continue
+                ddl = CreateColumn(coluna).compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {tabela.name} ADD COLUMN {ddl}'))
+                adicionadas.append(f"{tabela.name}.{coluna.name}")
+    return adicionadas
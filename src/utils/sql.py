@@ -0,0 +1,22 @@
+# src/utils/sql.py
+"""Helpers de SQL dependentes de dialeto."""
+from src.models.user import db
+
+
+def dialeto() -> str:
+    return db.session.get_bind().dialect.name
+
+
+def insert_upsert(model):
+    """
+    insert() com suporte a ON CONFLICT (Postgres e SQLite).
+    Retorna None em outros dialetos — o chamador faz o fallback.
+    """
+    nome = dialeto()
+    if nome == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif nome == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
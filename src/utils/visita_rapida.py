@@ -0,0 +1,252 @@
+# src/utils/visita_rapida.py
+"""
+Caminho rápido do registro de visita (a escrita mais quente do sistema).
+
+Faz tudo o que `POST /api/visitas` precisa (resolver o cliente por id ou CPF,
+inserir a visita, lançar o movimento de pontos, somar o saldo com o nível
+recalculado e atualizar os agregados de `clientes`, `clientes_lojas` e
+`visitas_diarias`) sem carregar objetos ORM:
+
+  - Postgres: UM statement, com CTEs de escrita encadeadas
+    (`WITH v AS (INSERT INTO visitas ... SELECT ... FROM clientes RETURNING),
+    s AS (INSERT INTO pontos ... ON CONFLICT DO UPDATE ... RETURNING), ...
+    SELECT ... FROM v, s, ...`): uma ida ao banco;
+  - SQLite (sem CTEs de escrita): a mesma sequência de INSERT/UPSERT com
+    RETURNING, um statement por tabela, na mesma transação.
+
+O SQL é escrito à mão (text()) porque o SQLAlchemy não cacheia a compilação
+de statements com ON CONFLICT: montados com o construtor, seriam recompilados
+a cada visita, o que custa mais que a ida ao banco economizada.
+
+O fator vem do índice de campanhas em memória (src/utils/pontuacao.py) e o
+nível segue LIMITES_NIVEL (src/utils/pontos.py), então o resultado é o mesmo
+do caminho ORM. Os agregados repetem à mão as regras de src/utils/agregados.py:
+`python3 bench_visitas.py --conferir` registra as mesmas visitas pelos dois
+caminhos e compara o que ficou em cada tabela. Não comita: roda na transação
+da sessão.
+"""
+import re
+from datetime import datetime
+
+from sqlalchemy import Date, DateTime, bindparam, text
+
+from src.models.user import db, Ponto, Visita, NivelEnum
+from src.utils import pontuacao, ranking
+from src.utils.cache import marcar
+from src.utils.pontos import LIMITES_NIVEL, nivel_por_pontos
+from src.utils.sql import dialeto
+
+MOTIVO = "visita"
+
+_TIPO_LOJA = Visita.__table__.c.loja.type
+_TIPO_NIVEL = Ponto.__table__.c.nivel_atual.type
+_PARAMS = (
+    bindparam("loja", type_=_TIPO_LOJA),
+    bindparam("nivel", type_=_TIPO_NIVEL),
+    bindparam("agora", type_=DateTime()),
+    bindparam("dia", type_=Date()),
+)
+
+
+def _nivel_case(expr: str, tipo: str = "") -> str:
+    """CASE de LIMITES_NIVEL sobre `expr` (nomes do NivelEnum, com cast opcional)."""
+    ramos = " ".join(
+        f"WHEN {expr} >= {minimo} THEN CAST('{nivel.name}' AS {tipo or 'VARCHAR'})"
+        for minimo, nivel in LIMITES_NIVEL
+    )
+    return f"CASE {ramos} ELSE CAST('{NivelEnum.BRONZE.name}' AS {tipo or 'VARCHAR'}) END"
+
+
+def _filtro_cliente(por_cpf: bool) -> str:
+    return "cpf = :cpf" if por_cpf else "id = :cliente_id"
+
+
+# ------------------------------- Postgres -------------------------------
+
+def _sql_pg(por_cpf: bool) -> str:
+    loja_t, nivel_t = _TIPO_LOJA.name, _TIPO_NIVEL.name
+    return f"""
+WITH v AS (
+    INSERT INTO visitas (cliente_id, valor_compra, loja, data_visita)
+    SELECT id, :valor, CAST(:loja AS {loja_t}), :agora FROM clientes WHERE {_filtro_cliente(por_cpf)}
+    RETURNING id, cliente_id
+), m AS (
+    INSERT INTO pontos_movimentos (cliente_id, visita_id, pontos, motivo, fator, data)
+    SELECT cliente_id, id, :pontos, :motivo, :fator, :agora FROM v
+    RETURNING id
+), s AS (
+    INSERT INTO pontos (cliente_id, pontos_acumulados, nivel_atual, data_atualizacao)
+    SELECT cliente_id, :pontos, CAST(:nivel AS {nivel_t}), :agora FROM v
+    ON CONFLICT (cliente_id) DO UPDATE SET
+        pontos_acumulados = pontos.pontos_acumulados + EXCLUDED.pontos_acumulados,
+        nivel_atual = {_nivel_case("pontos.pontos_acumulados + EXCLUDED.pontos_acumulados", nivel_t)},
+        data_atualizacao = EXCLUDED.data_atualizacao
+    RETURNING pontos_acumulados, nivel_atual
+), c AS (
+    UPDATE clientes SET
+        total_visitas = clientes.total_visitas + 1,
+        valor_total_compras = clientes.valor_total_compras + :valor,
+        ultima_visita = GREATEST(clientes.ultima_visita, :agora),
+        pontos_totais = clientes.pontos_totais + :pontos
+    FROM v WHERE clientes.id = v.cliente_id
+    RETURNING clientes.pontos_totais, clientes.total_visitas, clientes.valor_total_compras
+), d AS (
+    INSERT INTO visitas_diarias (dia, loja, total_visitas, valor_total)
+    SELECT :dia, :loja_chave, 1, :valor FROM v
+    ON CONFLICT (dia, loja) DO UPDATE SET
+        total_visitas = visitas_diarias.total_visitas + EXCLUDED.total_visitas,
+        valor_total = visitas_diarias.valor_total + EXCLUDED.valor_total
+    RETURNING dia
+), l AS (
+    INSERT INTO clientes_lojas (cliente_id, loja, total_visitas, valor_total)
+    SELECT cliente_id, :loja_chave, 1, :valor FROM v
+    ON CONFLICT (cliente_id, loja) DO UPDATE SET
+        total_visitas = clientes_lojas.total_visitas + EXCLUDED.total_visitas,
+        valor_total = clientes_lojas.valor_total + EXCLUDED.valor_total
+    RETURNING total_visitas, valor_total
+)
+SELECT v.id AS visita_id, v.cliente_id, s.pontos_acumulados AS saldo, s.nivel_atual AS nivel,
+       c.pontos_totais, c.total_visitas, c.valor_total_compras,
+       l.total_visitas AS loja_visitas, l.valor_total AS loja_valor
+FROM v, m, s, c, d, l
+"""
+
+
+# -------------------------------- SQLite --------------------------------
+
+_SQLITE_VISITA = """
+INSERT INTO visitas (cliente_id, valor_compra, loja, data_visita)
+SELECT id, :valor, :loja, :agora FROM clientes WHERE {filtro}
+RETURNING id, cliente_id
+"""
+_SQLITE = (
+    """
+INSERT INTO pontos_movimentos (cliente_id, visita_id, pontos, motivo, fator, data)
+VALUES (:cliente_id, :visita_id, :pontos, :motivo, :fator, :agora)
+""",
+    f"""
+INSERT INTO pontos (cliente_id, pontos_acumulados, nivel_atual, data_atualizacao)
+VALUES (:cliente_id, :pontos, :nivel, :agora)
+ON CONFLICT (cliente_id) DO UPDATE SET
+    pontos_acumulados = pontos.pontos_acumulados + excluded.pontos_acumulados,
+    nivel_atual = {_nivel_case("pontos.pontos_acumulados + excluded.pontos_acumulados")},
+    data_atualizacao = excluded.data_atualizacao
+RETURNING pontos_acumulados AS saldo, nivel_atual AS nivel
+""",
+    """
+UPDATE clientes SET
+    total_visitas = total_visitas + 1,
+    valor_total_compras = valor_total_compras + :valor,
+    ultima_visita = CASE WHEN ultima_visita IS NULL OR ultima_visita < :agora
+                         THEN :agora ELSE ultima_visita END,
+    pontos_totais = pontos_totais + :pontos
+WHERE id = :cliente_id
+RETURNING pontos_totais, total_visitas, valor_total_compras
+""",
+    """
+INSERT INTO visitas_diarias (dia, loja, total_visitas, valor_total)
+VALUES (:dia, :loja_chave, 1, :valor)
+ON CONFLICT (dia, loja) DO UPDATE SET
+    total_visitas = visitas_diarias.total_visitas + excluded.total_visitas,
+    valor_total = visitas_diarias.valor_total + excluded.valor_total
+""",
+    """
+INSERT INTO clientes_lojas (cliente_id, loja, total_visitas, valor_total)
+VALUES (:cliente_id, :loja_chave, 1, :valor)
+ON CONFLICT (cliente_id, loja) DO UPDATE SET
+    total_visitas = clientes_lojas.total_visitas + excluded.total_visitas,
+    valor_total = clientes_lojas.valor_total + excluded.valor_total
+RETURNING total_visitas AS loja_visitas, valor_total AS loja_valor
+""",
+)
+
+
+def _texto(sql: str):
+    usados = set(re.findall(r":(\w+)", sql))
+    return text(sql).bindparams(*[p for p in _PARAMS if p.key in usados])
+
+
+# (dialeto, por_cpf) -> statement(s) prontos; text() entra no cache de compilação
+_statements: dict = {}
+
+
+def _preparados(nome: str, por_cpf: bool):
+    chave = (nome, por_cpf)
+    if chave not in _statements:
+        if nome == "postgresql":
+            _statements[chave] = _texto(_sql_pg(por_cpf)).columns(nivel=_TIPO_NIVEL)
+        else:
+            visita = _texto(_SQLITE_VISITA.format(filtro=_filtro_cliente(por_cpf)))
+            resto = [_texto(sql) for sql in _SQLITE]
+            resto[1] = resto[1].columns(nivel=_TIPO_NIVEL)
+            _statements[chave] = (visita, resto)
+    return _statements[chave]
+
+
+def disponivel() -> bool:
+    return dialeto() in ("postgresql", "sqlite")
+
+
+def _registrar_sequencial(stmts, params):
+    visita, (movimento, saldo, cliente, diario, cliente_loja) = stmts
+    row = db.session.execute(visita, params).first()
+    if row is None:
+        return None
+    params = dict(params, visita_id=row[0], cliente_id=row[1])
+    out = {"visita_id": row[0], "cliente_id": row[1]}
+
+    db.session.execute(movimento, params)
+    out.update(db.session.execute(saldo, params).one()._mapping)
+    out.update(db.session.execute(cliente, params).one()._mapping)
+    db.session.execute(diario, params)
+    out.update(db.session.execute(cliente_loja, params).one()._mapping)
+    return out
+
+
+def registrar(cliente_id: int | None, cpf: str | None, valor_compra: float, loja=None):
+    """
+    Registra a visita do cliente (`cliente_id`, ou `cpf` se não houver id) na
+    `loja` (LojaEnum ou None). Devolve None se o cliente não existe, senão
+    {'visita': {...}, 'pontos_ganhos', 'pontos_totais', 'nivel_atual'} (nível como NivelEnum).
+    """
+    agora = datetime.utcnow()
+    fator = pontuacao.fator_pontuacao(loja, agora)
+    pontos = pontuacao.pontos_da_compra(valor_compra, fator)
+    valor = float(valor_compra)
+    params = {
+        "cliente_id": cliente_id, "cpf": cpf, "valor": valor, "loja": loja,
+        "loja_chave": loja.name if loja else "", "agora": agora, "dia": agora.date(),
+        "pontos": pontos, "fator": fator, "motivo": MOTIVO, "nivel": nivel_por_pontos(pontos),
+    }
+
+    nome = dialeto()
+    stmts = _preparados(nome, not cliente_id)
+    if nome == "postgresql":
+        row = db.session.execute(stmts, params).first()
+        row = dict(row._mapping) if row is not None else None
+    else:
+        row = _registrar_sequencial(stmts, params)
+    if row is None:
+        return None
+
+    marcar("visitas")
+    if pontos:
+        marcar("pontos")
+    ranking.agendar(None, row["cliente_id"], pontos=row["pontos_totais"],
+                    visitas=row["total_visitas"], valor=row["valor_total_compras"])
+    if loja is not None:
+        ranking.agendar(loja.name, row["cliente_id"],
+                        visitas=row["loja_visitas"], valor=row["loja_valor"])
+
+    return {
+        "visita": {
+            "id": row["visita_id"],
+            "cliente_id": row["cliente_id"],
+            "data_visita": agora.isoformat(),
+            "valor_compra": valor,
+            "loja": loja.value if loja else None,
+        },
+        "pontos_ganhos": pontos,
+        "pontos_totais": row["saldo"],
+        "nivel_atual": row["nivel"],
+    }
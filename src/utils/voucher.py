@@ -0,0 +1,81 @@
+# src/utils/voucher.py
+"""
+Códigos de voucher assinados (HMAC), validados sem consultar o banco.
+
+Formato: `VC2-<id do resgate>-<id do brinde>-<assinatura>`, ids em base 36
+e assinatura = 10 caracteres base32 do HMAC-SHA256 de "resgate.brinde"
+(50 bits). Exemplo: `VC2-2S-1-K7QF3MZP2A`.
+
+Conferir o balcão vira: formato + HMAC em memória (microssegundos); código
+malformado ou forjado é recusado sem query; código válido vai direto por PK
+no resgate. Os códigos antigos (`VCH-XXXXXXXX-AAAAMMDD`, aleatórios) não
+carregam o id e continuam sendo buscados por `voucher_codigo`.
+
+A chave vem de VOUCHER_SECRET (ou, sem ela, da SECRET_KEY da app). Trocar a
+chave invalida os vouchers assinados já emitidos.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+
+from flask import current_app
+
+PREFIXO = "VC2"
+TAMANHO_ASSINATURA = 10
+
+_ASSINADO = re.compile(r"^VC2-([0-9A-Z]{1,13})-([0-9A-Z]{1,13})-([A-Z2-7]{10})$")
+_LEGADO = re.compile(r"^VCH-[0-9A-F]{8}-\d{8}$")
+
+_chaves: dict = {}
+
+
+def _chave() -> bytes:
+    segredo = os.getenv("VOUCHER_SECRET") or current_app.config.get("SECRET_KEY")
+    if not segredo:
+        raise RuntimeError("Defina VOUCHER_SECRET ou SECRET_KEY para assinar vouchers")
+    if segredo not in _chaves:
+        _chaves[segredo] = hashlib.sha256(b"voucher:" + segredo.encode()).digest()
+    return _chaves[segredo]
+
+
+def _base36(n: int) -> str:
+    digitos = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digitos[r] + out
+        if not n:
+            return out
+
+
+def _assinatura(resgate_id: int, brinde_id: int) -> str:
+    mac = hmac.new(_chave(), f"{resgate_id}.{brinde_id}".encode(), hashlib.sha256).digest()
+    return base64.b32encode(mac).decode()[:TAMANHO_ASSINATURA]
+
+
+def gerar(resgate_id: int, brinde_id: int) -> str:
+    return f"{PREFIXO}-{_base36(resgate_id)}-{_base36(brinde_id)}-{_assinatura(resgate_id, brinde_id)}"
+
+
+def normalizar(codigo: str) -> str:
+    return (codigo or "").strip().upper()
+
+
+def decodificar(codigo: str):
+    """
+    ('assinado', resgate_id, brinde_id) para um código assinado válido,
+    ('legado', None, None) para o formato antigo (só o banco sabe se existe),
+    None para malformado ou assinatura errada. Não consulta o banco.
+    """
+    codigo = normalizar(codigo)
+    m = _ASSINADO.match(codigo)
+    if m:
+        resgate_id, brinde_id = int(m.group(1), 36), int(m.group(2), 36)
+        if hmac.compare_digest(m.group(3), _assinatura(resgate_id, brinde_id)):
+            return "assinado", resgate_id, brinde_id
+        return None
+    if _LEGADO.match(codigo):
+        return "legado", None, None
+    return None
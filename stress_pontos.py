@@ -0,0 +1,138 @@
+# stress_pontos.py
+# Teste de concorrência do saldo de pontos: várias threads lançam pontos para os
+# mesmos clientes ao mesmo tempo e, no fim, confere que
+#   - cada cliente tem exatamente uma linha em `pontos`;
+#   - o saldo é igual à soma do extrato (`pontos_movimentos`) e ao esperado;
+#   - o nível bate com a regra de `nivel_por_pontos`.
+#
+# Uso:
+#   python3 stress_pontos.py                         # SQLite temporário
+#   python3 stress_pontos.py postgresql://u:s@localhost/fidelidade_teste
+#   python3 stress_pontos.py --threads 16 --lancamentos 200 --clientes 3
+#
+# Roda numa app mínima (só as tabelas de clientes/pontos), então pode apontar
+# para um banco de teste vazio. NÃO use o banco de produção.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.models.user import db, Cliente, Ponto, MovimentoPonto  # noqa: E402
+from src.utils import pontos as pontos_saldo  # noqa: E402
+
+
+def criar_app(url):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if url.startswith("sqlite"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"connect_args": {"timeout": 30}}
+    db.init_app(app)
+    return app
+
+
+def preparar(app, n_clientes):
+    with app.app_context():
+        tabelas = [Cliente.__table__, Ponto.__table__, MovimentoPonto.__table__]
+        db.metadata.create_all(db.engine, tables=tabelas)
+        ids = []
+        for i in range(n_clientes):
+            c = Cliente(cpf=f"9{time.time_ns() % 10**6:06d}{i:04d}", nome=f"Stress {i}",
+                        telefone="11900000000")
+            db.session.add(c)
+            db.session.flush()
+            ids.append(c.id)
+        db.session.commit()
+        return ids
+
+
+def trabalhador(app, clientes, n, esperado, lock, erros):
+    rnd = random.Random()
+    with app.app_context():
+        for _ in range(n):
+            cid = rnd.choice(clientes)
+            valor = rnd.randint(1, 50)
+            for tentativa in range(20):
+                try:
+                    pontos_saldo.lancar(cid, valor, "stress")
+                    db.session.commit()
+                    break
+                except OperationalError:
+                    # SQLite: "database is locked" com muitos escritores
+                    db.session.rollback()
+                    time.sleep(0.01 * (tentativa + 1))
+            else:
+                erros.append(cid)
+                continue
+            with lock:
+                esperado[cid] = esperado.get(cid, 0) + valor
+        db.session.remove()
+
+
+def conferir(app, clientes, esperado):
+    ok = True
+    with app.app_context():
+        for cid in clientes:
+            linhas = db.session.execute(
+                select(Ponto.pontos_acumulados, Ponto.nivel_atual).where(Ponto.cliente_id == cid)
+            ).all()
+            extrato = db.session.execute(
+                select(func.coalesce(func.sum(MovimentoPonto.pontos), 0))
+                .where(MovimentoPonto.cliente_id == cid)
+            ).scalar()
+            saldo, nivel = linhas[0] if linhas else (0, None)
+            certo = (
+                len(linhas) == 1
+                and saldo == extrato == esperado.get(cid, 0)
+                and nivel == pontos_saldo.nivel_por_pontos(saldo)
+            )
+            ok &= certo
+            print(f"  cliente {cid}: linhas={len(linhas)} saldo={saldo} extrato={extrato} "
+                  f"esperado={esperado.get(cid, 0)} nivel={getattr(nivel, 'value', nivel)} "
+                  f"{'OK' if certo else 'DIVERGENTE'}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Concorrência do saldo de pontos")
+    ap.add_argument("url", nargs="?", help="URL do banco (padrão: SQLite temporário)")
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--lancamentos", type=int, default=100, help="por thread")
+    ap.add_argument("--clientes", type=int, default=2)
+    args = ap.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "stress_pontos.db")
+    app = criar_app(url)
+    clientes = preparar(app, args.clientes)
+
+    esperado, lock, erros = {}, threading.Lock(), []
+    threads = [
+        threading.Thread(target=trabalhador, args=(app, clientes, args.lancamentos, esperado, lock, erros))
+        for _ in range(args.threads)
+    ]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dur = time.perf_counter() - inicio
+
+    total = args.threads * args.lancamentos - len(erros)
+    print(f"{url.split('://')[0]}: {total} lançamentos em {dur:.2f}s "
+          f"({total / dur:.0f}/s), {len(erros)} desistências")
+    ok = conferir(app, clientes, esperado)
+    print("✅ saldos consistentes" if ok else "❌ saldos divergentes")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# verificar_rfm.py
+# Conferência da pontuação RFM (src/utils/analytics.py) com empates: monta uma
+# base sintética em que a maioria dos clientes tem 1 visita (como na operação
+# real) e confere que
+#   - valores iguais recebem o mesmo score em R, F e M;
+#   - os clientes de 1 visita ficam com F=1;
+#   - os de 1 visita recentes caem em "Novos" e os antigos em "Hibernando";
+#   - com todos os valores iguais, todos ficam no score 1.
+#
+# Uso:
+#   python3 verificar_rfm.py
+#   python3 verificar_rfm.py --clientes 20000 --uma-visita 0.7
+#
+# Não usa banco: chama calcular_rfm direto com arrays.
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.analytics import SEGMENTOS, SEGUNDOS_DIA, calcular_rfm  # noqa: E402
+
+
+def base_sintetica(clientes: int, uma_visita: float, seed: int = 7):
+    """Arrays (cliente_id, epoch, valor) ordenados por cliente, como carregar_visitas."""
+    rng = np.random.default_rng(seed)
+    referencia = 400.0 * SEGUNDOS_DIA
+    n_visitas = np.where(rng.random(clientes) < uma_visita, 1, rng.integers(2, 12, clientes))
+    cliente_id = np.repeat(np.arange(1, clientes + 1), n_visitas)
+    epoch = referencia - rng.integers(0, 365, cliente_id.size) * SEGUNDOS_DIA
+    epoch.sort()  # dentro de cada cliente a ordem não importa; só a última visita
+    ordem = np.argsort(cliente_id, kind="stable")
+    valor = rng.choice([20.0, 35.0, 50.0], cliente_id.size)  # poucos valores: muitos empates
+    return cliente_id[ordem], epoch[ordem], valor[ordem], referencia
+
+
+def conferir_empates(nome, valores, score, erros):
+    for v in np.unique(valores):
+        scores = np.unique(score[valores == v])
+        if scores.size != 1:
+            erros.append(f"{nome}: valor {v} com scores {scores.tolist()}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Confere a pontuação RFM com empates")
+    ap.add_argument("--clientes", type=int, default=5000)
+    ap.add_argument("--uma-visita", type=float, default=0.6, help="fração de clientes com 1 visita")
+    args = ap.parse_args()
+
+    cliente_id, epoch, valor, referencia = base_sintetica(args.clientes, args.uma_visita)
+    res = calcular_rfm(cliente_id, epoch, valor, referencia)
+    erros = []
+
+    conferir_empates("R", res["recencia"], res["r"], erros)
+    conferir_empates("F", res["frequencia"], res["f"], erros)
+    conferir_empates("M", res["monetario"], res["m"], erros)
+
+    uma = res["frequencia"] == 1
+    if not (res["f"][uma] == 1).all():
+        erros.append(f"F dos clientes de 1 visita: {np.unique(res['f'][uma]).tolist()} (esperado [1])")
+
+    seg = res["segmento"]
+    novos, hibernando = SEGMENTOS.index("Novos"), SEGMENTOS.index("Hibernando")
+    if not (uma & (res["r"] >= 4) & (seg == novos)).any():
+        erros.append("nenhum cliente de 1 visita recente em 'Novos'")
+    if not (uma & (res["r"] <= 2) & (seg == hibernando)).any():
+        erros.append("nenhum cliente de 1 visita antigo em 'Hibernando'")
+
+    iguais = calcular_rfm(np.arange(1, 11), np.full(10, referencia), np.full(10, 30.0), referencia)
+    for eixo in ("r", "f", "m"):
+        if not (iguais[eixo] == 1).all():
+            erros.append(f"todos iguais: {eixo.upper()} = {np.unique(iguais[eixo]).tolist()} (esperado [1])")
+
+    contagem = np.bincount(seg, minlength=len(SEGMENTOS))
+    for nome, c in zip(SEGMENTOS, contagem):
+        print(f"  {nome:<22} {int(c):>6}")
+    print(f"  limites de frequência: {res['limites']['frequencia']}")
+
+    if erros:
+        for e in erros:
+            print("❌", e)
+        sys.exit(1)
+    print(f"✅ {args.clientes} clientes ({args.uma_visita:.0%} com 1 visita): empates com o mesmo score, F=1 nos de 1 visita")
+
+
+if __name__ == "__main__":
+    main()